@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.core.cache import caches
+from django.utils.autoreload import file_changed
+
+
+def _clear_template_fragments(sender, file_path, **kwargs):
+    # Under runserver, so an edited layout isn't served from the fragment cache
+    if file_path.suffix == '.html':
+        caches['fragments'].clear()
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core import checks  # noqa: F401  registers the system checks
+        file_changed.connect(_clear_template_fragments, dispatch_uid='core.clear_template_fragments')
@@ -0,0 +1,58 @@
+"""
+Third-party front-end assets, vendored under static/vendor/.
+
+Each asset is pinned to one version. ``manage.py vendor_static`` downloads
+them into the first STATICFILES_DIRS entry so they are committed with the
+code and served from STATIC_ROOT like any other static file: fingerprinted,
+precompressed and cached for a year, with no request to a third-party host.
+The CDN URLs are only where ``vendor_static`` fetches from; pages never
+load them. A missing file is a ``manage.py check`` error (core.E001).
+
+Tailwind is not downloaded: ``manage.py build_tailwind`` compiles just the
+utilities the templates use into TAILWIND_CSS, which is committed too
+(core.E002 while it is missing).
+"""
+from functools import lru_cache
+
+from django.contrib.staticfiles import finders
+
+# Built by manage.py build_tailwind from tailwind.config.js
+TAILWIND_CSS = 'css/tailwind.css'
+
+VENDOR_ASSETS = {
+    'daisyui': {
+        'path': 'vendor/daisyui-4.12.13.min.css',
+        'url': 'https://cdn.jsdelivr.net/npm/daisyui@4.12.13/dist/full.min.css',
+    },
+    'chartjs': {
+        'path': 'vendor/chart-4.4.0.umd.min.js',
+        'url': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js',
+    },
+    'brand-logo': {
+        'path': 'vendor/icons8-commercial-development-management-100.png',
+        'url': 'https://img.icons8.com/F8F8F8/ios-filled/100/commercial-development-management.png',
+    },
+}
+
+# Poppins in the weights the templates use (normal, font-medium, font-semibold, font-bold)
+POPPINS_WEIGHTS = (400, 500, 600, 700)
+
+for _weight in POPPINS_WEIGHTS:
+    VENDOR_ASSETS[f'poppins-{_weight}'] = {
+        'path': f'vendor/poppins-latin-{_weight}-normal.woff2',
+        'url': f'https://cdn.jsdelivr.net/npm/@fontsource/poppins@5.0.14/files/poppins-latin-{_weight}-normal.woff2',
+    }
+
+
+@lru_cache(maxsize=None)
+def is_vendored(name):
+    """True once the asset's file is found by the staticfiles finders"""
+    return finders.find(VENDOR_ASSETS[name]['path']) is not None
+
+
+def missing_assets():
+    return [name for name in VENDOR_ASSETS if not is_vendored(name)]
+
+
+def tailwind_built():
+    return finders.find(TAILWIND_CSS) is not None
@@ -0,0 +1,60 @@
+"""
+Async dashboard, routed instead of core.views.dashboard when
+SELF_SERVICE_ASYNC_VIEWS is on (see employees.async_views).
+"""
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from core.shortcuts import arender
+from employees.models import Employee, JobRole
+from payroll.models import Payslip
+from users.models import CustomUser, Role
+
+
+@login_required
+async def dashboard(request):
+    user = await request.auser()
+    context = {
+        'active_nav': 'dashboard',
+    }
+
+    # Role-based data
+    if user.is_hr() or user.is_admin():
+        # HR/Admin Dashboard Stats
+        context.update({
+            'total_employees': await Employee.objects.acount(),
+            'total_users': await CustomUser.objects.filter(role=Role.EMPLOYEE).acount(),
+            'total_job_roles': await JobRole.objects.acount(),
+            'recent_employees': [
+                employee async for employee in
+                Employee.objects.with_current_salary().select_related('user', 'job_role').order_by('-date_of_joining')[:5]
+            ],
+        })
+    else:
+        # Employee Dashboard
+        try:
+            employee = await Employee.objects.with_current_salary().select_related(
+                'job_role__department', 'bank_details'
+            ).aget(user=user)
+        except Employee.DoesNotExist:
+            employee = None
+
+        stats = {'this_month': 0, 'total_earnings': 0, 'total_payslips': 0}
+        if employee is not None:
+            # Payslip statistics in one query
+            today = timezone.localdate()
+            stats = await Payslip.objects.filter(employee=employee).aaggregate(
+                this_month=Count('id', filter=Q(payroll__month=today.month, payroll__year=today.year)),
+                total_earnings=Sum('net_salary'),
+                total_payslips=Count('id'),
+            )
+
+        context.update({
+            'employee': employee,
+            'payslips_count': stats['this_month'],
+            'total_earnings': stats['total_earnings'] or 0,
+            'total_payslips': stats['total_payslips'],
+        })
+
+    return await arender(request, 'dashboard.html', context)
@@ -0,0 +1,22 @@
+from django.core.checks import Error, Tags, register
+
+from core.assets import missing_assets, tailwind_built
+
+
+@register(Tags.staticfiles)
+def check_vendored_assets(app_configs, **kwargs):
+    errors = []
+    missing = missing_assets()
+    if missing:
+        errors.append(Error(
+            f"Front-end assets not vendored, so pages cannot load them: {', '.join(missing)}.",
+            hint="Run `manage.py vendor_static` and commit static/vendor/.",
+            id='core.E001',
+        ))
+    if not tailwind_built():
+        errors.append(Error(
+            "The Tailwind stylesheet has not been built.",
+            hint="Run `manage.py build_tailwind` and commit static/css/tailwind.css.",
+            id='core.E002',
+        ))
+    return errors
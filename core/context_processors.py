@@ -0,0 +1,12 @@
+def current_user(request):
+    """
+    'name' and 'is_hr_or_admin' for the shared layout, so views only pass
+    their own data. 'user' itself comes from the auth context processor.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {
+        'name': user.first_name or user.username,
+        'is_hr_or_admin': user.is_hr() or user.is_admin(),
+    }
@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from users.models import CustomUser, Role
+
+# Per-request setup before this change: sessions and the user both read from the database
+UNCACHED = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+}
+
+
+def _benchmark_caches():
+    """The configured caches with a private default, so clearing it leaves live sessions and users alone"""
+    return {
+        **settings.CACHES,
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark_request_overhead',
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure queries and time per authenticated request with database sessions and "
+        "user lookups versus the configured cached ones. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per page and configuration")
+        parser.add_argument(
+            '--url', action='append', dest='urls',
+            help="URL name to request (repeatable; default: index and dashboard)"
+        )
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or ['index', 'dashboard']
+        configurations = [('uncached', UNCACHED), ('cached', {})]
+
+        self.stdout.write(f"{'configuration':<14}{'page':<14}{'queries/req':>12}{'ms/req':>10}")
+        with transaction.atomic(), override_settings(CACHES=_benchmark_caches()):
+            user = CustomUser.objects.create_user('bench_tmp', 'bench_tmp@example.invalid', role=Role.HR)
+            for label, overrides in configurations:
+                with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS], **overrides):
+                    for name in urls:
+                        queries, seconds = self._measure(user, reverse(name), options['requests'])
+                        self.stdout.write(f"{label:<14}{name:<14}{queries:>12.1f}{seconds * 1000:>10.2f}")
+            transaction.set_rollback(True)
+            cache.clear()
+
+    def _measure(self, user, url, requests):
+        # Start each page cold; only the benchmark's own cache is cleared
+        cache.clear()
+        client = Client()
+        client.force_login(user)
+        # Warm the session and user caches, as any request after login would
+        client.get(url)
+
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(requests):
+                client.get(url)
+        elapsed = time.perf_counter() - started
+        return len(captured) / requests, elapsed / requests
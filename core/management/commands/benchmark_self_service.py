@@ -0,0 +1,137 @@
+import http.client
+import statistics
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from payroll.models import Payslip
+
+PAGES = ('dashboard', 'view_my_payslips', 'view_payslip_detail', 'generate_payslip')
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the self-service pages of a running server as one employee and report "
+        "sustained requests per second. Start the server with a fixed worker count first, e.g. "
+        "`PAYROLL_ASYNC_VIEWS=1 uvicorn payroll_manager.asgi:application --workers 4` for the async "
+        "views, and again without PAYROLL_ASYNC_VIEWS for the sync ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--username', required=True, help="Employee to log in as")
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--concurrency', type=int, default=50, help="Simultaneous client connections")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to keep the load up")
+        parser.add_argument(
+            '--page', action='append', dest='pages', choices=PAGES,
+            help="URL name to request (repeatable; default: all self-service pages)"
+        )
+
+    def handle(self, *args, **options):
+        target = urlsplit(options['base_url'])
+        self.host, self.port = target.hostname, target.port or 80
+        cookie = self._login(options['username'], options['password'])
+        paths = self._paths(options['pages'] or PAGES, options['username'])
+
+        results = {name: [] for name in paths}
+        errors = {name: 0 for name in paths}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def worker(offset):
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            names = list(paths)
+            i = offset
+            while time.perf_counter() < deadline:
+                name = names[i % len(names)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', paths[name], headers={'Cookie': cookie})
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                    ok = False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        results[name].append(elapsed)
+                    else:
+                        errors[name] += 1
+            connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        self.stdout.write(f"{'page':<22}{'ok':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, latencies in results.items():
+            p50 = statistics.median(latencies) * 1000 if latencies else 0
+            p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else p50
+            self.stdout.write(
+                f"{name:<22}{len(latencies):>8}{errors[name]:>8}{len(latencies) / wall:>10.1f}{p50:>10.1f}{p95:>10.1f}"
+            )
+        total = sum(len(latencies) for latencies in results.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{total / wall:.1f} req/s sustained over {wall:.1f}s with {options['concurrency']} connections"
+        ))
+
+    def _login(self, username, password):
+        """Logs in through the login form; returns the Cookie header for later requests"""
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        login_path = reverse('login')
+        connection.request('GET', login_path)
+        response = connection.getresponse()
+        response.read()
+        cookies = SimpleCookie()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            cookies.load(header)
+        if 'csrftoken' not in cookies:
+            raise CommandError(f"No CSRF cookie from {login_path}; is the server running?")
+
+        body = urlencode({
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': cookies['csrftoken'].value,
+        })
+        connection.request('POST', login_path, body=body, headers={
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Cookie': f"csrftoken={cookies['csrftoken'].value}",
+        })
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            cookies.load(header)
+        if 'sessionid' not in cookies:
+            raise CommandError(f"Could not log in as {username}.")
+        return '; '.join(f"{key}={morsel.value}" for key, morsel in cookies.items())
+
+    def _paths(self, pages, username):
+        payslip_id = Payslip.objects.filter(employee__user__username=username).order_by(
+            '-payroll__year', '-payroll__month'
+        ).values_list('id', flat=True).first()
+        paths = {}
+        for name in pages:
+            if name in ('view_payslip_detail', 'generate_payslip'):
+                if payslip_id is None:
+                    self.stderr.write(f"{username} has no payslips; skipping {name}")
+                    continue
+                paths[name] = reverse(name, args=[payslip_id])
+            else:
+                paths[name] = reverse(name)
+        if not paths:
+            raise CommandError("Nothing to request.")
+        return paths
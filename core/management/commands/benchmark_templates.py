@@ -0,0 +1,98 @@
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.backends.django import Template
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from employees.models import Employee
+from users.models import CustomUser, Role
+
+HR_PAGES = ('index', 'dashboard', 'list_employees', 'list_payrolls', 'reports_dashboard')
+EMPLOYEE_PAGES = ('dashboard', 'view_my_payslips', 'update_profile')
+
+
+def _uncached():
+    """Template settings before this change: templates parsed and the nav rendered on every request"""
+    templates = [dict(engine, OPTIONS=dict(engine['OPTIONS'])) for engine in settings.TEMPLATES]
+    templates[0]['OPTIONS']['loaders'] = [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]
+    cache_settings = dict(settings.CACHES, fragments={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+    return {'TEMPLATES': templates, 'CACHES': cache_settings}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure time per request and time spent rendering templates for the main pages, "
+        "with the uncached template loader and no fragment cache versus the configured "
+        "cached ones. HR pages use a temporary HR user; employee pages the first employee "
+        "(or --employee). Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Requests per page and configuration")
+        parser.add_argument('--employee', help="Username of the employee for the self-service pages")
+
+    def handle(self, *args, **options):
+        employees = Employee.objects.select_related('user')
+        if options['employee']:
+            employees = employees.filter(user__username=options['employee'])
+        employee = employees.order_by('id').first()
+        if employee is None:
+            self.stderr.write("No employee found; measuring HR pages only.")
+
+        self.stdout.write(f"{'configuration':<14}{'role':<10}{'page':<20}{'ms/req':>10}{'render ms':>11}")
+        with transaction.atomic():
+            hr = CustomUser.objects.create_user('bench_tmp', 'bench_tmp@example.invalid', role=Role.HR)
+            runs = [('hr', hr, HR_PAGES)]
+            if employee is not None:
+                runs.append(('employee', employee.user, EMPLOYEE_PAGES))
+            for label, overrides in (('uncached', _uncached()), ('cached', {})):
+                with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS], **overrides):
+                    for role, user, pages in runs:
+                        for name in pages:
+                            total, rendering = self._measure(user, reverse(name), options['requests'])
+                            self.stdout.write(
+                                f"{label:<14}{role:<10}{name:<20}{total * 1000:>10.2f}{rendering * 1000:>11.2f}"
+                            )
+            transaction.set_rollback(True)
+        caches['fragments'].clear()
+
+    def _measure(self, user, url, requests):
+        client = Client()
+        client.force_login(user)
+        # Warm the session, user and (when configured) template caches
+        client.get(url)
+
+        with self._render_timer() as rendering:
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get(url)
+            elapsed = time.perf_counter() - started
+        return elapsed / requests, rendering[0] / requests
+
+    @contextmanager
+    def _render_timer(self):
+        """Accumulates time spent in top-level template renders (includes count towards their parent)"""
+        spent = [0.0]
+        original = Template.render
+
+        def timed(template, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(template, *args, **kwargs)
+            finally:
+                spent[0] += time.perf_counter() - started
+
+        Template.render = timed
+        try:
+            yield spent
+        finally:
+            Template.render = original
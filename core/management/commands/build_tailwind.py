@@ -0,0 +1,42 @@
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.assets import TAILWIND_CSS
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the Tailwind utilities the templates use into static/css/tailwind.css with "
+        "the Tailwind CSS standalone CLI. Commit the output whenever templates change classes."
+    )
+    # This command fixes core.E002, so that error mustn't stop it
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cli', default=getattr(settings, 'TAILWIND_CLI', 'tailwindcss'),
+            help="Tailwind CSS executable (default: TAILWIND_CLI, or tailwindcss on PATH)"
+        )
+
+    def handle(self, *args, **options):
+        if not settings.STATICFILES_DIRS:
+            raise CommandError("STATICFILES_DIRS is empty; nowhere to write the stylesheet to.")
+        base_dir = Path(settings.BASE_DIR)
+        target = Path(settings.STATICFILES_DIRS[0]) / TAILWIND_CSS
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            subprocess.run(
+                [options['cli'], '--config', 'tailwind.config.js', '--output', str(target), '--minify'],
+                cwd=base_dir, check=True, capture_output=True, text=True,
+            )
+        except FileNotFoundError:
+            raise CommandError(
+                f"Tailwind CSS CLI {options['cli']!r} not found; install the standalone executable "
+                "and pass --cli or set TAILWIND_CLI."
+            )
+        except subprocess.CalledProcessError as exc:
+            raise CommandError(f"Tailwind CSS build failed:\n{exc.stderr}")
+        self.stdout.write(self.style.SUCCESS(f"{target.stat().st_size:,} bytes -> {target}"))
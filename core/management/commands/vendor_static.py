@@ -0,0 +1,39 @@
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.assets import VENDOR_ASSETS
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the pinned third-party front-end assets into static/vendor/ so they are "
+        "served from this deployment. Commit the files; collectstatic fingerprints and "
+        "precompresses them."
+    )
+    # This command fixes core.E001, so that error mustn't stop it
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Download again even if the file exists")
+
+    def handle(self, *args, **options):
+        if not settings.STATICFILES_DIRS:
+            raise CommandError("STATICFILES_DIRS is empty; nowhere to vendor assets to.")
+        root = Path(settings.STATICFILES_DIRS[0])
+
+        for name, asset in VENDOR_ASSETS.items():
+            target = root / asset['path']
+            if target.exists() and not options['force']:
+                self.stdout.write(f"{name}: {target} already present")
+                continue
+            try:
+                with urllib.request.urlopen(asset['url'], timeout=60) as response:
+                    content = response.read()
+            except OSError as exc:
+                raise CommandError(f"Could not download {name} from {asset['url']}: {exc}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+            self.stdout.write(self.style.SUCCESS(f"{name}: {len(content):,} bytes -> {target}"))
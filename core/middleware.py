@@ -0,0 +1,63 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from core.routers import get_replica_alias, pinned_to_primary
+
+PRIMARY_PIN_SESSION_KEY = '_primary_pin_until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class PrimaryPinningMiddleware:
+    """
+    Keeps a user on the primary database for a short window after a write.
+
+    Must come after SessionMiddleware. Does nothing when no replica is configured.
+    Runs natively under ASGI too, so async views aren't pushed back onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if get_replica_alias() is None or not hasattr(request, 'session'):
+            return self.get_response(request)
+
+        pin_until = request.session.get(PRIMARY_PIN_SESSION_KEY, 0)
+        if time.time() < pin_until:
+            with pinned_to_primary():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            request.session[PRIMARY_PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+        return response
+
+    async def __acall__(self, request):
+        if get_replica_alias() is None or not hasattr(request, 'session'):
+            return await self.get_response(request)
+
+        pin_until = await request.session.aget(PRIMARY_PIN_SESSION_KEY, 0)
+        if time.time() < pin_until:
+            with pinned_to_primary():
+                response = await self.get_response(request)
+        else:
+            response = await self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            await request.session.aset(
+                PRIMARY_PIN_SESSION_KEY, time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            )
+
+        return response
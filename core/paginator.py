@@ -0,0 +1,33 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over very large tables.
+
+    An unfiltered changelist on PostgreSQL takes its count from the planner's
+    row estimate (pg_class.reltuples) instead of a COUNT(*) over the whole
+    table. Filtered or searched lists, small tables and other backends keep the
+    exact count.
+    """
+    # Below this many estimated rows an exact count is cheap enough
+    ESTIMATE_THRESHOLD = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where and not query.combinator:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                        [queryset.model._meta.db_table]
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] >= self.ESTIMATE_THRESHOLD:
+                    return row[0]
+        return super().count
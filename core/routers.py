@@ -0,0 +1,94 @@
+"""
+Database routing for the optional read replica.
+
+Read-only views opt in with ``@use_replica`` (or the ``replica_reads()``
+context manager). Everything else, and every write, goes to the primary.
+After a write the user's session is pinned to the primary for
+``REPLICA_PIN_SECONDS`` so they always read back what they just saved.
+When no replica is configured every query simply stays on ``default``.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+PRIMARY_DATABASE_ALIAS = 'default'
+
+# Apps that must always be read from the primary (sessions are read before
+# the pin is known, so a lagging replica could log the user out).
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+_pinned_to_primary = contextvars.ContextVar('pinned_to_primary', default=False)
+
+
+def get_replica_alias():
+    """Returns the configured replica alias, or None if there is no replica"""
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', None)
+    if alias and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+@contextmanager
+def replica_reads():
+    """Send reads inside this block to the replica (if one is configured)"""
+    token = _replica_reads.set(True)
+    # Snapshot the pin so a write inside the block can't leak past it
+    pin_token = _pinned_to_primary.set(_pinned_to_primary.get())
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(pin_token)
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def pinned_to_primary():
+    """Force every read inside this block onto the primary"""
+    token = _pinned_to_primary.set(True)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+def use_replica(view_func):
+    """Decorator for read-only views (sync or async) whose queries may be served by the replica"""
+    if iscoroutinefunction(view_func):
+        # The async ORM runs queries in a thread with a copy of this context, so the flag carries over
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            with replica_reads():
+                return await view_func(request, *args, **kwargs)
+        return _wrapped_async_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with replica_reads():
+            return view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+class ReplicaRouter:
+    """Routes opted-in reads to the replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY_DATABASE_ALIAS
+        if not _replica_reads.get() or _pinned_to_primary.get():
+            return None
+        return get_replica_alias()
+
+    def db_for_write(self, model, **hints):
+        # A write in the middle of a replica-read block means the rest of the
+        # request must see it, so stop reading from the replica from here on.
+        if _replica_reads.get():
+            _pinned_to_primary.set(True)
+        return PRIMARY_DATABASE_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either may relate
+        return True
@@ -0,0 +1,16 @@
+"""Helpers for the async views"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.shortcuts import render
+
+
+async def arender(request, template_name, context):
+    """
+    render() for async views. Messages that overflowed their cookie are kept in the
+    session, which is sync-only, so they're loaded off the event loop first, and
+    request.user is resolved through auser() for the context processors;
+    everything else the template touches must already be loaded.
+    """
+    request.user = await request.auser()
+    await sync_to_async(len)(messages.get_messages(request))
+    return render(request, template_name, context)
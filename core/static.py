@@ -0,0 +1,83 @@
+"""
+Serves collected static files when no web server sits in front of Django
+(e.g. uvicorn on its own), enabled by ``SERVE_STATIC_FILES``.
+
+Files come from STATIC_ROOT as written by collectstatic. The precompressed
+``.br``/``.gz`` copy is sent when the browser accepts it, and names from the
+manifest, whose content never changes, are cached for a year as immutable;
+anything requested by its plain name gets a short max-age instead.
+"""
+import mimetypes
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.contrib.staticfiles.views import serve as finders_serve
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 5 * 60
+
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+@lru_cache(maxsize=1)
+def _hashed_names():
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        token, _, params = part.partition(';')
+        weight = params.strip().removeprefix('q=')
+        try:
+            if params and float(weight) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+@require_safe
+def serve_static(request, path):
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        if settings.DEBUG:
+            # Not collected yet; serve straight from the app and project static dirs
+            return finders_serve(request, path, insecure=True)
+        raise Http404
+
+    stat = os.stat(full_path)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    served_path, encoding = full_path, None
+    accepted = _accepted_encodings(request)
+    for token, suffix in ENCODINGS:
+        if token in accepted and os.path.isfile(full_path + suffix):
+            served_path, encoding = full_path + suffix, token
+            break
+
+    response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    if path in _hashed_names():
+        response.headers['Cache-Control'] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = f"public, max-age={MUTABLE_MAX_AGE}"
+    return response
@@ -0,0 +1,61 @@
+"""
+Static files storage for deployments.
+
+``collectstatic`` with ``PrecompressedManifestStaticFilesStorage`` writes
+every file under a content-hashed name (``chart-4.4.0.umd.min.3f2a….js``),
+so a name never changes meaning and can be cached for a year, and it stores
+gzip, and brotli when the optional ``brotli`` package is installed, copies
+of the text formats next to each file. core.static.serve_static picks the
+smallest variant the browser accepts without compressing per request.
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico')
+
+# Below this the compressed copy saves less than the extra file costs
+MIN_COMPRESS_SIZE = 512
+
+
+def compressed_variants(content):
+    """[(suffix, data)] for each encoding that actually shrinks ``content``"""
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, quality=11)))
+    return [(suffix, data) for suffix, data in variants if len(data) < len(content)]
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        # Before the first collectstatic (development, tests) there is no
+        # manifest; use the plain names the finders serve rather than failing.
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Both the plain and the hashed copies end up in STATIC_ROOT
+        for name in {*paths, *self.hashed_files.values()}:
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self._write_compressed(name)
+
+    def _write_compressed(self, name):
+        with self.open(name) as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, data in compressed_variants(content):
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
@@ -0,0 +1,15 @@
+from django import template
+from django.templatetags.static import static
+
+from core.assets import VENDOR_ASSETS
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor_asset(name):
+    """
+    URL of a vendored third-party asset, fingerprinted like any static file
+    (see core.assets). Usage: {% vendor_asset 'chartjs' %}
+    """
+    return static(VENDOR_ASSETS[name]['path'])
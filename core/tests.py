@@ -1,3 +1,114 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 
-# Create your tests here.
+from employees.models import Department
+from .middleware import PrimaryPinningMiddleware
+from .routers import replica_reads, use_replica
+
+# Declared in payroll_manager.test_settings
+REPLICA = 'test_replica'
+
+
+def _department_name():
+    return Department.objects.values_list('name', flat=True).first()
+
+
+@use_replica
+def replica_view(request):
+    return HttpResponse(_department_name())
+
+
+@use_replica
+async def async_replica_view(request):
+    return HttpResponse(await Department.objects.values_list('name', flat=True).afirst())
+
+
+def primary_view(request):
+    return HttpResponse(_department_name())
+
+
+class ReplicaRoutingTests(TestCase):
+    """
+    The primary is the test database and the replica the second one declared in
+    the test settings. Each holds a different department, so a read shows which
+    one served it.
+    """
+
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpTestData(cls):
+        Department.objects.using('default').create(name='Primary')
+        Department.objects.using(REPLICA).create(name='Replica')
+
+    def setUp(self):
+        settings_override = override_settings(REPLICA_DATABASE_ALIAS=REPLICA)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _names(self, alias):
+        return set(Department.objects.using(alias).values_list('name', flat=True))
+
+    def test_reads_go_to_the_replica_only_inside_replica_reads(self):
+        self.assertEqual(_department_name(), 'Primary')
+        with replica_reads():
+            self.assertEqual(_department_name(), 'Replica')
+        self.assertEqual(_department_name(), 'Primary')
+
+    def test_writes_go_to_the_primary_and_pin_the_rest_of_the_block(self):
+        with replica_reads():
+            self.assertEqual(_department_name(), 'Replica')
+            Department.objects.create(name='Added')
+            self.assertEqual(set(Department.objects.values_list('name', flat=True)), {'Added', 'Primary'})
+        self.assertEqual(self._names('default'), {'Added', 'Primary'})
+        self.assertEqual(self._names(REPLICA), {'Replica'})
+
+        # The pin ends with the block
+        with replica_reads():
+            self.assertEqual(_department_name(), 'Replica')
+
+    def test_atomic_blocks_write_to_the_primary(self):
+        with replica_reads():
+            with transaction.atomic():
+                Department.objects.create(name='Committed')
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    Department.objects.create(name='Rolled back')
+                    raise RuntimeError
+        self.assertEqual(self._names('default'), {'Committed', 'Primary'})
+        self.assertEqual(self._names(REPLICA), {'Replica'})
+
+    def test_use_replica_decorator(self):
+        request = RequestFactory().get('/')
+        self.assertEqual(replica_view(request).content, b'Replica')
+        self.assertEqual(async_to_sync(async_replica_view)(request).content, b'Replica')
+        self.assertEqual(primary_view(request).content, b'Primary')
+
+    def _pinning_handler(self):
+        return SessionMiddleware(PrimaryPinningMiddleware(replica_view))
+
+    def _request(self, handler, method, cookies):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies)
+        response = handler(request)
+        cookies.update({name: morsel.value for name, morsel in response.cookies.items()})
+        return response
+
+    def test_session_is_pinned_to_the_primary_after_a_write(self):
+        handler = self._pinning_handler()
+        cookies = {}
+        self.assertEqual(self._request(handler, 'get', cookies).content, b'Replica')
+        self._request(handler, 'post', cookies)
+        self.assertEqual(self._request(handler, 'get', cookies).content, b'Primary')
+        # Another visitor's session is not pinned
+        self.assertEqual(self._request(handler, 'get', {}).content, b'Replica')
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pin_expires_after_the_window(self):
+        handler = self._pinning_handler()
+        cookies = {}
+        self._request(handler, 'post', cookies)
+        self.assertEqual(self._request(handler, 'get', cookies).content, b'Replica')
@@ -14,12 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import include, path
-from core import views
+from core import async_views, views
+
+dashboard = async_views.dashboard if settings.SELF_SERVICE_ASYNC_VIEWS else views.dashboard
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('login', views.index, name='login'),
     path('logout', views.logout_view, name='logout'),
-    path('dashboard', views.dashboard, name='dashboard'),
+    path('dashboard', dashboard, name='dashboard'),
 ]
@@ -9,7 +9,7 @@ from users.models import CustomUser
 # Create your views here.
 def index(request):
     if request.user.is_authenticated:
-        return render(request,'index.html', {'user': request.user, 'name' : request.user.first_name})
+        return render(request, 'index.html')
     
     if request.method == 'POST':
         username = request.POST.get('username')
@@ -35,8 +35,6 @@ def logout_view(request):
 def dashboard(request):
     user = request.user
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'active_nav': 'dashboard',
     }
     
@@ -49,19 +47,18 @@ def dashboard(request):
         total_job_roles = JobRole.objects.count()
         
         # Get recent employees
-        recent_employees = Employee.objects.select_related('user', 'job_role').order_by('-date_of_joining')[:5]
+        recent_employees = Employee.objects.with_current_salary().select_related('user', 'job_role').order_by('-date_of_joining')[:5]
         
         context.update({
             'total_employees': total_employees,
             'total_users': total_users,
             'total_job_roles': total_job_roles,
             'recent_employees': recent_employees,
-            'is_hr_or_admin': True,
         })
     else:
         # Employee Dashboard
         try:
-            employee = Employee.objects.select_related('job_role', 'bank_details').get(user=user)
+            employee = Employee.objects.with_current_salary().select_related('job_role__department', 'bank_details').get(user=user)
             from payroll.models import Payslip
             from django.db.models import Sum
             from datetime import datetime
@@ -81,7 +78,6 @@ def dashboard(request):
                 'payslips_count': this_month_payslips.count(),
                 'total_earnings': total_earnings,
                 'total_payslips': all_payslips.count(),
-                'is_hr_or_admin': False,
             })
         except Employee.DoesNotExist:
             context.update({
@@ -89,7 +85,6 @@ def dashboard(request):
                 'payslips_count': 0,
                 'total_earnings': 0,
                 'total_payslips': 0,
-                'is_hr_or_admin': False,
             })
     
     return render(request, 'dashboard.html', context)
\ No newline at end of file
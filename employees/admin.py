@@ -1,20 +1,56 @@
 from django.contrib import admin
 
-from .models import Employee, JobRole, BankDetails
+from core.paginator import EstimatedCountPaginator
+from .models import Department, Employee, JobRole, BankDetails, PayGroup, SalaryRevision
 
 
 # Register your models here.
+@admin.register(Department)
+class DepartmentAdmin(admin.ModelAdmin):
+    list_display = ("name",)
+    search_fields =    ("name",)
+
+@admin.register(PayGroup)
+class PayGroupAdmin(admin.ModelAdmin):
+    list_display = ("code", "name")
+    search_fields =    ("code", "name")
+
 @admin.register(JobRole)
 class JobRoleAdmin(admin.ModelAdmin):
     list_display = ("title", "department")
-    search_fields =    ("title", "department")
+    list_filter = ("department",)
+    list_select_related = ("department",)
+    search_fields =    ("title", "department__name")
+    autocomplete_fields = ("department",)
 
 @admin.register(BankDetails)
 class BankDetailsAdmin(admin.ModelAdmin):
     list_display = ("account_number", "ifsc_code", "bank_name")
     search_fields =    ("account_number", "bank_name")
 
+class SalaryRevisionInline(admin.TabularInline):
+    model = SalaryRevision
+    extra = 0
+    fields = ("effective_from", "salary_base", "reason", "created_at")
+    readonly_fields = ("created_at",)
+
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
-    list_display = ("user", "job_role", "bank_details", "date_of_joining", "salary_base")
-    search_fields =    ("user__username", "user__first_name", "job_role__title", "bank_details__bank_name")
+    list_display = ("user", "job_role", "pay_group", "bank_details", "date_of_joining", "salary_base", "tax_regime")
+    search_fields =    ("user__username", "user__first_name", "user__last_name", "job_role__title", "uan", "esi_number")
+    list_filter = ("pay_group", "job_role__department")
+    list_select_related = ("user", "job_role", "pay_group", "bank_details")
+    autocomplete_fields = ("user", "job_role", "pay_group", "bank_details")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    inlines = [SalaryRevisionInline]
+
+@admin.register(SalaryRevision)
+class SalaryRevisionAdmin(admin.ModelAdmin):
+    list_display = ("employee", "effective_from", "salary_base", "reason", "created_at")
+    list_filter = ("effective_from",)
+    list_select_related = ("employee__user",)
+    search_fields =    ("employee__user__username", "employee__user__first_name", "reason")
+    autocomplete_fields = ("employee",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
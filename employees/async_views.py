@@ -0,0 +1,118 @@
+"""
+Async versions of the employee self-service pages.
+
+Payday traffic is mostly employees opening their payslips. Served under
+ASGI these views wait on the database without holding a worker thread:
+queries go through the async ORM, the user comes from the cached
+backend's ``aget_user()``, and everything a template touches is loaded
+before it renders. Pages and context match the sync views in
+employees.views; ``SELF_SERVICE_ASYNC_VIEWS`` selects which are routed
+(see employees.urls and core.urls).
+"""
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import aget_object_or_404, redirect
+
+from core.routers import use_replica
+from core.shortcuts import arender
+from employees.models import Employee
+from employees.views import _generated_payslip_context, _ytd_context
+from payroll.models import Payslip, EmployeeAllowanceConfig, EmployeeDeductionConfig
+from payroll.ytd import aget_ytd_as_of
+
+
+async def _self_service_employee(request):
+    """
+    Returns the employee for an employee-only page, or None after queueing
+    the same messages the sync views show.
+    """
+    user = await request.auser()
+    if user.is_hr() or user.is_admin():
+        messages.error(request, 'This page is only for employees.')
+        return None
+    try:
+        employee = await Employee.objects.select_related(
+            'user', 'job_role__department', 'bank_details'
+        ).aget(user=user)
+    except Employee.DoesNotExist:
+        messages.error(request, 'Employee profile not found.')
+        return None
+    return employee
+
+
+def _own_payslips(employee):
+    return Payslip.objects.filter(employee=employee).select_related('payroll').prefetch_related(
+        'allowances__allowance_type',
+        'deductions__deduction_type'
+    )
+
+
+@login_required
+@use_replica
+async def view_my_payslips(request):
+    """View all payslips for the logged-in employee"""
+    employee = await _self_service_employee(request)
+    if employee is None:
+        return redirect('dashboard')
+
+    payslips = [
+        payslip async for payslip in _own_payslips(employee).order_by('-payroll__year', '-payroll__month')
+    ]
+
+    context = {
+        'employee': employee,
+        'payslips': payslips,
+        'active_nav': 'payslips',
+    }
+
+    return await arender(request, 'employees/my_payslips.html', context)
+
+
+@login_required
+@use_replica
+async def view_payslip_detail(request, payslip_id):
+    """View detailed payslip for the logged-in employee"""
+    employee = await _self_service_employee(request)
+    if employee is None:
+        return redirect('dashboard')
+
+    payslip = await aget_object_or_404(_own_payslips(employee), id=payslip_id)
+
+    context = {
+        'employee': employee,
+        'payslip': payslip,
+        'allowances': payslip.allowances.all(),
+        'deductions': payslip.deductions.all(),
+        'ytd': _ytd_context(payslip, await aget_ytd_as_of(payslip)),
+        'active_nav': 'payslips',
+    }
+
+    return await arender(request, 'employees/payslip_detail.html', context)
+
+
+@login_required
+@use_replica
+async def generate_payslip(request, payslip_id):
+    """Generate detailed payslip with calculations - HTML view"""
+    employee = await _self_service_employee(request)
+    if employee is None:
+        return redirect('dashboard')
+
+    payslip = await aget_object_or_404(_own_payslips(employee), id=payslip_id)
+
+    allowance_configs = {
+        config.allowance_type_id: config
+        async for config in EmployeeAllowanceConfig.objects.filter(employee=employee, is_active=True)
+    }
+    deduction_configs = {
+        config.deduction_type_id: config
+        async for config in EmployeeDeductionConfig.objects.filter(employee=employee, is_active=True)
+    }
+
+    context = _generated_payslip_context(
+        payslip, employee, payslip.allowances.all(), payslip.deductions.all(),
+        allowance_configs, deduction_configs,
+        _ytd_context(payslip, await aget_ytd_as_of(payslip))
+    )
+    context['active_nav'] = 'payslips'
+    return await arender(request, 'employees/payslip_generated.html', context)
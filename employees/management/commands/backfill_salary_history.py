@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from employees.models import Employee, SalaryRevision
+
+
+class Command(BaseCommand):
+    help = "Record each employee's current salary from their joining date if they have no salary history yet"
+
+    def handle(self, *args, **options):
+        revisions = [
+            SalaryRevision(
+                employee_id=employee_id,
+                effective_from=date_of_joining,
+                salary_base=salary_base,
+                reason='Backfilled from current salary',
+            )
+            for employee_id, date_of_joining, salary_base in Employee.objects.filter(
+                salary_revisions__isnull=True
+            ).values_list('id', 'date_of_joining', 'salary_base')
+        ]
+        SalaryRevision.objects.bulk_create(revisions, batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"Backfilled salary history for {len(revisions)} employee(s)"))
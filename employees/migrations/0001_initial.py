@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankDetails',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_number', models.CharField(max_length=100)),
+                ('ifsc_code', models.CharField(blank=True, max_length=20)),
+                ('bank_name', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JobRole',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('department', models.CharField(blank=True, max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Employee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_of_joining', models.DateField()),
+                ('salary_base', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('bank_details', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='employee', to='employees.bankdetails')),
+            ],
+        ),
+    ]
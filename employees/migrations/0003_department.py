@@ -0,0 +1,81 @@
+"""
+Moves JobRole.department from free text to a Department table.
+
+The old column is renamed out of the way first, so the new foreign key can
+take its place. The distinct names are then folded into Department rows:
+whitespace is collapsed and case is ignored, so 'Engineering' and
+'engineering ' become one department, spelled the way it was first seen.
+The text column is dropped last. Reversing copies the names back.
+"""
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def fold_departments(apps, schema_editor):
+    Department = apps.get_model('employees', 'Department')
+    JobRole = apps.get_model('employees', 'JobRole')
+    db_alias = schema_editor.connection.alias
+
+    roles_by_key = {}
+    spellings = {}
+    for role_id, name in JobRole.objects.using(db_alias).exclude(
+        legacy_department=''
+    ).values_list('id', 'legacy_department').order_by('id'):
+        name = ' '.join(name.split())
+        if not name:
+            continue
+        key = name.casefold()
+        roles_by_key.setdefault(key, []).append(role_id)
+        spellings.setdefault(key, name)
+
+    for key, role_ids in roles_by_key.items():
+        department = Department.objects.using(db_alias).create(name=spellings[key])
+        JobRole.objects.using(db_alias).filter(id__in=role_ids).update(department=department)
+
+
+def unfold_departments(apps, schema_editor):
+    Department = apps.get_model('employees', 'Department')
+    JobRole = apps.get_model('employees', 'JobRole')
+    db_alias = schema_editor.connection.alias
+
+    for department_id, name in Department.objects.using(db_alias).values_list('id', 'name'):
+        JobRole.objects.using(db_alias).filter(department_id=department_id).update(legacy_department=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Department',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'constraints': [
+                    models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='department_name_ci_unique'),
+                ],
+            },
+        ),
+        migrations.RenameField(
+            model_name='jobrole',
+            old_name='department',
+            new_name='legacy_department',
+        ),
+        migrations.AddField(
+            model_name='jobrole',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job_roles', to='employees.department'),
+        ),
+        migrations.RunPython(fold_departments, unfold_departments),
+        migrations.RemoveField(
+            model_name='jobrole',
+            name='legacy_department',
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0003_department'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='esi_number',
+            field=models.CharField(blank=True, max_length=17, verbose_name='ESI IP number'),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='tax_regime',
+            field=models.CharField(choices=[('NEW', 'New Regime'), ('OLD', 'Old Regime')], default='NEW', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='uan',
+            field=models.CharField(blank=True, max_length=12, verbose_name='UAN'),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='pay_group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='employees', to='employees.paygroup'),
+        ),
+        migrations.CreateModel(
+            name='SalaryRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_from', models.DateField()),
+                ('salary_base', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='salary_revisions', to='employees.employee')),
+            ],
+            options={
+                'ordering': ['employee', '-effective_from'],
+                'unique_together': {('employee', 'effective_from')},
+            },
+        ),
+    ]
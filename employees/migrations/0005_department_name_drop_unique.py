@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0004_salaryrevision_paygroup_statutory_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='department',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+    ]
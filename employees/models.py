@@ -1,11 +1,42 @@
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce, Lower, RowNumber
 from django.conf import settings
+from django.utils import timezone
 
 # Create your models here.
 
+class Department(models.Model):
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='department_name_ci_unique'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class PayGroup(models.Model):
+    """
+    A legal entity or pay group with its own payroll runs. Employees without one
+    belong to the default group and are paid by runs without one.
+    """
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['code']
+
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+
+
 class JobRole(models.Model):
     title = models.CharField(max_length=100)
-    department = models.CharField(max_length=100, blank=True)
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, related_name="job_roles", null=True, blank=True)
 
     def __str__(self):
         return f"{self.title}"
@@ -18,12 +49,112 @@ class BankDetails(models.Model):
     def __str__(self):
         return f"{self.bank_name} - {self.account_number}"
 
+class EmployeeQuerySet(models.QuerySet):
+    def with_current_salary(self):
+        """Annotates current_salary, today's salary from the salary history"""
+        return self.annotate(current_salary=salary_as_of(timezone.localdate()))
+
+
 class Employee(models.Model):
+    TAX_REGIME_CHOICES = [
+        ('NEW', 'New Regime'),
+        ('OLD', 'Old Regime'),
+    ]
+
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="employee")
     job_role = models.ForeignKey(JobRole, on_delete=models.CASCADE, related_name="employees", null=True, blank=True)
     bank_details = models.ForeignKey(BankDetails, on_delete=models.CASCADE, related_name="employee")
     date_of_joining = models.DateField()
     salary_base = models.DecimalField(max_digits=12, decimal_places=2)
+    tax_regime = models.CharField(max_length=10, choices=TAX_REGIME_CHOICES, default='NEW')
+    pay_group = models.ForeignKey(PayGroup, on_delete=models.PROTECT, related_name="employees", null=True, blank=True)
+    # Statutory identifiers for the PF and ESI returns (payroll.statutory)
+    uan = models.CharField("UAN", max_length=12, blank=True)
+    esi_number = models.CharField("ESI IP number", max_length=17, blank=True)
+
+    objects = EmployeeQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Employee - {self.user}"
+
+    def save(self, *args, **kwargs):
+        # Every change to salary_base is also kept in SalaryRevision. salary_base goes
+        # stale once a future-dated revision takes effect, so read salaries through
+        # salary_as_of() (or with_current_salary()) rather than from the field.
+        is_new = self.pk is None
+        salary_changed = is_new or not Employee.objects.filter(
+            pk=self.pk, salary_base=self.salary_base
+        ).exists()
+        super().save(*args, **kwargs)
+        if salary_changed:
+            SalaryRevision.objects.update_or_create(
+                employee=self,
+                effective_from=self.date_of_joining if is_new else timezone.localdate(),
+                defaults={'salary_base': self.salary_base},
+            )
+
+
+class SalaryRevisionQuerySet(models.QuerySet):
+    def as_of(self, date):
+        """
+        The revision in force on date for each employee (at most one row per
+        employee), resolved for any number of employees in a single query
+        """
+        return self.filter(effective_from__lte=date).annotate(
+            revision_rank=Window(
+                RowNumber(),
+                partition_by=[F('employee_id')],
+                order_by=F('effective_from').desc(),
+            )
+        ).filter(revision_rank=1)
+
+    def salaries_as_of(self, date, employee_ids=None):
+        """{employee_id: salary_base} as of date, for the given employees or everyone"""
+        revisions = self if employee_ids is None else self.filter(employee_id__in=employee_ids)
+        return dict(revisions.as_of(date).values_list('employee_id', 'salary_base'))
+
+
+def salary_as_of(date):
+    """
+    Expression for an Employee's salary on date, for annotate()/aggregate().
+    Falls back to salary_base for employees without any revision by then.
+    """
+    return Coalesce(
+        Subquery(
+            SalaryRevision.objects.filter(
+                employee=OuterRef('pk'), effective_from__lte=date
+            ).order_by('-effective_from').values('salary_base')[:1]
+        ),
+        F('salary_base'),
+    )
+
+
+class SalaryRevision(models.Model):
+    """Base salary history; an employee's salary on a date is the latest revision on or before it"""
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name="salary_revisions")
+    effective_from = models.DateField()
+    salary_base = models.DecimalField(max_digits=12, decimal_places=2)
+    reason = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = SalaryRevisionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['employee', '-effective_from']
+        # Also the (employee, effective_from) index the as-of lookups run on
+        unique_together = ['employee', 'effective_from']
 
     def __str__(self):
-        return f"Employee - {self.user}"
\ No newline at end of file
+        return f"{self.employee} - ₹{self.salary_base} from {self.effective_from}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # A future-dated revision leaves salary_base alone until it takes effect
+        if self.effective_from > timezone.localdate():
+            return
+        # The latest revision in force wins, so a back-dated one doesn't override a newer raise
+        current = SalaryRevision.objects.filter(
+            employee_id=self.employee_id, effective_from__lte=timezone.localdate()
+        ).order_by('-effective_from').values_list('salary_base', flat=True).first()
+        if current is not None:
+            Employee.objects.filter(pk=self.employee_id).update(salary_base=current)
\ No newline at end of file
@@ -1,12 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from employees import views
+from employees import async_views, views
+
+# Self-service pages: async versions for ASGI deployments (see employees.async_views)
+self_service = async_views if settings.SELF_SERVICE_ASYNC_VIEWS else views
 
 urlpatterns = [
     path('', views.list_employees, name='list_employees'),
     path('add/', views.add_employee, name='add_employee'),
-    path('my-payslips/', views.view_my_payslips, name='view_my_payslips'),
-    path('payslip/<int:payslip_id>/', views.view_payslip_detail, name='view_payslip_detail'),
-    path('payslip/<int:payslip_id>/generate/', views.generate_payslip, name='generate_payslip'),
+    path('my-payslips/', self_service.view_my_payslips, name='view_my_payslips'),
+    path('payslip/<int:payslip_id>/', self_service.view_payslip_detail, name='view_payslip_detail'),
+    path('payslip/<int:payslip_id>/generate/', self_service.generate_payslip, name='generate_payslip'),
     path('update-profile/', views.update_profile, name='update_profile'),
 ]
 
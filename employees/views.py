@@ -2,12 +2,73 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
-from employees.models import Employee, JobRole
-from payroll.models import Payslip, EmployeeAllowanceConfig, EmployeeDeductionConfig
+from employees.models import Department, Employee, JobRole
+from payroll.models import Payslip, EmployeeAllowanceConfig, EmployeeDeductionConfig, YTDBalance
+from payroll.ytd import financial_year_for, get_ytd_as_of
 from employees.forms import AddEmployeeForm, UpdateProfileForm
+from core.routers import use_replica
 from datetime import date
 
 
+def _ytd_summary(payslip):
+    """YTD figures for the payslip templates, as of the payslip's own period"""
+    return _ytd_context(payslip, get_ytd_as_of(payslip))
+
+
+def _ytd_context(payslip, balances):
+    financial_year = financial_year_for(payslip.payroll.month, payslip.payroll.year)
+    return {
+        'financial_year': f"{financial_year}-{str(financial_year + 1)[-2:]}",
+        'gross': balances.get(YTDBalance.GROSS, 0),
+        'taxable': balances.get(YTDBalance.TAXABLE, 0),
+        'deductions': balances.get(YTDBalance.TOTAL_DEDUCTIONS, 0),
+        'net': balances.get(YTDBalance.NET, 0),
+    }
+
+
+def _line_details(payslip, lines, configs, type_field, flag):
+    """Rows for the generated payslip: each line with how its employee config calculates it"""
+    details = []
+    for line in lines:
+        line_type = getattr(line, type_field)
+        config = configs.get(line_type.id)
+        percentage = None
+        if config is None:
+            calculation = 'N/A'
+        elif config.is_percentage_type():
+            calculation = f"{config.percentage}% of Base Salary (₹{payslip.base_salary:,.2f})"
+            percentage = config.percentage
+        else:
+            calculation = f"Fixed Amount (₹{config.amount:,.2f})"
+        details.append({
+            'name': line_type.name,
+            'amount': line.amount,
+            'calculation': calculation,
+            'percentage': percentage,
+            flag: getattr(line_type, flag),
+        })
+    return details
+
+
+def _generated_payslip_context(payslip, employee, allowances, deductions, allowance_configs, deduction_configs, ytd):
+    """Context for employees/payslip_generated.html; configs map type id -> employee config"""
+    # Month name mapping
+    month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June', 
+                   'July', 'August', 'September', 'October', 'November', 'December']
+    
+    return {
+        'payslip': payslip,
+        'employee': employee,
+        'allowances': allowances,
+        'deductions': deductions,
+        'allowance_details': _line_details(payslip, allowances, allowance_configs, 'allowance_type', 'is_taxable'),
+        'deduction_details': _line_details(payslip, deductions, deduction_configs, 'deduction_type', 'is_statutory'),
+        'payroll_date': date(payslip.payroll.year, payslip.payroll.month, 1),
+        'ytd': ytd,
+        'month_name': month_names[payslip.payroll.month] if payslip.payroll.month <= 12 else 'Unknown',
+    }
+
+
 @login_required
 def list_employees(request):
     """List all employees - only HR and Admin can access"""
@@ -19,13 +80,19 @@ def list_employees(request):
         return redirect('dashboard')
     
     # Get all employees with related data
-    employees = Employee.objects.select_related('user', 'job_role', 'bank_details').order_by('-date_of_joining')
+    employees = Employee.objects.with_current_salary().select_related(
+        'user', 'job_role__department', 'bank_details'
+    ).order_by('-date_of_joining')
+    
+    # Optional department filter (by id, so it runs on the indexed FK)
+    department_id = request.GET.get('department', '')
+    if department_id.isdigit():
+        employees = employees.filter(job_role__department_id=department_id)
     
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'employees': employees,
-        'is_hr_or_admin': True,
+        'departments': Department.objects.all(),
+        'selected_department': int(department_id) if department_id.isdigit() else None,
         'active_nav': 'employees',
     }
     
@@ -61,10 +128,7 @@ def add_employee(request):
         messages.warning(request, 'No job roles found. Please create job roles in the admin panel before adding employees.')
     
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'form': form,
-        'is_hr_or_admin': True,
         'active_nav': 'employees',
     }
     
@@ -72,6 +136,7 @@ def add_employee(request):
 
 
 @login_required
+@use_replica
 def view_my_payslips(request):
     """View all payslips for the logged-in employee"""
     user = request.user
@@ -96,11 +161,8 @@ def view_my_payslips(request):
     ).order_by('-payroll__year', '-payroll__month')
     
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'employee': employee,
         'payslips': payslips,
-        'is_hr_or_admin': False,
         'active_nav': 'payslips',
     }
     
@@ -108,6 +170,7 @@ def view_my_payslips(request):
 
 
 @login_required
+@use_replica
 def view_payslip_detail(request, payslip_id):
     """View detailed payslip for the logged-in employee"""
     user = request.user
@@ -118,7 +181,7 @@ def view_payslip_detail(request, payslip_id):
         return redirect('dashboard')
     
     try:
-        employee = Employee.objects.get(user=user)
+        employee = Employee.objects.select_related('job_role__department').get(user=user)
     except Employee.DoesNotExist:
         messages.error(request, 'Employee profile not found.')
         return redirect('dashboard')
@@ -138,13 +201,11 @@ def view_payslip_detail(request, payslip_id):
     deductions = payslip.deductions.all().select_related('deduction_type')
     
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'employee': employee,
         'payslip': payslip,
         'allowances': allowances,
         'deductions': deductions,
-        'is_hr_or_admin': False,
+        'ytd': _ytd_summary(payslip),
         'active_nav': 'payslips',
     }
     
@@ -152,6 +213,7 @@ def view_payslip_detail(request, payslip_id):
 
 
 @login_required
+@use_replica
 def generate_payslip(request, payslip_id):
     """Generate detailed payslip with calculations - HTML view"""
     user = request.user
@@ -162,14 +224,14 @@ def generate_payslip(request, payslip_id):
         return redirect('dashboard')
     
     try:
-        employee = Employee.objects.select_related('user', 'job_role', 'bank_details').get(user=user)
+        employee = Employee.objects.select_related('user', 'job_role__department', 'bank_details').get(user=user)
     except Employee.DoesNotExist:
         messages.error(request, 'Employee profile not found.')
         return redirect('dashboard')
     
     # Get payslip and verify it belongs to this employee
     payslip = get_object_or_404(
-        Payslip.objects.select_related('payroll', 'employee__user', 'employee__job_role', 'employee__bank_details').prefetch_related(
+        Payslip.objects.select_related('payroll', 'employee__user', 'employee__job_role__department', 'employee__bank_details').prefetch_related(
             'allowances__allowance_type',
             'deductions__deduction_type'
         ),
@@ -181,91 +243,23 @@ def generate_payslip(request, payslip_id):
     allowances = payslip.allowances.all().select_related('allowance_type')
     deductions = payslip.deductions.all().select_related('deduction_type')
     
-    # Get employee allowance/deduction configs to show calculation details
-    payroll_date = date(payslip.payroll.year, payslip.payroll.month, 1)
-    
-    # Get allowance configs with calculation details
-    allowance_configs = EmployeeAllowanceConfig.objects.filter(
-        employee=employee,
-        is_active=True
-    ).select_related('allowance_type')
-    
-    allowance_details = []
-    for allowance in allowances:
-        config = allowance_configs.filter(allowance_type=allowance.allowance_type).first()
-        if config:
-            if config.is_percentage_type():
-                calculation = f"{config.percentage}% of Base Salary (₹{payslip.base_salary:,.2f})"
-            else:
-                calculation = f"Fixed Amount (₹{config.amount:,.2f})"
-            allowance_details.append({
-                'name': allowance.allowance_type.name,
-                'amount': allowance.amount,
-                'calculation': calculation,
-                'percentage': config.percentage if config.is_percentage_type() else None,
-                'is_taxable': allowance.allowance_type.is_taxable,
-            })
-        else:
-            allowance_details.append({
-                'name': allowance.allowance_type.name,
-                'amount': allowance.amount,
-                'calculation': 'N/A',
-                'percentage': None,
-                'is_taxable': allowance.allowance_type.is_taxable,
-            })
-    
-    # Get deduction configs with calculation details
-    deduction_configs = EmployeeDeductionConfig.objects.filter(
-        employee=employee,
-        is_active=True
-    ).select_related('deduction_type')
-    
-    deduction_details = []
-    for deduction in deductions:
-        config = deduction_configs.filter(deduction_type=deduction.deduction_type).first()
-        if config:
-            if config.is_percentage_type():
-                calculation = f"{config.percentage}% of Base Salary (₹{payslip.base_salary:,.2f})"
-            else:
-                calculation = f"Fixed Amount (₹{config.amount:,.2f})"
-            deduction_details.append({
-                'name': deduction.deduction_type.name,
-                'amount': deduction.amount,
-                'calculation': calculation,
-                'percentage': config.percentage if config.is_percentage_type() else None,
-                'is_statutory': deduction.deduction_type.is_statutory,
-            })
-        else:
-            deduction_details.append({
-                'name': deduction.deduction_type.name,
-                'amount': deduction.amount,
-                'calculation': 'N/A',
-                'percentage': None,
-                'is_statutory': deduction.deduction_type.is_statutory,
-            })
-    
-    # Month name mapping
-    month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June', 
-                   'July', 'August', 'September', 'October', 'November', 'December']
-    
-    context = {
-        'payslip': payslip,
-        'employee': employee,
-        'allowances': allowances,
-        'deductions': deductions,
-        'allowance_details': allowance_details,
-        'deduction_details': deduction_details,
-        'payroll_date': payroll_date,
-        'month_name': month_names[payslip.payroll.month] if payslip.payroll.month <= 12 else 'Unknown',
+    # Employee configs, to show how each line was calculated (one per type per employee)
+    allowance_configs = {
+        config.allowance_type_id: config
+        for config in EmployeeAllowanceConfig.objects.filter(employee=employee, is_active=True)
     }
+    deduction_configs = {
+        config.deduction_type_id: config
+        for config in EmployeeDeductionConfig.objects.filter(employee=employee, is_active=True)
+    }
+    
+    context = _generated_payslip_context(
+        payslip, employee, allowances, deductions, allowance_configs, deduction_configs,
+        _ytd_summary(payslip)
+    )
     
     # HTML view only
-    context.update({
-        'user': user,
-        'name': user.first_name or user.username,
-        'is_hr_or_admin': False,
-        'active_nav': 'payslips',
-    })
+    context['active_nav'] = 'payslips'
     return render(request, 'employees/payslip_generated.html', context)
 
 
@@ -280,7 +274,9 @@ def update_profile(request):
         return redirect('dashboard')
     
     try:
-        employee = Employee.objects.select_related('user', 'bank_details', 'job_role').get(user=user)
+        employee = Employee.objects.with_current_salary().select_related(
+            'user', 'bank_details', 'job_role__department'
+        ).get(user=user)
     except Employee.DoesNotExist:
         messages.error(request, 'Employee profile not found.')
         return redirect('dashboard')
@@ -312,11 +308,8 @@ def update_profile(request):
         form = UpdateProfileForm(employee=employee)
     
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'employee': employee,
         'form': form,
-        'is_hr_or_admin': False,
         'active_nav': 'profile',
     }
     
@@ -6,6 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
+    # The test suite needs a second database; see payroll_manager/test_settings.py
+    if sys.argv[1:2] == ['test']:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'payroll_manager.test_settings')
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'payroll_manager.settings')
     try:
         from django.core.management import execute_from_command_line
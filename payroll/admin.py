@@ -1,9 +1,21 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from core.paginator import EstimatedCountPaginator
+from .integrity import verify
 from .models import (
-    AllowanceType, DeductionType, Payroll, Payslip,
+    AllowanceType, DeductionType, GLAccount, GLMapping, Payroll, Payslip,
     PayslipAllowance, PayslipDeduction,
-    EmployeeAllowanceConfig, EmployeeDeductionConfig
+    EmployeeAllowanceConfig, EmployeeDeductionConfig, YTDBalance,
+    TaxRegime, TaxSlab, Arrear, PayrollVoid, PayrollRunProfile, PayslipDelivery, SalarySketch
 )
+from .telemetry import compare_runs, metric_labels
+from .void import void_and_rerun, void_payroll
 
 
 @admin.register(AllowanceType)
@@ -20,24 +32,45 @@ class DeductionTypeAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
 
 
+@admin.register(GLAccount)
+class GLAccountAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name')
+    search_fields = ('code', 'name')
+
+
+@admin.register(GLMapping)
+class GLMappingAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'component', 'account')
+    list_filter = ('component',)
+    list_select_related = ('allowance_type', 'deduction_type', 'account')
+    search_fields = ('allowance_type__name', 'deduction_type__name', 'account__code', 'account__name')
+    autocomplete_fields = ('allowance_type', 'deduction_type', 'account')
+
+
 class PayslipAllowanceInline(admin.TabularInline):
     model = PayslipAllowance
     extra = 0
     fields = ('allowance_type', 'amount', 'description')
+    autocomplete_fields = ('allowance_type',)
 
 
 class PayslipDeductionInline(admin.TabularInline):
     model = PayslipDeduction
     extra = 0
     fields = ('deduction_type', 'amount', 'description')
+    autocomplete_fields = ('deduction_type',)
 
 
 @admin.register(Payslip)
 class PayslipAdmin(admin.ModelAdmin):
     list_display = ('employee', 'payroll', 'base_salary', 'gross_salary', 'total_deductions', 'net_salary', 'payment_date')
     list_filter = ('payroll__year', 'payroll__month', 'payroll__status', 'payment_method')
+    list_select_related = ('employee__user', 'payroll__pay_group')
     search_fields = ('employee__user__username', 'employee__user__first_name', 'employee__user__last_name')
     readonly_fields = ('created_at', 'updated_at')
+    autocomplete_fields = ('payroll', 'employee')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [PayslipAllowanceInline, PayslipDeductionInline]
     fieldsets = (
         ('Basic Information', {
@@ -51,18 +84,38 @@ class PayslipAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def has_change_permission(self, request, obj=None):
+        if obj is not None and obj.payroll.is_locked:
+            return False
+        return super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.payroll.is_locked:
+            return False
+        return super().has_delete_permission(request, obj)
+    
+    def get_actions(self, request):
+        # The bulk delete checks permission without an object, so it would get past the lock
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
 
 
 @admin.register(Payroll)
 class PayrollAdmin(admin.ModelAdmin):
-    list_display = ('month', 'year', 'status', 'employee_count', 'total_net_salary', 'processed_date')
-    list_filter = ('status', 'year', 'month')
+    list_display = ('month', 'year', 'pay_group', 'status', 'employee_count', 'total_net_salary', 'processed_date')
+    list_filter = ('status', 'pay_group', 'year', 'month')
+    list_select_related = ('pay_group',)
+    autocomplete_fields = ('processed_by', 'pay_group')
     search_fields = ('notes',)
-    readonly_fields = ('processed_date', 'total_gross_salary', 'total_deductions', 'total_net_salary')
+    readonly_fields = ('status', 'processed_date', 'total_gross_salary', 'total_deductions', 'total_net_salary', 'telemetry')
+    change_list_template = 'admin/payroll/payroll/change_list.html'
     date_hierarchy = 'processed_date'
+    actions = ['mark_processed', 'mark_approved', 'mark_paid', 'reopen', 'rerun', 'verify_totals']
     fieldsets = (
         ('Pay Period', {
-            'fields': ('month', 'year', 'status')
+            'fields': ('month', 'year', 'pay_group', 'status')
         }),
         ('Summary', {
             'fields': ('employee_count', 'total_gross_salary', 'total_deductions', 'total_net_salary')
@@ -70,18 +123,277 @@ class PayrollAdmin(admin.ModelAdmin):
         ('Processing', {
             'fields': ('processed_by', 'processed_date', 'notes')
         }),
+        ('Telemetry', {
+            'fields': ('telemetry',),
+            'classes': ('collapse',)
+        }),
     )
+    
+    # Runs shown in the telemetry comparison, most recent
+    TELEMETRY_RUNS = 24
+    
+    # Discrepancies listed by the verify action; the rest are only counted
+    VERIFY_SHOWN = 20
+    
+    def get_urls(self):
+        return [
+            path('telemetry/', self.admin_site.admin_view(self.telemetry_view), name='payroll_payroll_telemetry'),
+        ] + super().get_urls()
+    
+    def telemetry_view(self, request):
+        """Compares phase timings and counters across runs, flagging regressions"""
+        payrolls = list(
+            Payroll.objects.exclude(telemetry={}).select_related('pay_group').only(
+                'month', 'year', 'status', 'employee_count', 'telemetry', 'pay_group__code', 'pay_group__name'
+            ).order_by('-year', '-month')[:self.TELEMETRY_RUNS]
+        )
+        payrolls.reverse()
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Payroll run telemetry',
+            'labels': metric_labels(),
+            'rows': compare_runs(payrolls),
+        }
+        return TemplateResponse(request, 'admin/payroll/payroll/telemetry.html', context)
+    
+    def has_change_permission(self, request, obj=None):
+        if obj is not None and obj.is_locked:
+            return False
+        return super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        # Deleting voids the run; approved and paid runs have to be reopened first
+        if obj is not None and not obj.can_void:
+            return False
+        return super().has_delete_permission(request, obj)
+    
+    def get_actions(self, request):
+        # The stock bulk delete loads every payslip through the deletion collector
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+    
+    def get_deleted_objects(self, objs, request):
+        # Summarise instead of collecting every payslip and line item for the confirmation page
+        summary = [f"{payroll} and its {payroll.employee_count} payslip(s)" for payroll in objs]
+        return summary, {'payrolls': len(summary)}, set(), []
+    
+    def delete_model(self, request, obj):
+        void_payroll(obj, voided_by=request.user, reason='Deleted in admin')
+    
+    def _transition(self, request, queryset, status):
+        """Applies a guarded status transition to each selected payroll"""
+        moved = 0
+        for payroll in queryset:
+            try:
+                payroll.transition_to(status)
+                moved += 1
+            except ValidationError as e:
+                self.message_user(request, e.messages[0], messages.ERROR)
+        if moved:
+            label = dict(Payroll.STATUS_CHOICES)[status]
+            self.message_user(request, f"{moved} payroll(s) marked as {label}.", messages.SUCCESS)
+    
+    @admin.action(description="Mark selected payrolls as Processed")
+    def mark_processed(self, request, queryset):
+        self._transition(request, queryset.filter(status='DRAFT'), 'PROCESSED')
+    
+    @admin.action(description="Approve selected payrolls")
+    def mark_approved(self, request, queryset):
+        self._transition(request, queryset, 'APPROVED')
+    
+    @admin.action(description="Mark selected payrolls as Paid")
+    def mark_paid(self, request, queryset):
+        self._transition(request, queryset, 'PAID')
+    
+    @admin.action(description="Reopen selected approved payrolls")
+    def reopen(self, request, queryset):
+        self._transition(request, queryset.filter(status='APPROVED'), 'PROCESSED')
+    
+    @admin.action(description="Void and re-run selected payrolls")
+    def rerun(self, request, queryset):
+        voided = 0
+        for payroll in queryset:
+            try:
+                void_and_rerun(payroll, voided_by=request.user, reason='Voided in admin')
+                voided += 1
+            except ValidationError as e:
+                self.message_user(request, e.messages[0], messages.ERROR)
+        if voided:
+            self.message_user(request, f"{voided} payroll(s) voided and re-run.", messages.SUCCESS)
+    
+    @admin.action(description="Verify totals of selected payrolls")
+    def verify_totals(self, request, queryset):
+        # The YTD ledger spans payrolls; `manage.py verify_payroll` checks it
+        found = 0
+        for discrepancy in verify(queryset, ytd=False):
+            found += 1
+            if found <= self.VERIFY_SHOWN:
+                self.message_user(request, str(discrepancy), messages.WARNING)
+        if found:
+            self.message_user(request, f"{found} discrepancy(ies) found.", messages.ERROR)
+        else:
+            self.message_user(
+                request, f"Totals and payslips of {queryset.count()} payroll(s) are consistent.", messages.SUCCESS
+            )
 
 
 @admin.register(EmployeeAllowanceConfig)
 class EmployeeAllowanceConfigAdmin(admin.ModelAdmin):
     list_display = ('employee', 'allowance_type', 'get_allowance_type_display', 'amount', 'percentage', 'is_active', 'effective_from', 'effective_to')
     list_filter = ('allowance_type', 'is_active', 'effective_from')
+    list_select_related = ('employee__user', 'allowance_type')
     search_fields = ('employee__user__username', 'employee__user__first_name', 'allowance_type__name')
+    autocomplete_fields = ('employee', 'allowance_type')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(EmployeeDeductionConfig)
 class EmployeeDeductionConfigAdmin(admin.ModelAdmin):
     list_display = ('employee', 'deduction_type', 'get_deduction_type_display', 'amount', 'percentage', 'is_active', 'effective_from', 'effective_to')
     list_filter = ('deduction_type', 'is_active', 'deduction_type__is_statutory')
+    list_select_related = ('employee__user', 'deduction_type')
     search_fields = ('employee__user__username', 'employee__user__first_name', 'deduction_type__name')
+    autocomplete_fields = ('employee', 'deduction_type')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(YTDBalance)
+class YTDBalanceAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'financial_year', 'component', 'amount', 'updated_at')
+    list_filter = ('financial_year', 'component')
+    list_select_related = ('employee__user',)
+    search_fields = ('employee__user__username', 'employee__user__first_name', 'employee__user__last_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('employee', 'financial_year', 'component', 'amount', 'updated_at')
+    
+    def has_add_permission(self, request):
+        # Maintained by payroll approvals and `manage.py rebuild_ytd`
+        return False
+
+
+@admin.register(SalarySketch)
+class SalarySketchAdmin(admin.ModelAdmin):
+    list_display = ('payroll', 'metric', 'department', 'job_role', 'count', 'total')
+    list_filter = ('metric', 'payroll__year')
+    list_select_related = ('payroll__pay_group', 'department', 'job_role')
+    readonly_fields = ('payroll', 'metric', 'department', 'job_role', 'count', 'total', 'sketch')
+    
+    def has_add_permission(self, request):
+        # Recorded when payrolls are approved and by `manage.py build_salary_sketches`
+        return False
+
+
+class TaxSlabInline(admin.TabularInline):
+    model = TaxSlab
+    extra = 0
+    fields = ('lower_limit', 'upper_limit', 'rate')
+
+
+@admin.register(TaxRegime)
+class TaxRegimeAdmin(admin.ModelAdmin):
+    list_display = ('code', 'financial_year', 'standard_deduction', 'rebate_income_limit', 'rebate_max', 'cess_percentage')
+    list_filter = ('code', 'financial_year')
+    readonly_fields = ('updated_at',)
+    inlines = [TaxSlabInline]
+
+
+@admin.register(Arrear)
+class ArrearAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'effective_from', 'amount', 'payroll', 'created_at')
+    list_filter = ('effective_from',)
+    list_select_related = ('employee__user', 'payroll__pay_group')
+    search_fields = ('employee__user__username', 'employee__user__first_name', 'employee__user__last_name')
+    readonly_fields = ('employee', 'allowance_type', 'effective_from', 'amount', 'breakdown', 'created_at', 'created_by', 'payroll')
+    
+    def has_add_permission(self, request):
+        # Created by `manage.py calculate_arrears`
+        return False
+
+
+
+@admin.register(PayrollVoid)
+class PayrollVoidAdmin(admin.ModelAdmin):
+    list_display = ('month', 'year', 'pay_group', 'status', 'payslips_deleted', 'line_items_deleted', 'voided_by', 'voided_at', 'rerun_payroll')
+    list_filter = ('year', 'month', 'status')
+    list_select_related = ('voided_by', 'pay_group', 'rerun_payroll__pay_group')
+    search_fields = ('reason',)
+    
+    def has_add_permission(self, request):
+        # Written by void_payroll
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+
+@admin.register(PayrollRunProfile)
+class PayrollRunProfileAdmin(admin.ModelAdmin):
+    list_display = ('payroll', 'created_at', 'download')
+    list_select_related = ('payroll__pay_group',)
+    readonly_fields = ('payroll', 'created_at', 'download', 'profile_summary', 'memory_summary')
+    exclude = ('stats',)
+    
+    def has_add_permission(self, request):
+        # Captured by profiled runs (`manage.py run_payroll --profile`)
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        return [
+            path(
+                '<int:profile_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='payroll_payrollrunprofile_download'
+            ),
+        ] + super().get_urls()
+    
+    @admin.display(description='cProfile stats')
+    def download(self, obj):
+        url = reverse('admin:payroll_payrollrunprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">Download .prof</a>', url)
+    
+    def download_view(self, request, profile_id):
+        profile = get_object_or_404(PayrollRunProfile, pk=profile_id)
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = (
+            f'attachment; filename="payroll-{profile.payroll.year}-{profile.payroll.month:02d}-{profile.pk}.prof"'
+        )
+        return response
+
+
+
+@admin.register(PayslipDelivery)
+class PayslipDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('payslip_id', 'payroll', 'email', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'payroll__year', 'payroll__month')
+    list_select_related = ('payroll__pay_group',)
+    search_fields = ('=email', '=payslip__id')
+    readonly_fields = (
+        'payslip', 'payroll', 'email', 'status', 'attempts', 'next_attempt_at',
+        'claimed_by', 'claimed_until', 'last_error', 'queued_at', 'sent_at'
+    )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['retry_now']
+    
+    def has_add_permission(self, request):
+        # Queued when a payroll is approved
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    @admin.action(description="Retry selected failed or pending deliveries now")
+    def retry_now(self, request, queryset):
+        queued = queryset.filter(status__in=('PENDING', 'FAILED')).update(
+            status='PENDING', attempts=0, next_attempt_at=timezone.now(), last_error=''
+        )
+        self.message_user(request, f"{queued} delivery(ies) queued for the next send.", messages.SUCCESS)
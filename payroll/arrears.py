@@ -0,0 +1,282 @@
+"""
+Retroactive arrears for back-dated salary revisions.
+
+Every approved or paid payroll period on or after the revision date is
+replayed in memory for the affected employees only (by default, those with
+a salary revision on or after that date), with the salary each period
+should have paid according to the salary history; a period with a
+revision inside it is split at the revision date and each part weighted
+by its days. Per-component
+differences from the stored payslips are then summed into one pending
+``Arrear`` per employee, which the next run pays as a single allowance
+line. Each chunk of employees is replayed across all periods from a fixed
+handful of queries, whatever the number of months: the chunk's salary
+history is read once and resolved per period in memory.
+"""
+from bisect import bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from employees.models import Employee, SalaryRevision
+from .engine import compute_payslip, iter_employee_chunks, period_calendar
+from .models import (
+    AllowanceType, Arrear, Payroll, Payslip, PayslipAllowance, PayslipDeduction,
+    EmployeeAllowanceConfig, EmployeeDeductionConfig
+)
+from .ytd import COUNTED_STATUSES
+
+BASE_COMPONENT = 'Base Salary'
+
+
+def arrears_allowance_type():
+    name = getattr(settings, 'PAYROLL_ARREARS_ALLOWANCE_TYPE', 'Arrears')
+    allowance_type, _ = AllowanceType.objects.get_or_create(
+        name=name,
+        defaults={'description': 'Back pay for retroactive salary revisions', 'is_taxable': True}
+    )
+    return allowance_type
+
+
+def _affected_payrolls(effective_from):
+    """
+    Approved and paid runs whose period ends on or after the revision date,
+    oldest first. Drafts and processed runs are recalculated, not owed arrears.
+    """
+    return list(Payroll.objects.filter(
+        Q(year__gt=effective_from.year) | Q(year=effective_from.year, month__gte=effective_from.month),
+        status__in=COUNTED_STATUSES,
+    ).order_by('year', 'month'))
+
+
+def revised_employees(effective_from):
+    """Employees with a salary revision taking effect on or after the date"""
+    return Employee.objects.filter(
+        id__in=SalaryRevision.objects.filter(effective_from__gte=effective_from).values('employee_id')
+    )
+
+
+def _salary_history(employee_ids, until):
+    """{employee_id: ([effective_from, ...], [salary_base, ...])} ascending, from one query"""
+    history = {}
+    for employee_id, effective_from, salary_base in SalaryRevision.objects.filter(
+        employee_id__in=employee_ids, effective_from__lte=until
+    ).values_list('employee_id', 'effective_from', 'salary_base').order_by('employee_id', 'effective_from'):
+        dates, salaries = history.setdefault(employee_id, ([], []))
+        dates.append(effective_from)
+        salaries.append(salary_base)
+    return history
+
+
+def _salary_on(history, employee_id, date, default):
+    """The latest revision on or before date, as SalaryRevision.objects.as_of() would pick"""
+    dates, salaries = history.get(employee_id, ((), ()))
+    position = bisect_right(dates, date)
+    return salaries[position - 1] if position else default
+
+
+def _salary_segments(history, employee_id, calendar, joined, effective_from, revised, default):
+    """
+    (start, end, salary) for each stretch of the period under one salary, from
+    the day the employee joined or the period start. A new stretch starts on
+    every revision date after that; revised, when given, replaces the salary
+    from effective_from on.
+    """
+    first = max(calendar.start, joined)
+    boundaries = [first]
+    dates, _ = history.get(employee_id, ((), ()))
+    changes = list(dates) + ([effective_from] if revised is not None else [])
+    boundaries += sorted({day for day in changes if first < day <= calendar.end})
+    segments = []
+    for i, start in enumerate(boundaries):
+        end = boundaries[i + 1] - timedelta(days=1) if i + 1 < len(boundaries) else calendar.end
+        if revised is not None and start >= effective_from:
+            salary = revised
+        else:
+            salary = _salary_on(history, employee_id, start, default)
+        segments.append((start, end, salary))
+    return segments
+
+
+def _configs_for(configs, calendar):
+    return [
+        config for config in configs
+        if (config.effective_from is None or config.effective_from <= calendar.end)
+        and (config.effective_to is None or config.effective_to >= calendar.start)
+    ]
+
+
+def _stored_components(payroll_ids, employee_ids, excluded_allowance_type_id):
+    """
+    {(payroll_id, employee_id): {('Earning'|'Deduction', name): amount}} for the stored
+    payslips, from three queries.
+    """
+    stored = {}
+    for payroll_id, employee_id, base_salary in Payslip.objects.filter(
+        payroll_id__in=payroll_ids, employee_id__in=employee_ids
+    ).values_list('payroll_id', 'employee_id', 'base_salary').order_by():
+        stored[(payroll_id, employee_id)] = {('Earning', BASE_COMPONENT): base_salary}
+
+    for payroll_id, employee_id, name, amount in PayslipAllowance.objects.filter(
+        payslip__payroll_id__in=payroll_ids, payslip__employee_id__in=employee_ids
+    ).exclude(allowance_type_id=excluded_allowance_type_id).values_list(
+        'payslip__payroll_id', 'payslip__employee_id', 'allowance_type__name', 'amount'
+    ).order_by():
+        components = stored[(payroll_id, employee_id)]
+        components[('Earning', name)] = components.get(('Earning', name), Decimal('0.00')) + amount
+
+    for payroll_id, employee_id, name, amount in PayslipDeduction.objects.filter(
+        payslip__payroll_id__in=payroll_ids, payslip__employee_id__in=employee_ids
+    ).values_list(
+        'payslip__payroll_id', 'payslip__employee_id', 'deduction_type__name', 'amount'
+    ).order_by():
+        components = stored[(payroll_id, employee_id)]
+        components[('Deduction', name)] = components.get(('Deduction', name), Decimal('0.00')) + amount
+
+    return stored
+
+
+def _settled_earnings(employee_ids):
+    """
+    {(employee_id, 'M/YYYY'): earnings already covered by earlier Arrear rows}, so
+    recalculating (or a second revision) only adds what is still owed
+    """
+    settled = {}
+    for employee_id, breakdown in Arrear.objects.filter(
+        employee_id__in=employee_ids
+    ).values_list('employee_id', 'breakdown').order_by():
+        for period, deltas in breakdown.items():
+            earned = sum(
+                (Decimal(delta) for component, delta in deltas.items() if component.startswith('Earning: ')),
+                Decimal('0.00')
+            )
+            settled[(employee_id, period)] = settled.get((employee_id, period), Decimal('0.00')) + earned
+    return settled
+
+
+def _replayed_components(draft):
+    components = {('Earning', BASE_COMPONENT): draft['base_salary']}
+    for line in draft['allowances']:
+        key = ('Earning', line['allowance_type'].name)
+        components[key] = components.get(key, Decimal('0.00')) + line['amount']
+    for line in draft['deductions']:
+        key = ('Deduction', line['deduction_type'].name)
+        components[key] = components.get(key, Decimal('0.00')) + line['amount']
+    return components
+
+
+def compute_arrears(effective_from, employees=None, salaries=None):
+    """
+    Yields one dict per employee owed arrears:
+    {'employee', 'amount', 'breakdown': {'M/YYYY': {component: delta}}}
+
+    employees defaults to revised_employees(effective_from). salaries maps
+    employee_id -> revised monthly base from effective_from on; by default each
+    revision in the history (SalaryRevision) applies from its own date, falling
+    back to the current salary_base. A period with a revision inside it is
+    replayed once per salary and each result weighted by the days that salary
+    was in force. The arrears amount is the earnings difference, less whatever
+    earlier Arrear rows already cover for the same periods. Config-driven
+    deduction differences are listed in the breakdown for reference only;
+    nothing recovers them, so they have to be settled by hand.
+    """
+    salaries = salaries or {}
+    payrolls = _affected_payrolls(effective_from)
+    if not payrolls:
+        return
+    calendars = {payroll.id: period_calendar(payroll.month, payroll.year) for payroll in payrolls}
+    excluded_type = arrears_allowance_type()
+
+    if employees is None:
+        employees = revised_employees(effective_from)
+    last_day = max(calendar.end for calendar in calendars.values())
+
+    for chunk in iter_employee_chunks(employees):
+        employee_ids = [employee.id for employee in chunk]
+        current_salaries = {employee.id: employee.salary_base for employee in chunk}
+        history = _salary_history(employee_ids, last_day)
+
+        # All configs for the chunk once; each period picks its own in memory
+        allowance_configs = {}
+        for config in EmployeeAllowanceConfig.objects.filter(
+            employee_id__in=employee_ids, is_active=True
+        ).exclude(allowance_type=excluded_type).select_related('allowance_type').order_by():
+            allowance_configs.setdefault(config.employee_id, []).append(config)
+        deduction_configs = {}
+        for config in EmployeeDeductionConfig.objects.filter(
+            employee_id__in=employee_ids, is_active=True
+        ).select_related('deduction_type').order_by():
+            deduction_configs.setdefault(config.employee_id, []).append(config)
+
+        stored = _stored_components(list(calendars), employee_ids, excluded_type.id)
+        settled = _settled_earnings(employee_ids)
+
+        for employee in chunk:
+            breakdown = {}
+            total = Decimal('0.00')
+            for payroll in payrolls:
+                stored_components = stored.get((payroll.id, employee.id))
+                if stored_components is None:
+                    continue
+                calendar = calendars[payroll.id]
+                replayed = {}
+                # compute_payslip already prorates a joiner's month, so weights are
+                # shares of the days employed
+                employed_days = calendar.days_between(employee.date_of_joining, None)
+                for start, end, salary in _salary_segments(
+                    history, employee.id, calendar, employee.date_of_joining, effective_from,
+                    salaries.get(employee.id), current_salaries[employee.id],
+                ):
+                    employee.salary_base = salary
+                    draft = compute_payslip(
+                        employee,
+                        _configs_for(allowance_configs.get(employee.id, []), calendar),
+                        _configs_for(deduction_configs.get(employee.id, []), calendar),
+                        calendar,
+                    )
+                    # Each revision counts for the days it was in force
+                    weight = Decimal(calendar.days_between(start, end)) / Decimal(employed_days or 1)
+                    for key, amount in _replayed_components(draft).items():
+                        replayed[key] = replayed.get(key, Decimal('0.00')) + amount * weight
+
+                # Earnings are compared both ways; deductions only where configs drive
+                # them (TDS and other computed lines are redone by the next run)
+                keys = set(replayed) | {key for key in stored_components if key[0] == 'Earning'}
+                period = f"{payroll.month}/{payroll.year}"
+                period_deltas = {}
+                earned = -settled.get((employee.id, period), Decimal('0.00'))
+                for key in sorted(keys):
+                    delta = (
+                        replayed.get(key, Decimal('0.00')) - stored_components.get(key, Decimal('0.00'))
+                    ).quantize(Decimal('0.01'))
+                    if delta:
+                        period_deltas[f"{key[0]}: {key[1]}"] = str(delta)
+                        if key[0] == 'Earning':
+                            earned += delta
+                if period_deltas and earned:
+                    breakdown[period] = period_deltas
+                    total += earned
+
+            if total > 0:
+                yield {'employee': employee, 'amount': total, 'breakdown': breakdown}
+
+
+def create_arrears(effective_from, employees=None, salaries=None, created_by=None):
+    """Computes arrears and stores them as pending Arrear rows. Returns the rows created."""
+    allowance_type = arrears_allowance_type()
+    arrears = [
+        Arrear(
+            employee=result['employee'],
+            allowance_type=allowance_type,
+            effective_from=effective_from,
+            amount=result['amount'],
+            breakdown=result['breakdown'],
+            created_by=created_by,
+        )
+        for result in compute_arrears(effective_from, employees, salaries)
+    ]
+    with transaction.atomic():
+        return Arrear.objects.bulk_create(arrears, batch_size=1000)
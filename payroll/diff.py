@@ -0,0 +1,181 @@
+"""
+Per-employee comparison of two payroll runs.
+
+Both runs are streamed in employee_id order (payslips plus their allowance and
+deduction lines) and merge-joined, so memory stays flat no matter how many
+employees are on the payroll. Results are paged by employee_id (keyset
+pagination): pass the last employee_id of a page as ``after`` to get the next.
+"""
+from decimal import Decimal
+
+from .models import Payslip, PayslipAllowance, PayslipDeduction
+
+# Rows fetched per round trip while streaming
+CHUNK_SIZE = 2000
+
+AMOUNT_FIELDS = (
+    ('base_salary', 'Base Salary'),
+    ('gross_salary', 'Gross Salary'),
+    ('total_deductions', 'Deductions'),
+    ('net_salary', 'Net Salary'),
+)
+
+_END = object()
+
+
+class _Peekable:
+    """Iterator wrapper that lets the merge look at the next row without consuming it"""
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self._next = next(self._it, _END)
+
+    def peek(self):
+        return self._next
+
+    def pop(self):
+        row = self._next
+        self._next = next(self._it, _END)
+        return row
+
+
+def _take_lines(lines, employee_id):
+    """Consumes and sums every (employee_id, name, amount) line for one employee"""
+    totals = {}
+    row = lines.peek()
+    while row is not _END and row[0] == employee_id:
+        totals[row[1]] = totals.get(row[1], Decimal('0.00')) + row[2]
+        lines.pop()
+        row = lines.peek()
+    return totals
+
+
+def _stream_run(payroll, after):
+    """Yields one snapshot dict per payslip of the run, in employee_id order"""
+    payslips = Payslip.objects.filter(
+        payroll=payroll, employee_id__gt=after
+    ).order_by('employee_id').values_list(
+        'employee_id', 'employee__user__first_name', 'employee__user__last_name',
+        'employee__user__username', *[field for field, _ in AMOUNT_FIELDS]
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+    allowances = _Peekable(PayslipAllowance.objects.filter(
+        payslip__payroll=payroll, payslip__employee_id__gt=after
+    ).order_by('payslip__employee_id').values_list(
+        'payslip__employee_id', 'allowance_type__name', 'amount'
+    ).iterator(chunk_size=CHUNK_SIZE))
+
+    deductions = _Peekable(PayslipDeduction.objects.filter(
+        payslip__payroll=payroll, payslip__employee_id__gt=after
+    ).order_by('payslip__employee_id').values_list(
+        'payslip__employee_id', 'deduction_type__name', 'amount'
+    ).iterator(chunk_size=CHUNK_SIZE))
+
+    for employee_id, first_name, last_name, username, *amounts in payslips:
+        yield {
+            'employee_id': employee_id,
+            'employee_name': f"{first_name} {last_name}".strip() or username,
+            'amounts': dict(zip((field for field, _ in AMOUNT_FIELDS), amounts)),
+            'allowances': _take_lines(allowances, employee_id),
+            'deductions': _take_lines(deductions, employee_id),
+        }
+
+
+def _diff_lines(kind, old_lines, new_lines):
+    changes = []
+    for name in sorted(old_lines.keys() | new_lines.keys()):
+        old = old_lines.get(name)
+        new = new_lines.get(name)
+        if old == new:
+            continue
+        if old is None:
+            change = 'ADDED'
+        elif new is None:
+            change = 'REMOVED'
+        else:
+            change = 'CHANGED'
+        changes.append({
+            'kind': kind,
+            'name': name,
+            'change': change,
+            'old': old,
+            'new': new,
+            'delta': (new or Decimal('0.00')) - (old or Decimal('0.00')),
+        })
+    return changes
+
+
+def _diff_employee(old, new):
+    """Returns the diff record for one employee, or None if nothing changed"""
+    current = new or old
+    old_amounts = old['amounts'] if old else {}
+    new_amounts = new['amounts'] if new else {}
+
+    fields = []
+    for field, label in AMOUNT_FIELDS:
+        old_value = old_amounts.get(field)
+        new_value = new_amounts.get(field)
+        if old_value != new_value:
+            fields.append({
+                'field': field,
+                'label': label,
+                'old': old_value,
+                'new': new_value,
+                'delta': (new_value or Decimal('0.00')) - (old_value or Decimal('0.00')),
+            })
+
+    line_items = (
+        _diff_lines('Allowance', old['allowances'] if old else {}, new['allowances'] if new else {})
+        + _diff_lines('Deduction', old['deductions'] if old else {}, new['deductions'] if new else {})
+    )
+
+    if old is None:
+        change = 'JOINED'
+    elif new is None:
+        change = 'LEFT'
+    elif fields or line_items:
+        change = 'CHANGED'
+    else:
+        return None
+
+    return {
+        'employee_id': current['employee_id'],
+        'employee_name': current['employee_name'],
+        'change': change,
+        'fields': fields,
+        'line_items': line_items,
+    }
+
+
+def diff_payrolls(old_payroll, new_payroll, after=0):
+    """
+    Yields a diff record for every employee whose payslip differs between the
+    two runs (joiners and leavers included), in employee_id order.
+    """
+    old_rows = _Peekable(_stream_run(old_payroll, after))
+    new_rows = _Peekable(_stream_run(new_payroll, after))
+
+    while old_rows.peek() is not _END or new_rows.peek() is not _END:
+        old = old_rows.peek()
+        new = new_rows.peek()
+        if new is _END or (old is not _END and old['employee_id'] < new['employee_id']):
+            record = _diff_employee(old_rows.pop(), None)
+        elif old is _END or new['employee_id'] < old['employee_id']:
+            record = _diff_employee(None, new_rows.pop())
+        else:
+            record = _diff_employee(old_rows.pop(), new_rows.pop())
+        if record is not None:
+            yield record
+
+
+def diff_page(old_payroll, new_payroll, after=0, page_size=50):
+    """
+    Returns (records, next_after) for one page of the diff.
+    next_after is None on the last page.
+    """
+    records = []
+    for record in diff_payrolls(old_payroll, new_payroll, after=after):
+        if len(records) == page_size:
+            return records, records[-1]['employee_id']
+        records.append(record)
+    return records, None
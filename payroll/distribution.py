@@ -0,0 +1,242 @@
+"""
+Emailing payslips to employees.
+
+Approving a run queues one ``PayslipDelivery`` per payslip; reopening it
+cancels whatever hasn't gone out yet. Workers (``manage.py
+send_payslip_emails``) claim due deliveries a batch at a time with a
+compare-and-set lease, so several workers can drain the queue without
+sending a payslip twice. Each batch is sent over one connection, paced by
+a token bucket, and its outcome is written back in a single bulk UPDATE.
+Transient failures are retried with exponential backoff; refused
+recipients fail straight away.
+
+Any Django email backend works, so the locmem and file backends (or a
+local SMTP stand-in) can be used to exercise the whole path.
+"""
+import smtplib
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Payslip, PayslipDelivery
+
+# Payslips queued per INSERT batch when a run is approved
+ENQUEUE_CHUNK_SIZE = 5000
+
+# Only these runs' payslips are sent; a reopened run's queue is cancelled
+DELIVERABLE_STATUSES = ('APPROVED', 'PAID')
+
+# How long a worker owns a claimed batch before others may take it over
+CLAIM_LEASE = timedelta(minutes=10)
+
+# Longest wait between retries of one delivery
+MAX_BACKOFF = timedelta(hours=6)
+
+
+def batch_size():
+    return getattr(settings, 'PAYROLL_EMAIL_BATCH_SIZE', 200)
+
+
+def rate_per_minute():
+    return getattr(settings, 'PAYROLL_EMAIL_RATE_PER_MINUTE', 3000)
+
+
+def max_attempts():
+    return getattr(settings, 'PAYROLL_EMAIL_MAX_ATTEMPTS', 5)
+
+
+def retry_backoff():
+    return timedelta(seconds=getattr(settings, 'PAYROLL_EMAIL_RETRY_BACKOFF', 60))
+
+
+def enqueue_payroll(payroll):
+    """
+    Queues a delivery for every payslip of an approved run. Payslips already sent
+    (a reopened and re-approved run) are queued again so the corrected payslip goes
+    out. Returns the number queued.
+    """
+    now = timezone.now()
+    queued = PayslipDelivery.objects.filter(payroll=payroll).update(
+        status='PENDING', attempts=0, next_attempt_at=now, claimed_by='', claimed_until=None, last_error=''
+    )
+    last_id = 0
+    while True:
+        ids = list(Payslip.objects.filter(
+            payroll=payroll, id__gt=last_id, delivery__isnull=True
+        ).order_by('id').values_list('id', flat=True)[:ENQUEUE_CHUNK_SIZE])
+        if not ids:
+            return queued
+        last_id = ids[-1]
+        PayslipDelivery.objects.bulk_create([
+            PayslipDelivery(payslip_id=payslip_id, payroll_id=payroll.id, next_attempt_at=now)
+            for payslip_id in ids
+        ], batch_size=1000)
+        queued += len(ids)
+
+
+def cancel_payroll(payroll):
+    """Drops a reopened run's unsent deliveries; sent ones stay as a record"""
+    return PayslipDelivery.objects.filter(payroll=payroll).exclude(status='SENT').delete()[0]
+
+
+def claim_batch(size, now=None):
+    """
+    Claims up to size due deliveries for this worker. Returns (token, deliveries)
+    with the payslips, employees and line items loaded in four queries.
+    """
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    due = PayslipDelivery.objects.filter(
+        status='PENDING', next_attempt_at__lte=now, payroll__status__in=DELIVERABLE_STATUSES
+    ).filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:size])
+    if not ids:
+        return token, []
+    # Compare-and-set: rows another worker claimed in between are left out
+    due.filter(id__in=ids).update(claimed_by=token, claimed_until=now + CLAIM_LEASE)
+    deliveries = list(
+        PayslipDelivery.objects.filter(claimed_by=token).select_related(
+            'payslip__employee__user', 'payroll__pay_group'
+        ).prefetch_related(
+            'payslip__allowances__allowance_type', 'payslip__deductions__deduction_type'
+        ).order_by('id')
+    )
+    return token, deliveries
+
+
+class RateLimiter:
+    """Token bucket allowing per_minute sends, in bursts of up to a second's worth"""
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.rate = per_minute / 60 if per_minute else None
+        self.capacity = max(1.0, self.rate or 0)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+
+    def wait(self):
+        if self.rate is None:
+            return
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            delay = (1 - self.tokens) / self.rate
+            self.sleep(delay)
+            self.updated += delay
+            self.tokens = 1
+        self.tokens -= 1
+
+
+def build_message(delivery, connection=None):
+    payslip = delivery.payslip
+    user = payslip.employee.user
+    period = date(delivery.payroll.year, delivery.payroll.month, 1)
+    context = {
+        'payslip': payslip,
+        'payroll': delivery.payroll,
+        'employee': payslip.employee,
+        'name': user.first_name or user.username,
+        'period': period,
+        'allowances': payslip.allowances.all(),
+        'deductions': payslip.deductions.all(),
+    }
+    message = EmailMultiAlternatives(
+        subject=f"Your payslip for {period:%B %Y}",
+        body=render_to_string('payroll/email/payslip.txt', context),
+        from_email=getattr(settings, 'PAYROLL_EMAIL_FROM', None) or settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+        connection=connection,
+    )
+    message.attach_alternative(render_to_string('payroll/email/payslip.html', context), 'text/html')
+    return message
+
+
+def _is_permanent(exc):
+    """Errors a retry won't fix: the server refused the address or rejected the message outright"""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(exc, smtplib.SMTPDataError) and 500 <= exc.smtp_code < 600
+
+
+def send_batch(deliveries, connection, limiter, now=None):
+    """
+    Sends claimed deliveries over one open connection and records the outcome of
+    each. Returns {'sent': n, 'retrying': n, 'failed': n, 'skipped': n}.
+    """
+    counts = {'sent': 0, 'retrying': 0, 'failed': 0, 'skipped': 0}
+    if not deliveries:
+        return counts
+    # Opened lazily inside the loop, so a server that is down fails the batch's
+    # deliveries into retry rather than leaving them claimed
+    reconnect = True
+    try:
+        for delivery in deliveries:
+            delivery.email = delivery.payslip.employee.user.email
+            delivery.claimed_by = ''
+            delivery.claimed_until = None
+            if not delivery.email:
+                delivery.status = 'SKIPPED'
+                delivery.last_error = 'Employee has no email address.'
+                counts['skipped'] += 1
+                continue
+
+            limiter.wait()
+            delivery.attempts += 1
+            try:
+                if reconnect:
+                    # First message, or the server may have dropped us after an error
+                    connection.close()
+                    connection.open()
+                    reconnect = False
+                if not connection.send_messages([build_message(delivery, connection)]):
+                    raise smtplib.SMTPException('The backend did not accept the message.')
+            except Exception as exc:
+                reconnect = True
+                delivery.last_error = f"{type(exc).__name__}: {exc}"
+                if _is_permanent(exc) or delivery.attempts >= max_attempts():
+                    delivery.status = 'FAILED'
+                    counts['failed'] += 1
+                else:
+                    delay = min(retry_backoff() * 2 ** (delivery.attempts - 1), MAX_BACKOFF)
+                    delivery.next_attempt_at = (now or timezone.now()) + delay
+                    counts['retrying'] += 1
+            else:
+                delivery.status = 'SENT'
+                delivery.sent_at = now or timezone.now()
+                delivery.last_error = ''
+                counts['sent'] += 1
+    finally:
+        connection.close()
+
+    PayslipDelivery.objects.bulk_update(deliveries, [
+        'email', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error', 'claimed_by', 'claimed_until'
+    ], batch_size=500)
+    return counts
+
+
+def process_queue(size=None, per_minute=None, max_batches=None, backend=None):
+    """
+    Works off due deliveries batch by batch until none are left (or max_batches
+    have run). Each batch gets one connection. Returns the summed counts.
+    """
+    size = size or batch_size()
+    limiter = RateLimiter(rate_per_minute() if per_minute is None else per_minute)
+    backend = backend or getattr(settings, 'PAYROLL_EMAIL_BACKEND', None)
+    totals = {'batches': 0, 'sent': 0, 'retrying': 0, 'failed': 0, 'skipped': 0}
+    while max_batches is None or totals['batches'] < max_batches:
+        _, deliveries = claim_batch(size)
+        if not deliveries:
+            break
+        counts = send_batch(deliveries, get_connection(backend), limiter)
+        totals['batches'] += 1
+        for key, value in counts.items():
+            totals[key] += value
+    return totals
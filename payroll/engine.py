@@ -0,0 +1,536 @@
+"""
+Payroll calculation engine.
+
+Employees are processed in chunks. Each chunk loads its allowance and
+deduction configs in two queries, computes payslips in memory and, for a
+real run, bulk-inserts them. ``validate_payroll`` runs the same calculation
+as a dry run: nothing is written, problems are yielded as they are found.
+
+Mid-month joiners and configs whose effective dates fall inside the period
+are prorated by day through a ``PeriodCalendar`` built once per run, and
+TDS is added per chunk by a ``TDSCalculator`` (see payroll.tax). Pending
+arrears (see payroll.arrears) are paid as one allowance line per employee.
+Employees whose gross is above ``PAYROLL_ESI_WAGE_CEILING`` are not covered
+by ESI, so their ESI deduction is dropped (see payroll.statutory).
+
+``run_payroll`` writes a whole month in one transaction. For large
+workforces ``run_payroll_checkpointed`` commits each chunk separately with a
+checkpoint on the Payroll row, so an interrupted run resumes from the last
+committed chunk; the run stays DRAFT until its totals are finalized.
+
+Runs record per-phase timings and counters on the Payroll (payroll.telemetry).
+
+Base salaries come from ``SalaryRevision`` as of the first day of the period,
+or the joining day for a mid-period joiner, one query per chunk; a revision
+taking effect mid-period is settled through arrears.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from employees.models import Employee, SalaryRevision
+from .models import (
+    Arrear, Payroll, Payslip, PayslipAllowance, PayslipDeduction,
+    EmployeeAllowanceConfig, EmployeeDeductionConfig
+)
+from .proration import CALENDAR_DAYS, PeriodCalendar
+from .tax import TDSCalculator
+from .telemetry import RunTelemetry, count_rows, phase
+
+# Employees computed (and inserted) per batch
+CHUNK_SIZE = 1000
+
+# Net salary moving more than this fraction vs last month is flagged in dry runs
+OUTLIER_THRESHOLD = Decimal('0.25')
+
+CENTS = Decimal('0.01')
+
+
+def period_calendar(month, year):
+    return PeriodCalendar(year, month, getattr(settings, 'PAYROLL_PRORATION_BASIS', CALENDAR_DAYS))
+
+
+def payable_employees(calendar, pay_group=None):
+    """
+    Employees on the pay group's payroll for the period (anyone who joined by its
+    last day). Groups share no employees, so their runs never touch the same rows.
+    """
+    employees = Employee.objects.filter(date_of_joining__lte=calendar.end)
+    if pay_group is None:
+        return employees.filter(pay_group__isnull=True)
+    return employees.filter(pay_group=pay_group)
+
+
+def iter_employee_chunks(employees=None, chunk_size=CHUNK_SIZE):
+    """Yields lists of employees in id order using keyset pagination"""
+    if employees is None:
+        employees = Employee.objects.all()
+    employees = employees.select_related('user', 'job_role', 'bank_details').order_by('id')
+    last_id = 0
+    while True:
+        with phase('load'):
+            chunk = list(employees.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def apply_salary_history(employees, date):
+    """
+    Sets each employee's salary_base (in memory) to the salary in force on date,
+    or on their joining day if that is later (a joiner's first revision is dated
+    then), in one query. Employees with no revision by then keep their current salary.
+    """
+    as_of = {employee.id: max(date, employee.date_of_joining) for employee in employees}
+    if not as_of:
+        return
+    salaries = {}
+    for employee_id, effective_from, salary_base in SalaryRevision.objects.filter(
+        employee_id__in=as_of, effective_from__lte=max(as_of.values())
+    ).values_list('employee_id', 'effective_from', 'salary_base').order_by('employee_id', 'effective_from'):
+        if effective_from <= as_of[employee_id]:
+            salaries[employee_id] = salary_base
+    for employee in employees:
+        if employee.id in salaries:
+            employee.salary_base = salaries[employee.id]
+
+
+def _effective_during(start, end):
+    """Configs whose effective window overlaps [start, end]"""
+    return (
+        (Q(effective_from__isnull=True) | Q(effective_from__lte=end))
+        & (Q(effective_to__isnull=True) | Q(effective_to__gte=start))
+    )
+
+
+def load_configs(employee_ids, calendar):
+    """
+    Returns ({employee_id: [allowance configs]}, {employee_id: [deduction configs]})
+    for the active configs effective at any point in the period, in two queries.
+    """
+    allowance_configs = {}
+    deduction_configs = {}
+    with phase('load'):
+        for config in EmployeeAllowanceConfig.objects.filter(
+            _effective_during(calendar.start, calendar.end), employee_id__in=employee_ids, is_active=True
+        ).select_related('allowance_type').order_by():
+            allowance_configs.setdefault(config.employee_id, []).append(config)
+
+        for config in EmployeeDeductionConfig.objects.filter(
+            _effective_during(calendar.start, calendar.end), employee_id__in=employee_ids, is_active=True
+        ).select_related('deduction_type').order_by():
+            deduction_configs.setdefault(config.employee_id, []).append(config)
+
+    return allowance_configs, deduction_configs
+
+
+def config_amount(config, base_salary):
+    """Full-month amount a config contributes for the given base salary"""
+    if config.is_percentage_type():
+        # For deductions, percentage can be of base or gross
+        # Using base salary for now (can be changed to gross if needed)
+        amount = base_salary * (config.percentage / Decimal('100'))
+    else:
+        amount = config.amount or Decimal('0.00')
+    return amount.quantize(CENTS)
+
+
+def _config_line(config, type_name, employee, calendar):
+    """(amount, description) for a config, prorated to the days it applies this period"""
+    start = max(filter(None, [config.effective_from, employee.date_of_joining]))
+    amount = calendar.prorate(config_amount(config, employee.salary_base), start, config.effective_to)
+    description = type_name
+    if calendar.is_partial(start, config.effective_to):
+        description = f"{type_name} ({calendar.days_between(start, config.effective_to)}/{calendar.total_days} days)"
+    return amount, description
+
+
+def compute_payslip(employee, allowance_configs, deduction_configs, calendar):
+    """Computes one employee's payslip as a dict, without touching the database"""
+    # Joiners are paid from their joining date; percentages stay on the full
+    # monthly base and are prorated by the days each config applies
+    base_salary = calendar.prorate(employee.salary_base, employee.date_of_joining)
+
+    allowances = []
+    for config in allowance_configs:
+        amount, description = _config_line(config, config.allowance_type.name, employee, calendar)
+        allowances.append({
+            'allowance_type': config.allowance_type,
+            'amount': amount,
+            'description': description,
+        })
+
+    deductions = []
+    for config in deduction_configs:
+        amount, description = _config_line(config, config.deduction_type.name, employee, calendar)
+        deductions.append({
+            'deduction_type': config.deduction_type,
+            'amount': amount,
+            'description': description,
+        })
+
+    gross_salary = base_salary + sum((a['amount'] for a in allowances), Decimal('0.00'))
+    total_deductions = sum((d['amount'] for d in deductions), Decimal('0.00'))
+
+    draft = {
+        'employee': employee,
+        'base_salary': base_salary,
+        'gross_salary': gross_salary,
+        'total_deductions': total_deductions,
+        'net_salary': gross_salary - total_deductions,
+        'allowances': allowances,
+        'deductions': deductions,
+        'recurring_taxable': recurring_taxable(employee, allowance_configs, calendar),
+    }
+    apply_esi_ceiling(draft)
+    return draft
+
+
+def recurring_taxable(employee, allowance_configs, calendar):
+    """
+    Taxable pay for a full month from the next period on: the unprorated base and
+    the taxable allowances still in effect after this one. TDS projects this over
+    the rest of the year; one-off lines are counted only in the month they're paid.
+    """
+    return employee.salary_base + sum(
+        (
+            config_amount(config, employee.salary_base) for config in allowance_configs
+            if config.allowance_type.is_taxable and (config.effective_to is None or config.effective_to > calendar.end)
+        ),
+        Decimal('0.00')
+    )
+
+
+def apply_esi_ceiling(draft):
+    """Drops the ESI deduction from a draft whose gross is above the ESI wage ceiling"""
+    ceiling = Decimal(getattr(settings, 'PAYROLL_ESI_WAGE_CEILING', '21000'))
+    if draft['gross_salary'] <= ceiling:
+        return
+    name = getattr(settings, 'PAYROLL_ESI_DEDUCTION_TYPE', 'ESI')
+    dropped = sum((d['amount'] for d in draft['deductions'] if d['deduction_type'].name == name), Decimal('0.00'))
+    if not dropped:
+        return
+    draft['deductions'] = [d for d in draft['deductions'] if d['deduction_type'].name != name]
+    draft['total_deductions'] -= dropped
+    draft['net_salary'] += dropped
+
+
+def compute_chunk(employees, calendar, tds=None, configs=None):
+    """
+    Computes payslip dicts for a chunk of employees, in the same order.
+    configs may be passed in if the caller has already loaded them.
+    """
+    allowance_configs, deduction_configs = configs or load_configs([e.id for e in employees], calendar)
+    with phase('resolve'):
+        apply_salary_history(employees, calendar.start)
+    with phase('compute'):
+        drafts = [
+            compute_payslip(
+                employee,
+                allowance_configs.get(employee.id, []),
+                deduction_configs.get(employee.id, []),
+                calendar,
+            )
+            for employee in employees
+        ]
+    # Pending arrears and TDS need their own lookups (and TDS the final gross)
+    with phase('resolve'):
+        _add_pending_arrears(drafts)
+        if tds is not None:
+            tds.apply(drafts)
+    return drafts
+
+
+def _add_pending_arrears(drafts):
+    """Adds one arrears allowance line per employee with unpaid Arrear rows (one query)"""
+    pending = {}
+    for arrear in Arrear.objects.filter(
+        employee_id__in=[draft['employee'].id for draft in drafts], payroll__isnull=True
+    ).select_related('allowance_type').order_by():
+        pending.setdefault(arrear.employee_id, []).append(arrear)
+
+    for draft in drafts:
+        arrears = pending.get(draft['employee'].id)
+        if not arrears:
+            continue
+        amount = sum((arrear.amount for arrear in arrears), Decimal('0.00'))
+        draft['allowances'].append({
+            'allowance_type': arrears[0].allowance_type,
+            'amount': amount,
+            'description': f"{arrears[0].allowance_type.name} (from {min(a.effective_from for a in arrears):%d %b %Y})",
+        })
+        draft['gross_salary'] += amount
+        draft['net_salary'] += amount
+        draft['arrear_ids'] = [arrear.id for arrear in arrears]
+        # Back pay can lift the month's gross above the ESI ceiling
+        apply_esi_ceiling(draft)
+
+
+def write_chunk(payroll, drafts):
+    """Bulk-inserts computed payslips and their allowance/deduction lines"""
+    with phase('write'):
+        _write_chunk(payroll, drafts)
+
+
+def _write_chunk(payroll, drafts):
+    payslips = Payslip.objects.bulk_create([
+        Payslip(
+            payroll=payroll,
+            employee=draft['employee'],
+            base_salary=draft['base_salary'],
+            gross_salary=draft['gross_salary'],
+            total_deductions=draft['total_deductions'],
+            net_salary=draft['net_salary'],
+        )
+        for draft in drafts
+    ])
+
+    # Backends that can't return ids from a bulk insert (MySQL) need a lookup
+    if any(payslip.pk is None for payslip in payslips):
+        ids = dict(Payslip.objects.filter(
+            payroll=payroll, employee_id__in=[p.employee_id for p in payslips]
+        ).values_list('employee_id', 'id'))
+        for payslip in payslips:
+            payslip.pk = ids[payslip.employee_id]
+
+    allowances = PayslipAllowance.objects.bulk_create([
+        PayslipAllowance(payslip=payslip, **allowance)
+        for payslip, draft in zip(payslips, drafts)
+        for allowance in draft['allowances']
+    ])
+    deductions = PayslipDeduction.objects.bulk_create([
+        PayslipDeduction(payslip=payslip, **deduction)
+        for payslip, draft in zip(payslips, drafts)
+        for deduction in draft['deductions']
+    ])
+    count_rows('payslips', len(payslips))
+    count_rows('allowances', len(allowances))
+    count_rows('deductions', len(deductions))
+
+    arrear_ids = [arrear_id for draft in drafts for arrear_id in draft.get('arrear_ids', ())]
+    if arrear_ids:
+        Arrear.objects.filter(id__in=arrear_ids).update(payroll=payroll)
+
+
+def _profiling_enabled(profile):
+    return getattr(settings, 'PAYROLL_PROFILE_RUNS', False) if profile is None else profile
+
+
+def run_payroll(month, year, processed_by=None, notes='', profile=None, pay_group=None):
+    """
+    Computes and stores a pay group's payroll for a month in one transaction. Returns the Payroll.
+    profile=True (default: settings.PAYROLL_PROFILE_RUNS) also captures cProfile/tracemalloc.
+    """
+    with RunTelemetry(profile=_profiling_enabled(profile)) as telemetry:
+        payroll = _run_payroll(month, year, processed_by, notes, pay_group)
+    telemetry.save(payroll, mode='single', employees=payroll.employee_count)
+    return payroll
+
+
+def _run_payroll(month, year, processed_by, notes, pay_group):
+    calendar = period_calendar(month, year)
+    with phase('load'):
+        tds = TDSCalculator.for_period(month, year)
+
+    with transaction.atomic():
+        payroll = Payroll.objects.create(
+            pay_group=pay_group,
+            month=month,
+            year=year,
+            status='PROCESSED',
+            processed_by=processed_by,
+            notes=notes
+        )
+
+        total_gross = Decimal('0.00')
+        total_deductions = Decimal('0.00')
+        total_net = Decimal('0.00')
+        employee_count = 0
+
+        for employees in iter_employee_chunks(payable_employees(calendar, pay_group)):
+            drafts = compute_chunk(employees, calendar, tds)
+            write_chunk(payroll, drafts)
+            for draft in drafts:
+                total_gross += draft['gross_salary']
+                total_deductions += draft['total_deductions']
+                total_net += draft['net_salary']
+            employee_count += len(drafts)
+
+        with phase('totals'):
+            payroll.total_gross_salary = total_gross
+            payroll.total_deductions = total_deductions
+            payroll.total_net_salary = total_net
+            payroll.employee_count = employee_count
+            payroll.save()
+
+    return payroll
+
+
+def run_payroll_checkpointed(month, year, processed_by=None, notes='', profile=None, pay_group=None):
+    """
+    Runs a pay group's payroll for a month chunk by chunk, each chunk committed
+    with its checkpoint; resumes the period's unfinished run if there is one.
+    Returns the Payroll, PROCESSED once every chunk is in.
+    """
+    payroll = Payroll.for_group(pay_group).filter(
+        month=month, year=year, checkpoint_employee_id__isnull=False
+    ).first()
+    if payroll is None:
+        payroll = Payroll.objects.create(
+            pay_group=pay_group,
+            month=month,
+            year=year,
+            status='DRAFT',
+            processed_by=processed_by,
+            notes=notes,
+            checkpoint_employee_id=0,
+        )
+    return resume_payroll(payroll, profile)
+
+
+def resume_payroll(payroll, profile=None):
+    """Continues a checkpointed run after its last committed chunk, then finalizes it"""
+    resumed_from = payroll.checkpoint_employee_id
+    with RunTelemetry(profile=_profiling_enabled(profile)) as telemetry:
+        payroll = _resume_payroll(payroll)
+    telemetry.save(
+        payroll, mode='checkpointed', employees=payroll.employee_count, resumed_from=resumed_from or None
+    )
+    return payroll
+
+
+def _resume_payroll(payroll):
+    calendar = period_calendar(payroll.month, payroll.year)
+    with phase('load'):
+        tds = TDSCalculator.for_period(payroll.month, payroll.year)
+    checkpoint = payroll.checkpoint_employee_id
+
+    employees = payable_employees(calendar, payroll.pay_group).filter(id__gt=checkpoint)
+    for chunk in iter_employee_chunks(employees):
+        with transaction.atomic():
+            # Idempotent on (payroll, employee) even if a checkpoint was lost
+            with phase('load'):
+                done = set(Payslip.objects.filter(
+                    payroll=payroll, employee_id__in=[e.id for e in chunk]
+                ).values_list('employee_id', flat=True))
+            pending = [employee for employee in chunk if employee.id not in done]
+            if pending:
+                write_chunk(payroll, compute_chunk(pending, calendar, tds))
+
+            # Compare-and-set: a second worker resuming the same run fails here
+            # and rolls its chunk back
+            with phase('write'):
+                moved = Payroll.objects.filter(
+                    pk=payroll.pk, checkpoint_employee_id=checkpoint
+                ).update(checkpoint_employee_id=chunk[-1].id)
+            if not moved:
+                raise ValidationError(
+                    f"Payroll {payroll.month}/{payroll.year} is being processed by another run."
+                )
+            checkpoint = chunk[-1].id
+
+    with transaction.atomic(), phase('totals'):
+        totals = Payslip.objects.filter(payroll=payroll).aggregate(
+            gross=Sum('gross_salary'),
+            deductions=Sum('total_deductions'),
+            net=Sum('net_salary'),
+            count=Count('id'),
+        )
+        finalized = Payroll.objects.filter(pk=payroll.pk, checkpoint_employee_id=checkpoint).update(
+            status='PROCESSED',
+            checkpoint_employee_id=None,
+            total_gross_salary=totals['gross'] or Decimal('0.00'),
+            total_deductions=totals['deductions'] or Decimal('0.00'),
+            total_net_salary=totals['net'] or Decimal('0.00'),
+            employee_count=totals['count'],
+        )
+        if not finalized:
+            raise ValidationError(
+                f"Payroll {payroll.month}/{payroll.year} is being processed by another run."
+            )
+    payroll.refresh_from_db()
+    return payroll
+
+
+def _issue(severity, code, message, employee=None):
+    return {
+        'severity': severity,
+        'code': code,
+        'employee_id': employee.id if employee else None,
+        'employee_name': (employee.user.get_full_name() or employee.user.username) if employee else '',
+        'message': message,
+    }
+
+
+def _config_issues(employee, configs, kind):
+    for config in configs:
+        type_name = getattr(config, f'{kind}_type').name
+        if config.amount and config.percentage:
+            yield _issue(
+                'ERROR', 'CONFIG_BOTH_SET',
+                f"{kind.title()} '{type_name}' has both an amount and a percentage; the percentage will be used.",
+                employee
+            )
+        elif not config.amount and not config.percentage:
+            yield _issue(
+                'WARNING', 'CONFIG_EMPTY',
+                f"{kind.title()} '{type_name}' has neither an amount nor a percentage and contributes nothing.",
+                employee
+            )
+
+
+def validate_payroll(month, year, pay_group=None):
+    """
+    Dry run: computes a pay group's payroll for a month without writing anything
+    and yields issue dicts (severity, code, employee_id, employee_name, message).
+    """
+    calendar = period_calendar(month, year)
+
+    if Payroll.for_group(pay_group).filter(month=month, year=year).exists():
+        yield _issue('ERROR', 'PAYROLL_EXISTS', f"Payroll for {month}/{year} already exists.")
+
+    previous = Payroll(pay_group=pay_group, month=month, year=year).previous()
+    tds = TDSCalculator.for_period(month, year)
+
+    for employees in iter_employee_chunks(payable_employees(calendar, pay_group)):
+        allowance_configs, deduction_configs = load_configs([e.id for e in employees], calendar)
+        drafts = compute_chunk(employees, calendar, tds, (allowance_configs, deduction_configs))
+        previous_net = {}
+        if previous:
+            previous_net = dict(Payslip.objects.filter(
+                payroll=previous, employee_id__in=[e.id for e in employees]
+            ).values_list('employee_id', 'net_salary'))
+
+        for employee, draft in zip(employees, drafts):
+            employee_allowances = allowance_configs.get(employee.id, [])
+            employee_deductions = deduction_configs.get(employee.id, [])
+
+            if draft['net_salary'] < 0:
+                yield _issue(
+                    'ERROR', 'NEGATIVE_NET',
+                    f"Deductions (₹{draft['total_deductions']:,.2f}) exceed gross salary "
+                    f"(₹{draft['gross_salary']:,.2f}); net would be ₹{draft['net_salary']:,.2f}.",
+                    employee
+                )
+
+            yield from _config_issues(employee, employee_allowances, 'allowance')
+            yield from _config_issues(employee, employee_deductions, 'deduction')
+
+            bank_details = employee.bank_details
+            if not bank_details.account_number or not bank_details.bank_name:
+                yield _issue('ERROR', 'MISSING_BANK_DETAILS', "Bank account number or bank name is missing.", employee)
+            elif not bank_details.ifsc_code:
+                yield _issue('WARNING', 'MISSING_IFSC', "IFSC code is missing.", employee)
+
+            last_net = previous_net.get(employee.id)
+            if last_net and abs(draft['net_salary'] - last_net) > abs(last_net) * OUTLIER_THRESHOLD:
+                yield _issue(
+                    'WARNING', 'NET_OUTLIER',
+                    f"Net salary changes from ₹{last_net:,.2f} to ₹{draft['net_salary']:,.2f} "
+                    f"since {previous.month}/{previous.year}.",
+                    employee
+                )
@@ -1,4 +1,5 @@
 from django import forms
+from employees.models import PayGroup
 from .models import Payroll
 
 
@@ -22,6 +23,14 @@ class ProcessPayrollForm(forms.Form):
             'placeholder': 'Year (e.g., 2024)'
         })
     )
+    pay_group = forms.ModelChoiceField(
+        queryset=PayGroup.objects.all(),
+        required=False,
+        empty_label='Default pay group',
+        widget=forms.Select(attrs={
+            'class': 'select select-bordered w-full'
+        })
+    )
     notes = forms.CharField(
         required=False,
         widget=forms.Textarea(attrs={
@@ -0,0 +1,199 @@
+"""
+Payroll integrity checks.
+
+Every stored total should be derivable from the rows beneath it:
+
+* a payroll's totals and employee count are the sums of its payslips;
+* a payslip's gross is its base plus its allowance lines, its deductions
+  the sum of its deduction lines, and its net gross less deductions;
+* the YTD ledger holds, per employee and financial year, the sums of the
+  payslips of approved and paid payrolls (see payroll.ytd).
+
+The payroll and payslip checks are one grouped query each, with the
+comparison in the WHERE/HAVING clause so only mismatches leave the
+database. The ledger is checked per financial year from three grouped
+queries compared against the ledger rows as they stream in. ``verify()``
+yields discrepancies as they are found (``manage.py verify_payroll``).
+"""
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Payroll, Payslip, PayslipAllowance, PayslipDeduction, YTDBalance
+from .ytd import COUNTED_STATUSES, financial_year_for
+
+# Half a cent: amounts are stored to the cent, but SQLite sums them as floats
+TOLERANCE = Decimal('0.005')
+
+ZERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+class Discrepancy(NamedTuple):
+    check: str
+    subject: str
+    field: str
+    expected: Decimal
+    actual: Decimal
+    payroll_id: Optional[int] = None
+
+    def __str__(self):
+        return f"[{self.check}] {self.subject}: {self.field} is {self.actual}, expected {self.expected}"
+
+
+def _difference(left, right):
+    return ExpressionWrapper(left - right, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _mismatch(name):
+    return Q(**{f'{name}__gt': TOLERANCE}) | Q(**{f'{name}__lt': -TOLERANCE})
+
+
+def _period(month, year):
+    return f"{month:02d}/{year}"
+
+
+def _cents(amount):
+    return Decimal(amount).quantize(Decimal('0.01'))
+
+
+def check_payroll_totals(payrolls):
+    """Stored totals and employee counts against their payslips, one GROUP BY over payrolls"""
+    # Runs still being processed only have totals once they finish
+    rows = payrolls.filter(checkpoint_employee_id__isnull=True).values(
+        'id', 'month', 'year', 'employee_count', 'total_gross_salary', 'total_deductions', 'total_net_salary'
+    ).annotate(
+        slip_gross=Coalesce(Sum('payslips__gross_salary'), ZERO),
+        slip_deductions=Coalesce(Sum('payslips__total_deductions'), ZERO),
+        slip_net=Coalesce(Sum('payslips__net_salary'), ZERO),
+        slip_count=Count('payslips'),
+    ).annotate(
+        gross_diff=_difference(F('total_gross_salary'), F('slip_gross')),
+        deductions_diff=_difference(F('total_deductions'), F('slip_deductions')),
+        net_diff=_difference(F('total_net_salary'), F('slip_net')),
+    ).filter(
+        _mismatch('gross_diff') | _mismatch('deductions_diff') | _mismatch('net_diff')
+        | ~Q(employee_count=F('slip_count'))
+    ).values_list(
+        'id', 'month', 'year', 'employee_count', 'slip_count',
+        'total_gross_salary', 'slip_gross', 'total_deductions', 'slip_deductions',
+        'total_net_salary', 'slip_net',
+    ).order_by('year', 'month', 'id')
+
+    for (payroll_id, month, year, count, slip_count, gross, slip_gross,
+         deductions, slip_deductions, net, slip_net) in rows.iterator():
+        subject = f"Payroll {payroll_id} ({_period(month, year)})"
+        if count != slip_count:
+            yield Discrepancy('payroll_totals', subject, 'employee_count', slip_count, count, payroll_id)
+        for field, actual, expected in (
+            ('total_gross_salary', gross, slip_gross),
+            ('total_deductions', deductions, slip_deductions),
+            ('total_net_salary', net, slip_net),
+        ):
+            if abs(Decimal(actual) - Decimal(expected)) > TOLERANCE:
+                yield Discrepancy('payroll_totals', subject, field, _cents(expected), actual, payroll_id)
+
+
+def _payslip_rows(payslips, check, field, expected, diff):
+    columns = ('id', 'payroll_id', 'payroll__month', 'payroll__year', 'employee_id', field)
+    rows = payslips.values(*columns).annotate(expected=expected).annotate(diff=diff).filter(
+        _mismatch('diff')
+    ).values_list(*columns, 'expected').order_by('payroll_id', 'id')
+    for payslip_id, payroll_id, month, year, employee_id, actual, expected_amount in rows.iterator():
+        subject = f"Payslip {payslip_id} (payroll {payroll_id}, {_period(month, year)}, employee {employee_id})"
+        yield Discrepancy(check, subject, field, _cents(expected_amount), actual, payroll_id)
+
+
+def check_payslips(payslips):
+    """Gross, deductions and net of each payslip against its lines, one query per invariant"""
+    yield from _payslip_rows(
+        payslips, 'payslip_gross', 'gross_salary',
+        F('base_salary') + Coalesce(Sum('allowances__amount'), ZERO),
+        _difference(F('gross_salary'), F('expected')),
+    )
+    yield from _payslip_rows(
+        payslips, 'payslip_deductions', 'total_deductions',
+        Coalesce(Sum('deductions__amount'), ZERO),
+        _difference(F('total_deductions'), F('expected')),
+    )
+    yield from _payslip_rows(
+        payslips, 'payslip_net', 'net_salary',
+        _difference(F('gross_salary'), F('total_deductions')),
+        _difference(F('net_salary'), F('expected')),
+    )
+
+
+def _counted_payroll_ids(financial_year):
+    return [
+        payroll_id for payroll_id, month, year in Payroll.objects.filter(
+            year__in=[financial_year, financial_year + 1], status__in=COUNTED_STATUSES
+        ).values_list('id', 'month', 'year')
+        if financial_year_for(month, year) == financial_year
+    ]
+
+
+def _expected_ytd(payroll_ids):
+    """{(employee_id, component): amount} for a set of payrolls, from three grouped queries"""
+    expected = {}
+    for row in Payslip.objects.filter(payroll_id__in=payroll_ids).values('employee_id').annotate(
+        gross=Sum('gross_salary'), deductions=Sum('total_deductions'), net=Sum('net_salary')
+    ).order_by():
+        employee_id = row['employee_id']
+        expected[employee_id, YTDBalance.GROSS] = row['gross']
+        expected[employee_id, YTDBalance.TAXABLE] = row['gross']
+        expected[employee_id, YTDBalance.TOTAL_DEDUCTIONS] = row['deductions']
+        expected[employee_id, YTDBalance.NET] = row['net']
+
+    for employee_id, total in PayslipAllowance.objects.filter(
+        payslip__payroll_id__in=payroll_ids, allowance_type__is_taxable=False
+    ).values('payslip__employee_id').annotate(total=Sum('amount')).values_list(
+        'payslip__employee_id', 'total'
+    ).order_by():
+        expected[employee_id, YTDBalance.TAXABLE] -= total
+
+    for employee_id, deduction_type_id, total in PayslipDeduction.objects.filter(
+        payslip__payroll_id__in=payroll_ids
+    ).values('payslip__employee_id', 'deduction_type_id').annotate(total=Sum('amount')).values_list(
+        'payslip__employee_id', 'deduction_type_id', 'total'
+    ).order_by():
+        expected[employee_id, YTDBalance.deduction_component(deduction_type_id)] = total
+    return expected
+
+
+def check_ytd_ledger(financial_years=None):
+    """Ledger balances against the approved and paid payslips of each financial year"""
+    if financial_years is None:
+        financial_years = sorted(
+            {financial_year_for(month, year) for month, year in Payroll.objects.values_list('month', 'year').order_by().distinct()}
+            | set(YTDBalance.objects.values_list('financial_year', flat=True).order_by().distinct())
+        )
+    for financial_year in financial_years:
+        label = f"FY {financial_year}-{str(financial_year + 1)[-2:]}"
+        expected = _expected_ytd(_counted_payroll_ids(financial_year))
+        for employee_id, component, amount in YTDBalance.objects.filter(
+            financial_year=financial_year
+        ).values_list('employee_id', 'component', 'amount').order_by('employee_id', 'component').iterator():
+            target = expected.pop((employee_id, component), Decimal('0.00'))
+            if abs(Decimal(amount) - Decimal(target)) > TOLERANCE:
+                yield Discrepancy('ytd_ledger', f"{label}, employee {employee_id}", component, _cents(target), amount)
+        # Whatever is left has payslips but no ledger row
+        for (employee_id, component), target in sorted(expected.items(), key=lambda item: item[0]):
+            if abs(Decimal(target)) > TOLERANCE:
+                yield Discrepancy(
+                    'ytd_ledger', f"{label}, employee {employee_id}", component, _cents(target), Decimal('0.00')
+                )
+
+
+def verify(payrolls=None, ytd=True):
+    """
+    Yields every Discrepancy, one check after another. ``payrolls`` limits the
+    payroll and payslip checks to a queryset; the YTD ledger spans payrolls,
+    so it's checked across all financial years (pass ytd=False to skip it).
+    """
+    if payrolls is None:
+        payrolls = Payroll.objects.all()
+    yield from check_payroll_totals(payrolls)
+    yield from check_payslips(Payslip.objects.filter(payroll__in=payrolls.values('id')))
+    if ytd:
+        yield from check_ytd_ledger()
@@ -0,0 +1,192 @@
+"""
+General-ledger journal for a payroll run.
+
+One journal entry per run, with a line per cost center (department),
+component and GL account: basic salary and allowances are debited to
+their expense accounts, deductions and net pay credited to their
+liability accounts. Each side is a grouped query over the run's payslips
+or payslip lines, grouped by department id, that resolves the account
+through GLMapping, so the database returns the lines already summed;
+department names are looked up once afterwards. The lines are checked
+before anything is exported: every component must be mapped, debits must equal
+credits, and both must agree with the run's stored totals.
+
+``export_csv()`` and ``export_json()`` stream a checked journal
+(``manage.py payroll_journal`` and the payroll page).
+"""
+import csv
+import json
+from calendar import monthrange
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import CharField, F, Sum, Value
+
+from employees.models import Department
+from .models import GLMapping, Payslip, PayslipAllowance, PayslipDeduction
+from .ytd import COUNTED_STATUSES
+
+ZERO = Decimal('0.00')
+
+UNASSIGNED = 'Unassigned'
+
+BASIC_SALARY = 'Basic salary'
+NET_PAY = 'Net pay'
+
+COLUMNS = ['account_code', 'account_name', 'cost_center', 'component', 'debit', 'credit']
+
+
+class JournalLine(NamedTuple):
+    account_code: str
+    account_name: str
+    cost_center: str
+    component: str
+    debit: Decimal
+    credit: Decimal
+
+
+def _rollup(queryset, employee, component, account, amount):
+    """
+    Sums amount per department id and component in one GROUP BY; the caller
+    names the cost centers afterwards. account is a GLAccount (or None) for the
+    fixed components, or the type whose GL mapping holds the account.
+    """
+    if isinstance(account, str):
+        code, name = F(f'{account}__gl_mapping__account__code'), F(f'{account}__gl_mapping__account__name')
+    else:
+        code = Value(account.code if account else None, output_field=CharField())
+        name = Value(account.name if account else None, output_field=CharField())
+    return queryset.values(
+        department_id=F(f'{employee}__job_role__department_id'), component=component,
+        account_code=code, account_name=name,
+    ).annotate(amount=Sum(amount)).order_by()
+
+
+def _cents(amount):
+    # SQLite sums decimals as floats
+    return Decimal(amount).quantize(Decimal('0.01'))
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer rows"""
+    def write(self, value):
+        return value
+
+
+class Journal:
+    """The checked journal entry for one approved or paid payroll run"""
+
+    def __init__(self, payroll):
+        if payroll.status not in COUNTED_STATUSES:
+            raise ValidationError(
+                f"Payroll {payroll.month}/{payroll.year} is {payroll.get_status_display()}; "
+                "journals are exported for approved or paid runs."
+            )
+        self.payroll = payroll
+        self.lines = self._build()
+        self.total_debit = sum((line.debit for line in self.lines), ZERO)
+        self.total_credit = sum((line.credit for line in self.lines), ZERO)
+        self._check()
+
+    @property
+    def reference(self):
+        group = f"{self.payroll.pay_group.code}-" if self.payroll.pay_group_id else ''
+        return f"PAYROLL-{group}{self.payroll.year}-{self.payroll.month:02d}"
+
+    @property
+    def posting_date(self):
+        return date(self.payroll.year, self.payroll.month, monthrange(self.payroll.year, self.payroll.month)[1])
+
+    def _build(self):
+        """The journal lines, debits then credits, ordered by cost center and component"""
+        fixed = {
+            mapping.component: mapping.account
+            for mapping in GLMapping.objects.filter(
+                component__in=[GLMapping.BASIC, GLMapping.NET_PAY]
+            ).select_related('account')
+        }
+        payslips = Payslip.objects.filter(payroll=self.payroll)
+        allowances = PayslipAllowance.objects.filter(payslip__payroll=self.payroll)
+        deductions = PayslipDeduction.objects.filter(payslip__payroll=self.payroll)
+        sides = [
+            ('debit', _rollup(payslips, 'employee', Value(BASIC_SALARY), fixed.get(GLMapping.BASIC), 'base_salary')),
+            ('debit', _rollup(allowances, 'payslip__employee', F('allowance_type__name'), 'allowance_type', 'amount')),
+            ('credit', _rollup(deductions, 'payslip__employee', F('deduction_type__name'), 'deduction_type', 'amount')),
+            ('credit', _rollup(payslips, 'employee', Value(NET_PAY), fixed.get(GLMapping.NET_PAY), 'net_salary')),
+        ]
+
+        # Grouping on the id keeps the GROUP BY off the departments table
+        departments = dict(Department.objects.values_list('id', 'name'))
+
+        self.unmapped = set()
+        lines = []
+        for side, rows in sides:
+            rows = list(rows)
+            for row in rows:
+                row['cost_center'] = departments.get(row['department_id']) or UNASSIGNED
+            rows.sort(key=lambda row: (row['cost_center'], row['component']))
+            for row in rows:
+                amount = _cents(row['amount'])
+                if not amount:
+                    continue
+                if row['account_code'] is None:
+                    self.unmapped.add(row['component'])
+                    continue
+                lines.append(JournalLine(
+                    account_code=row['account_code'],
+                    account_name=row['account_name'],
+                    cost_center=row['cost_center'],
+                    component=row['component'],
+                    debit=amount if side == 'debit' else ZERO,
+                    credit=amount if side == 'credit' else ZERO,
+                ))
+        return lines
+
+    def _check(self):
+        if self.unmapped:
+            names = ', '.join(sorted(self.unmapped))
+            raise ValidationError(f"No GL account mapped for: {names}. Add them under GL Mappings.")
+        if self.total_debit != self.total_credit:
+            raise ValidationError(
+                f"Journal {self.reference} does not balance: debits {self.total_debit}, credits {self.total_credit}."
+            )
+        payroll = self.payroll
+        if self.total_debit != payroll.total_gross_salary:
+            raise ValidationError(
+                f"Journal debits {self.total_debit} differ from the run's gross salary {payroll.total_gross_salary}; "
+                "run `manage.py verify_payroll`."
+            )
+        net_credit = sum((line.credit for line in self.lines if line.component == NET_PAY), ZERO)
+        if net_credit != payroll.total_net_salary:
+            raise ValidationError(
+                f"Journal net pay {net_credit} differs from the run's net salary {payroll.total_net_salary}; "
+                "run `manage.py verify_payroll`."
+            )
+
+    def export_csv(self):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(['reference', 'date', *COLUMNS])
+        for line in self.lines:
+            yield writer.writerow([self.reference, self.posting_date.isoformat(), *line])
+        yield writer.writerow([self.reference, self.posting_date.isoformat(), '', 'Total', '', '',
+                               self.total_debit, self.total_credit])
+
+    def export_json(self):
+        encoder = DjangoJSONEncoder()
+        yield '{"reference": %s, "date": %s, "lines": [' % (
+            encoder.encode(self.reference), encoder.encode(self.posting_date)
+        )
+        for index, line in enumerate(self.lines):
+            yield (',' if index else '') + '\n  ' + json.dumps(line._asdict(), cls=DjangoJSONEncoder)
+        yield '\n], "total_debit": %s, "total_credit": %s}\n' % (
+            encoder.encode(self.total_debit), encoder.encode(self.total_credit)
+        )
+
+
+EXPORTS = {
+    'csv': ('text/csv', Journal.export_csv),
+    'json': ('application/json', Journal.export_json),
+}
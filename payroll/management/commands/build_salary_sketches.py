@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from payroll.models import Payroll
+from payroll.sketches import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the salary distribution sketches of approved and paid payrolls, e.g. for runs "
+        "approved before sketches existed or after changing PAYROLL_SKETCH_ACCURACY"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, action='append', dest='years', help="Only this year (repeatable)")
+
+    def handle(self, *args, **options):
+        payrolls = Payroll.objects.all()
+        if options['years']:
+            payrolls = payrolls.filter(year__in=options['years'])
+        count = rebuild(payrolls)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sketches for {count} payroll(s)"))
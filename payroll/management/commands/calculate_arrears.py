@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.models import Employee
+from payroll.arrears import create_arrears
+
+
+class Command(BaseCommand):
+    help = "Calculate arrears for a back-dated salary revision; they are paid in the next payroll run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('effective_from', help="Date the revision took effect (YYYY-MM-DD)")
+        parser.add_argument(
+            '--employee', type=int, action='append', dest='employee_ids',
+            help="Employee id to include (repeatable). Defaults to employees with a salary revision on or after the date."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            effective_from = date.fromisoformat(options['effective_from'])
+        except ValueError:
+            raise CommandError("effective_from must be a date in YYYY-MM-DD format")
+
+        employees = None
+        if options['employee_ids']:
+            employees = Employee.objects.filter(id__in=options['employee_ids'])
+
+        arrears = create_arrears(effective_from, employees)
+        total = sum(arrear.amount for arrear in arrears)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created arrears for {len(arrears)} employee(s), total ₹{total:,.2f}"
+        ))
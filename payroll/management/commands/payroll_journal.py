@@ -0,0 +1,41 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.journal import EXPORTS, Journal
+from payroll.models import Payroll
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the general-ledger journal of an approved or paid payroll: one balanced "
+        "debit/credit line per cost center, component and GL account. Fails without writing "
+        "anything if a component is unmapped or the journal doesn't balance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('payroll_id', type=int)
+        parser.add_argument('--format', default='csv', choices=list(EXPORTS), help="Export format")
+        parser.add_argument('--output', help="File to write (defaults to stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            payroll = Payroll.objects.select_related('pay_group').get(id=options['payroll_id'])
+        except Payroll.DoesNotExist:
+            raise CommandError(f"Payroll {options['payroll_id']} does not exist.")
+
+        try:
+            journal = Journal(payroll)
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        export = EXPORTS[options['format']][1]
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(export(journal))
+            self.stderr.write(
+                f"Wrote {len(journal.lines)} lines to {options['output']}: "
+                f"debits {journal.total_debit}, credits {journal.total_credit}."
+            )
+        else:
+            for chunk in export(journal):
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from payroll.models import Payroll
+from payroll.ytd import current_financial_year, financial_year_for, rebuild_financial_year
+
+
+class Command(BaseCommand):
+    help = "Rebuild the YTD ledger from approved and paid payrolls"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--financial-year', type=int, action='append', dest='financial_years',
+            help="Starting year of the financial year to rebuild (e.g. 2024 for 2024-25). "
+                 "Repeatable. Defaults to the current financial year."
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Rebuild every financial year that has payrolls"
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            financial_years = sorted({
+                financial_year_for(month, year)
+                for month, year in Payroll.objects.values_list('month', 'year')
+            })
+        else:
+            financial_years = options['financial_years'] or [current_financial_year()]
+
+        for financial_year in financial_years:
+            payrolls = rebuild_financial_year(financial_year)
+            self.stdout.write(self.style.SUCCESS(
+                f"FY {financial_year}-{str(financial_year + 1)[-2:]}: rebuilt from {len(payrolls)} payroll(s)"
+            ))
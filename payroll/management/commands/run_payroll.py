@@ -0,0 +1,53 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.models import PayGroup
+from payroll.engine import run_payroll_checkpointed
+from payroll.models import Payroll
+
+
+class Command(BaseCommand):
+    help = "Process a month's payroll in committed chunks, resuming an interrupted run for the period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', type=int, help="Month (1-12)")
+        parser.add_argument('year', type=int, help="Year (e.g. 2025)")
+        parser.add_argument('--notes', default='', help="Notes stored on a newly started run")
+        parser.add_argument(
+            '--pay-group', dest='pay_group',
+            help="Code of the entity/pay group to run (default: employees without a pay group)"
+        )
+        parser.add_argument(
+            '--profile', action='store_true',
+            help="Capture cProfile and tracemalloc output for the run (stored as a PayrollRunProfile)"
+        )
+
+    def handle(self, *args, **options):
+        month, year = options['month'], options['year']
+        if not 1 <= month <= 12:
+            raise CommandError("month must be between 1 and 12")
+
+        pay_group = None
+        if options['pay_group']:
+            pay_group = PayGroup.objects.filter(code=options['pay_group']).first()
+            if pay_group is None:
+                raise CommandError(f"Unknown pay group '{options['pay_group']}'")
+
+        existing = Payroll.for_group(pay_group).filter(month=month, year=year).first()
+        if existing and not existing.is_in_progress:
+            raise CommandError(f"Payroll for {month}/{year} already exists.")
+        if existing:
+            self.stdout.write(f"Resuming after employee #{existing.checkpoint_employee_id}")
+
+        try:
+            payroll = run_payroll_checkpointed(
+                month, year, notes=options['notes'], profile=options['profile'] or None, pay_group=pay_group
+            )
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Payroll for {month}/{year} processed: {payroll.employee_count} employees, "
+            f"net ₹{payroll.total_net_salary:,.2f} in {payroll.telemetry['seconds']:.1f}s, "
+            f"{payroll.telemetry['queries']} queries"
+        ))
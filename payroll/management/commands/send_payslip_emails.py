@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payroll.distribution import process_queue
+
+
+class Command(BaseCommand):
+    help = "Email queued payslips of approved payrolls, one connection per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            help="Messages claimed and sent per connection (default: PAYROLL_EMAIL_BATCH_SIZE)"
+        )
+        parser.add_argument(
+            '--rate', type=int,
+            help="Maximum sends per minute, 0 for unlimited (default: PAYROLL_EMAIL_RATE_PER_MINUTE)"
+        )
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches")
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep polling for new and retrying deliveries instead of exiting when the queue is empty"
+        )
+        parser.add_argument('--poll-interval', type=float, default=30, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            totals = process_queue(
+                size=options['batch_size'], per_minute=options['rate'], max_batches=options['max_batches']
+            )
+            if totals['batches']:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f"{totals['sent']} sent, {totals['retrying']} to retry, {totals['failed']} failed, "
+                    f"{totals['skipped']} skipped in {totals['batches']} batch(es), {elapsed:.1f}s"
+                ))
+            elif not options['loop']:
+                self.stdout.write("No payslip emails due.")
+            if not options['loop']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,51 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.models import Payroll
+from payroll.statutory import StatutoryReturn, get_writer, writer_names
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the PF or ESI return file for an approved or paid payroll and print its control "
+        "totals (members, wages and employee/employer contributions) for the challan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('payroll_id', type=int)
+        parser.add_argument('--format', default='pf-ecr', choices=writer_names(), help="Return file format")
+        parser.add_argument('--output', help="File to write (defaults to the return's standard filename)")
+
+    def handle(self, *args, **options):
+        try:
+            payroll = Payroll.objects.select_related('pay_group').get(id=options['payroll_id'])
+        except Payroll.DoesNotExist:
+            raise CommandError(f"Payroll {options['payroll_id']} does not exist.")
+
+        try:
+            statutory_return = StatutoryReturn(payroll, get_writer(options['format']))
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        path = options['output'] or statutory_return.filename
+        started = time.perf_counter()
+        with open(path, 'w', newline='') as output:
+            output.writelines(statutory_return.lines())
+        elapsed = time.perf_counter() - started
+
+        totals = statutory_return.totals
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path} in {elapsed:.1f}s."))
+        for name, value in totals.items():
+            self.stdout.write(f"  {name.replace('_', ' ')}: {value}")
+        if totals['missing_ids']:
+            self.stderr.write(
+                f"{totals['missing_ids']} member(s) have no {'UAN' if statutory_return.writer.scheme == 'PF' else 'IP number'}; "
+                "fill them in on the employee before filing."
+            )
+        if totals.get('excluded_deducted'):
+            self.stderr.write(
+                f"{totals['excluded_members']} member(s) above the ESI wage ceiling had "
+                f"₹{totals['excluded_deducted']:,.2f} deducted that is not in this return; refund it."
+            )
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.integrity import verify
+from payroll.models import Payroll
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that payroll totals, payslip amounts and the YTD ledger agree with the rows "
+        "beneath them, across every period. Prints each discrepancy as it is found and exits "
+        "with status 1 if there were any, so it can run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Only check payrolls for this year")
+        parser.add_argument(
+            '--payroll', type=int, action='append', dest='payroll_ids',
+            help="Only check this payroll id (repeatable)"
+        )
+        parser.add_argument(
+            '--skip-ytd', action='store_true',
+            help="Don't check the YTD ledger (it's always checked across all financial years)"
+        )
+
+    def handle(self, *args, **options):
+        payrolls = Payroll.objects.all()
+        if options['year']:
+            payrolls = payrolls.filter(year=options['year'])
+        if options['payroll_ids']:
+            payrolls = payrolls.filter(id__in=options['payroll_ids'])
+
+        started = time.perf_counter()
+        found = 0
+        for discrepancy in verify(payrolls, ytd=not options['skip_ytd']):
+            found += 1
+            self.stdout.write(str(discrepancy))
+        elapsed = time.perf_counter() - started
+
+        if found:
+            raise CommandError(f"{found} discrepancy(ies) found in {elapsed:.1f}s.")
+        self.stdout.write(self.style.SUCCESS(f"No discrepancies ({elapsed:.1f}s)."))
@@ -0,0 +1,136 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('employees', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllowanceType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('is_taxable', models.BooleanField(default=True, help_text='Whether this allowance is taxable')),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeductionType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('is_statutory', models.BooleanField(default=False, help_text='Whether this is a statutory deduction (TDS, PF, ESI, etc.)')),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Payroll',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.IntegerField(help_text='Month (1-12)')),
+                ('year', models.IntegerField(help_text='Year (e.g., 2024)')),
+                ('status', models.CharField(choices=[('DRAFT', 'Draft'), ('PROCESSED', 'Processed'), ('APPROVED', 'Approved'), ('PAID', 'Paid')], default='DRAFT', max_length=20)),
+                ('processed_date', models.DateTimeField(auto_now_add=True)),
+                ('employee_count', models.IntegerField(default=0, help_text='Number of employees processed in this payroll')),
+                ('total_gross_salary', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_deductions', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_net_salary', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('notes', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-year', '-month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Payslip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_salary', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('gross_salary', models.DecimalField(decimal_places=2, help_text='Base salary + all allowances', max_digits=12)),
+                ('total_deductions', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('net_salary', models.DecimalField(decimal_places=2, help_text='Gross salary - total deductions', max_digits=12)),
+                ('payment_date', models.DateField(blank=True, null=True)),
+                ('payment_method', models.CharField(choices=[('BANK_TRANSFER', 'Bank Transfer'), ('CHEQUE', 'Cheque'), ('CASH', 'Cash')], default='BANK_TRANSFER', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-payroll__year', '-payroll__month', 'employee'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayslipAllowance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('description', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['allowance_type__name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayslipDeduction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('description', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['deduction_type__name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmployeeAllowanceConfig',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, help_text='Fixed amount if applicable', max_digits=12, null=True)),
+                ('percentage', models.DecimalField(blank=True, decimal_places=2, help_text='Percentage of base salary if applicable', max_digits=5, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('effective_from', models.DateField(blank=True, null=True)),
+                ('effective_to', models.DateField(blank=True, null=True)),
+                ('allowance_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='payroll.allowancetype')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allowance_configs', to='employees.employee')),
+            ],
+            options={
+                'verbose_name': 'Employee Allowance Configuration',
+                'verbose_name_plural': 'Employee Allowance Configurations',
+                'ordering': ['allowance_type__name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmployeeDeductionConfig',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, help_text='Fixed amount if applicable', max_digits=12, null=True)),
+                ('percentage', models.DecimalField(blank=True, decimal_places=2, help_text='Percentage of base salary if applicable', max_digits=5, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('effective_from', models.DateField(blank=True, null=True)),
+                ('effective_to', models.DateField(blank=True, null=True)),
+                ('deduction_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='payroll.deductiontype')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deduction_configs', to='employees.employee')),
+            ],
+            options={
+                'verbose_name': 'Employee Deduction Configuration',
+                'verbose_name_plural': 'Employee Deduction Configurations',
+                'ordering': ['deduction_type__name'],
+            },
+        ),
+    ]
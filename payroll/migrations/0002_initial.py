@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('employees', '0002_initial'),
+        ('payroll', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payroll',
+            name='processed_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='processed_payrolls', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='payslip',
+            name='employee',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payslips', to='employees.employee'),
+        ),
+        migrations.AddField(
+            model_name='payslip',
+            name='payroll',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payslips', to='payroll.payroll'),
+        ),
+        migrations.AddField(
+            model_name='payslipallowance',
+            name='allowance_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='payroll.allowancetype'),
+        ),
+        migrations.AddField(
+            model_name='payslipallowance',
+            name='payslip',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allowances', to='payroll.payslip'),
+        ),
+        migrations.AddField(
+            model_name='payslipdeduction',
+            name='deduction_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='payroll.deductiontype'),
+        ),
+        migrations.AddField(
+            model_name='payslipdeduction',
+            name='payslip',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deductions', to='payroll.payslip'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='employeeallowanceconfig',
+            unique_together={('employee', 'allowance_type')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='employeedeductionconfig',
+            unique_together={('employee', 'deduction_type')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='payroll',
+            unique_together={('month', 'year')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='payslip',
+            unique_together={('payroll', 'employee')},
+        ),
+    ]
@@ -0,0 +1,310 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0004_salaryrevision_paygroup_statutory_ids'),
+        ('payroll', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Arrear',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_from', models.DateField(help_text='Date the revision took effect')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('breakdown', models.JSONField(blank=True, default=dict, help_text='Per-period, per-component differences')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GLAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+            ],
+            options={
+                'verbose_name': 'GL Account',
+                'verbose_name_plural': 'GL Accounts',
+                'ordering': ['code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GLMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('component', models.CharField(choices=[('BASIC', 'Basic salary'), ('ALLOWANCE', 'Allowance'), ('DEDUCTION', 'Deduction'), ('NET_PAY', 'Net pay')], max_length=10)),
+            ],
+            options={
+                'verbose_name': 'GL Mapping',
+                'verbose_name_plural': 'GL Mappings',
+                'ordering': ['component', 'allowance_type__name', 'deduction_type__name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollRunProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('stats', models.BinaryField(help_text='Marshalled cProfile stats, as written by Profile.dump_stats()')),
+                ('profile_summary', models.TextField(blank=True)),
+                ('memory_summary', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollVoid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payroll_id', models.IntegerField(help_text='Id of the deleted payroll')),
+                ('month', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('status', models.CharField(choices=[('DRAFT', 'Draft'), ('PROCESSED', 'Processed'), ('APPROVED', 'Approved'), ('PAID', 'Paid')], max_length=20)),
+                ('employee_count', models.IntegerField(default=0)),
+                ('total_gross_salary', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_net_salary', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('payslips_deleted', models.IntegerField(default=0)),
+                ('line_items_deleted', models.IntegerField(default=0)),
+                ('reason', models.TextField(blank=True)),
+                ('voided_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-voided_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayslipDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed'), ('SKIPPED', 'Skipped')], default='PENDING', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_by', models.CharField(blank=True, help_text='Worker batch currently sending this message', max_length=32)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Payslip deliveries',
+                'ordering': ['payroll', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalarySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('BASE', 'Base salary'), ('GROSS', 'Gross salary')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('sketch', models.JSONField(default=dict, help_text='Serialized QuantileSketch')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaxRegime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(choices=[('NEW', 'New Regime'), ('OLD', 'Old Regime')], max_length=10)),
+                ('financial_year', models.IntegerField(help_text='Starting year of the financial year (e.g., 2024 for 2024-25)')),
+                ('standard_deduction', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('rebate_income_limit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Section 87A: taxable income up to which the rebate applies', max_digits=12)),
+                ('rebate_max', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Section 87A: maximum rebate amount', max_digits=12)),
+                ('cess_percentage', models.DecimalField(decimal_places=2, default=Decimal('4.00'), help_text='Health and education cess on tax', max_digits=5)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-financial_year', 'code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TaxSlab',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lower_limit', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('upper_limit', models.DecimalField(blank=True, decimal_places=2, help_text='Leave empty for the top slab', max_digits=14, null=True)),
+                ('rate', models.DecimalField(decimal_places=2, help_text='Tax rate in percent', max_digits=5)),
+            ],
+            options={
+                'ordering': ['regime', 'lower_limit'],
+            },
+        ),
+        migrations.CreateModel(
+            name='YTDBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('financial_year', models.IntegerField(help_text='Starting year of the financial year (e.g., 2024 for 2024-25)')),
+                ('component', models.CharField(help_text='GROSS, TAXABLE, TOTAL_DEDUCTIONS, NET or DEDUCTION:<deduction type id>', max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'YTD Balance',
+                'verbose_name_plural': 'YTD Balances',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='payroll',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='payroll',
+            name='checkpoint_employee_id',
+            field=models.IntegerField(blank=True, help_text='Last employee id committed by an in-progress checkpointed run (empty once complete)', null=True),
+        ),
+        migrations.AddField(
+            model_name='payroll',
+            name='pay_group',
+            field=models.ForeignKey(blank=True, help_text='Entity/pay group this run pays (empty for the default group)', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='payrolls', to='employees.paygroup'),
+        ),
+        migrations.AddField(
+            model_name='payroll',
+            name='telemetry',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-phase timings and counters recorded by the run (see payroll.telemetry)'),
+        ),
+        migrations.AddConstraint(
+            model_name='payroll',
+            constraint=models.UniqueConstraint(fields=('pay_group', 'month', 'year'), name='payroll_group_period_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='payroll',
+            constraint=models.UniqueConstraint(condition=models.Q(('pay_group__isnull', True)), fields=('month', 'year'), name='payroll_default_group_period_unique'),
+        ),
+        migrations.AddField(
+            model_name='arrear',
+            name='allowance_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='payroll.allowancetype'),
+        ),
+        migrations.AddField(
+            model_name='arrear',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='arrear',
+            name='employee',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arrears', to='employees.employee'),
+        ),
+        migrations.AddField(
+            model_name='arrear',
+            name='payroll',
+            field=models.ForeignKey(blank=True, help_text='Payroll run the arrears were paid in (empty while pending)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='arrears', to='payroll.payroll'),
+        ),
+        migrations.AddField(
+            model_name='glmapping',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='mappings', to='payroll.glaccount'),
+        ),
+        migrations.AddField(
+            model_name='glmapping',
+            name='allowance_type',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='gl_mapping', to='payroll.allowancetype'),
+        ),
+        migrations.AddField(
+            model_name='glmapping',
+            name='deduction_type',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='gl_mapping', to='payroll.deductiontype'),
+        ),
+        migrations.AddField(
+            model_name='payrollrunprofile',
+            name='payroll',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profiles', to='payroll.payroll'),
+        ),
+        migrations.AddField(
+            model_name='payrollvoid',
+            name='pay_group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employees.paygroup'),
+        ),
+        migrations.AddField(
+            model_name='payrollvoid',
+            name='rerun_payroll',
+            field=models.ForeignKey(blank=True, help_text='Run that replaced the voided one, if it was re-run', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='voided_runs', to='payroll.payroll'),
+        ),
+        migrations.AddField(
+            model_name='payrollvoid',
+            name='voided_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='payslipdelivery',
+            name='payroll',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='payroll.payroll'),
+        ),
+        migrations.AddField(
+            model_name='payslipdelivery',
+            name='payslip',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='delivery', to='payroll.payslip'),
+        ),
+        migrations.AddField(
+            model_name='salarysketch',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employees.department'),
+        ),
+        migrations.AddField(
+            model_name='salarysketch',
+            name='job_role',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employees.jobrole'),
+        ),
+        migrations.AddField(
+            model_name='salarysketch',
+            name='payroll',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='salary_sketches', to='payroll.payroll'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='taxregime',
+            unique_together={('code', 'financial_year')},
+        ),
+        migrations.AddField(
+            model_name='taxslab',
+            name='regime',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slabs', to='payroll.taxregime'),
+        ),
+        migrations.AddField(
+            model_name='ytdbalance',
+            name='employee',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ytd_balances', to='employees.employee'),
+        ),
+        migrations.AddIndex(
+            model_name='arrear',
+            index=models.Index(fields=['employee', 'payroll'], name='arrear_employee_payroll_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='glmapping',
+            constraint=models.UniqueConstraint(condition=models.Q(('component__in', ['BASIC', 'NET_PAY'])), fields=('component',), name='glmapping_single_component_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='glmapping',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('allowance_type__isnull', False), ('component', 'ALLOWANCE'), ('deduction_type__isnull', True)), models.Q(('allowance_type__isnull', True), ('component', 'DEDUCTION'), ('deduction_type__isnull', False)), models.Q(('allowance_type__isnull', True), ('component__in', ['BASIC', 'NET_PAY']), ('deduction_type__isnull', True)), _connector='OR'), name='glmapping_component_matches_type'),
+        ),
+        migrations.AddIndex(
+            model_name='payslipdelivery',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='delivery_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salarysketch',
+            index=models.Index(fields=['metric', 'payroll'], name='sketch_metric_payroll_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ytdbalance',
+            index=models.Index(fields=['financial_year', 'component'], name='ytd_fy_component_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ytdbalance',
+            unique_together={('employee', 'financial_year', 'component')},
+        ),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from employees.models import Employee
+from django.utils import timezone
+from employees.models import Department, Employee, JobRole, PayGroup
 from decimal import Decimal
 
 
@@ -42,6 +43,25 @@ class Payroll(models.Model):
         ('PAID', 'Paid'),
     ]
     
+    # Allowed status moves; APPROVED -> PROCESSED reopens a run for corrections
+    TRANSITIONS = {
+        'DRAFT': ('PROCESSED',),
+        'PROCESSED': ('APPROVED',),
+        'APPROVED': ('PAID', 'PROCESSED'),
+        'PAID': (),
+    }
+    
+    # Runs that can be voided (deleted and re-run); later ones are already in the YTD ledger
+    VOIDABLE_STATUSES = ('DRAFT', 'PROCESSED')
+    
+    pay_group = models.ForeignKey(
+        PayGroup,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='payrolls',
+        help_text="Entity/pay group this run pays (empty for the default group)"
+    )
     month = models.IntegerField(help_text="Month (1-12)")
     year = models.IntegerField(help_text="Year (e.g., 2024)")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='DRAFT')
@@ -57,13 +77,116 @@ class Payroll(models.Model):
     total_deductions = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     total_net_salary = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     notes = models.TextField(blank=True)
+    checkpoint_employee_id = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text="Last employee id committed by an in-progress checkpointed run (empty once complete)"
+    )
+    telemetry = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Per-phase timings and counters recorded by the run (see payroll.telemetry)"
+    )
     
     class Meta:
         ordering = ['-year', '-month']
-        unique_together = ['month', 'year']
+        constraints = [
+            # One run per group per month; NULLs never collide, so the default group needs its own
+            models.UniqueConstraint(fields=['pay_group', 'month', 'year'], name='payroll_group_period_unique'),
+            models.UniqueConstraint(
+                fields=['month', 'year'],
+                condition=models.Q(pay_group__isnull=True),
+                name='payroll_default_group_period_unique'
+            ),
+        ]
     
     def __str__(self):
-        return f"Payroll - {self.month}/{self.year} ({self.status})"
+        group = f"{self.pay_group.code} " if self.pay_group_id else ''
+        return f"Payroll - {group}{self.month}/{self.year} ({self.status})"
+    
+    @classmethod
+    def for_group(cls, pay_group):
+        """Runs belonging to a pay group (None for the default group)"""
+        if pay_group is None:
+            return cls.objects.filter(pay_group__isnull=True)
+        return cls.objects.filter(pay_group=pay_group)
+    
+    def previous(self):
+        """Returns the same pay group's run for the period immediately before this one, if any"""
+        return Payroll.for_group(self.pay_group).filter(
+            models.Q(year__lt=self.year) | models.Q(year=self.year, month__lt=self.month)
+        ).order_by('-year', '-month').first()
+    
+    @property
+    def is_locked(self):
+        """Paid payrolls (and their payslips) can no longer be edited"""
+        return self.status == 'PAID'
+    
+    @property
+    def is_in_progress(self):
+        """A checkpointed run that hasn't finished; it stays DRAFT until then"""
+        return self.checkpoint_employee_id is not None
+    
+    @property
+    def can_void(self):
+        return self.status in self.VOIDABLE_STATUSES
+    
+    def can_transition_to(self, status):
+        if self.is_in_progress:
+            return False
+        return status in self.TRANSITIONS.get(self.status, ())
+    
+    def allowed_transitions(self):
+        """Returns (status, label) pairs this payroll can move to next; none while a run is in progress"""
+        if self.is_in_progress:
+            return []
+        labels = dict(self.STATUS_CHOICES)
+        return [(status, labels[status]) for status in self.TRANSITIONS.get(self.status, ())]
+    
+    def transition_to(self, status, payment_date=None):
+        """
+        Move the payroll to a new status, enforcing TRANSITIONS.
+        Marking a payroll PAID stamps payment_date on all its payslips in one UPDATE.
+        Approving adds the run to the YTD ledger and the salary sketches and
+        queues its payslip emails; reopening an approved run takes it out of
+        both and cancels unsent emails.
+        """
+        from .distribution import cancel_payroll, enqueue_payroll
+        from .sketches import discard_payroll, record_payroll
+        from .ytd import apply_payroll
+        
+        if not self.can_transition_to(status):
+            raise ValidationError(
+                f"Cannot move payroll {self.month}/{self.year} from {self.get_status_display()} to {status}."
+            )
+        
+        with transaction.atomic():
+            # Compare-and-set so two concurrent transitions can't both succeed
+            updated = Payroll.objects.filter(pk=self.pk, status=self.status).update(status=status)
+            if not updated:
+                raise ValidationError(
+                    f"Payroll {self.month}/{self.year} was changed by someone else. Please reload and try again."
+                )
+            if status == 'APPROVED':
+                apply_payroll(self)
+                record_payroll(self)
+                enqueue_payroll(self)
+            elif self.status == 'APPROVED' and status == 'PROCESSED':
+                apply_payroll(self, sign=-1)
+                discard_payroll(self)
+                cancel_payroll(self)
+            elif status == 'PAID':
+                self.payslips.update(
+                    payment_date=payment_date or timezone.localdate(),
+                    updated_at=timezone.now()
+                )
+        
+        self.status = status
+    
+    def save(self, *args, **kwargs):
+        if self.pk and Payroll.objects.filter(pk=self.pk, status='PAID').exists():
+            raise ValidationError("Paid payrolls cannot be modified.")
+        super().save(*args, **kwargs)
 
 
 class Payslip(models.Model):
@@ -95,6 +218,11 @@ class Payslip(models.Model):
     
     def __str__(self):
         return f"Payslip - {self.employee.user.get_full_name()} - {self.payroll.month}/{self.payroll.year}"
+    
+    def save(self, *args, **kwargs):
+        if self.payroll.is_locked:
+            raise ValidationError("Payslips of a paid payroll cannot be modified.")
+        super().save(*args, **kwargs)
 
 
 class PayslipAllowance(models.Model):
@@ -109,6 +237,11 @@ class PayslipAllowance(models.Model):
     
     def __str__(self):
         return f"{self.allowance_type.name} - ₹{self.amount}"
+    
+    def save(self, *args, **kwargs):
+        if self.payslip.payroll.is_locked:
+            raise ValidationError("Payslips of a paid payroll cannot be modified.")
+        super().save(*args, **kwargs)
 
 
 class PayslipDeduction(models.Model):
@@ -123,6 +256,11 @@ class PayslipDeduction(models.Model):
     
     def __str__(self):
         return f"{self.deduction_type.name} - ₹{self.amount}"
+    
+    def save(self, *args, **kwargs):
+        if self.payslip.payroll.is_locked:
+            raise ValidationError("Payslips of a paid payroll cannot be modified.")
+        super().save(*args, **kwargs)
 
 
 class EmployeeAllowanceConfig(models.Model):
@@ -229,3 +367,313 @@ class EmployeeDeductionConfig(models.Model):
     
     def __str__(self):
         return f"{self.employee.user.get_full_name()} - {self.deduction_type.name}"
+
+
+class YTDBalance(models.Model):
+    """
+    Running year-to-date total of one payroll component for an employee.
+    Kept up to date with deltas when payrolls are approved or reopened (see payroll.ytd).
+    """
+    GROSS = 'GROSS'
+    TAXABLE = 'TAXABLE'
+    TOTAL_DEDUCTIONS = 'TOTAL_DEDUCTIONS'
+    NET = 'NET'
+    DEDUCTION_PREFIX = 'DEDUCTION:'
+    
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='ytd_balances')
+    financial_year = models.IntegerField(help_text="Starting year of the financial year (e.g., 2024 for 2024-25)")
+    component = models.CharField(max_length=50, help_text="GROSS, TAXABLE, TOTAL_DEDUCTIONS, NET or DEDUCTION:<deduction type id>")
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['employee', 'financial_year', 'component']
+        indexes = [
+            models.Index(fields=['financial_year', 'component'], name='ytd_fy_component_idx'),
+        ]
+        verbose_name = "YTD Balance"
+        verbose_name_plural = "YTD Balances"
+    
+    @classmethod
+    def deduction_component(cls, deduction_type_id):
+        return f"{cls.DEDUCTION_PREFIX}{deduction_type_id}"
+    
+    def __str__(self):
+        return f"{self.employee_id} - FY {self.financial_year} - {self.component}: ₹{self.amount}"
+
+
+class SalarySketch(models.Model):
+    """
+    Quantile sketch of one approved run's payslip amounts for one job role.
+    Sketches merge, so percentiles for any set of periods, departments or
+    roles come from these rows alone (see payroll.sketches).
+    """
+    BASE = 'BASE'
+    GROSS = 'GROSS'
+    METRIC_CHOICES = [
+        (BASE, 'Base salary'),
+        (GROSS, 'Gross salary'),
+    ]
+    
+    payroll = models.ForeignKey(Payroll, on_delete=models.CASCADE, related_name='salary_sketches')
+    metric = models.CharField(max_length=10, choices=METRIC_CHOICES)
+    job_role = models.ForeignKey(JobRole, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # The role's department when the sketch was built
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    sketch = models.JSONField(default=dict, help_text="Serialized QuantileSketch")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['metric', 'payroll'], name='sketch_metric_payroll_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.payroll_id} - {self.metric} - role {self.job_role_id}: {self.count}"
+
+
+class GLAccount(models.Model):
+    """General-ledger account that payroll journals post to"""
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['code']
+        verbose_name = "GL Account"
+        verbose_name_plural = "GL Accounts"
+
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+
+
+class GLMapping(models.Model):
+    """
+    The account a payroll component posts to in the journal (see payroll.journal):
+    basic salary and each allowance type are debited, each deduction type and
+    net pay are credited.
+    """
+    BASIC = 'BASIC'
+    ALLOWANCE = 'ALLOWANCE'
+    DEDUCTION = 'DEDUCTION'
+    NET_PAY = 'NET_PAY'
+    COMPONENT_CHOICES = [
+        (BASIC, 'Basic salary'),
+        (ALLOWANCE, 'Allowance'),
+        (DEDUCTION, 'Deduction'),
+        (NET_PAY, 'Net pay'),
+    ]
+
+    component = models.CharField(max_length=10, choices=COMPONENT_CHOICES)
+    allowance_type = models.OneToOneField(
+        AllowanceType, on_delete=models.CASCADE, null=True, blank=True, related_name='gl_mapping'
+    )
+    deduction_type = models.OneToOneField(
+        DeductionType, on_delete=models.CASCADE, null=True, blank=True, related_name='gl_mapping'
+    )
+    account = models.ForeignKey(GLAccount, on_delete=models.PROTECT, related_name='mappings')
+
+    class Meta:
+        ordering = ['component', 'allowance_type__name', 'deduction_type__name']
+        verbose_name = "GL Mapping"
+        verbose_name_plural = "GL Mappings"
+        constraints = [
+            # Basic salary and net pay have one account each; types are unique through their one-to-one
+            models.UniqueConstraint(
+                fields=['component'],
+                condition=models.Q(component__in=['BASIC', 'NET_PAY']),
+                name='glmapping_single_component_unique'
+            ),
+            models.CheckConstraint(
+                condition=(
+                    models.Q(component='ALLOWANCE', allowance_type__isnull=False, deduction_type__isnull=True)
+                    | models.Q(component='DEDUCTION', allowance_type__isnull=True, deduction_type__isnull=False)
+                    | models.Q(component__in=['BASIC', 'NET_PAY'], allowance_type__isnull=True, deduction_type__isnull=True)
+                ),
+                name='glmapping_component_matches_type'
+            ),
+        ]
+
+    def __str__(self):
+        subject = self.allowance_type or self.deduction_type or self.get_component_display()
+        return f"{subject} -> {self.account.code}"
+
+    def clean(self):
+        if self.component == self.ALLOWANCE and (not self.allowance_type_id or self.deduction_type_id):
+            raise ValidationError("Allowance mappings need an allowance type and no deduction type.")
+        if self.component == self.DEDUCTION and (not self.deduction_type_id or self.allowance_type_id):
+            raise ValidationError("Deduction mappings need a deduction type and no allowance type.")
+        if self.component in (self.BASIC, self.NET_PAY) and (self.allowance_type_id or self.deduction_type_id):
+            raise ValidationError(f"{self.get_component_display()} is mapped without an allowance or deduction type.")
+
+
+class TaxRegime(models.Model):
+    """Income tax regime for one financial year; slabs are in TaxSlab"""
+    code = models.CharField(max_length=10, choices=Employee.TAX_REGIME_CHOICES)
+    financial_year = models.IntegerField(help_text="Starting year of the financial year (e.g., 2024 for 2024-25)")
+    standard_deduction = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    rebate_income_limit = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), help_text="Section 87A: taxable income up to which the rebate applies")
+    rebate_max = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), help_text="Section 87A: maximum rebate amount")
+    cess_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('4.00'), help_text="Health and education cess on tax")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-financial_year', 'code']
+        unique_together = ['code', 'financial_year']
+    
+    def __str__(self):
+        return f"{self.get_code_display()} FY {self.financial_year}-{str(self.financial_year + 1)[-2:]}"
+
+
+class TaxSlab(models.Model):
+    """One income band of a tax regime, taxed at rate percent"""
+    regime = models.ForeignKey(TaxRegime, on_delete=models.CASCADE, related_name='slabs')
+    lower_limit = models.DecimalField(max_digits=14, decimal_places=2)
+    upper_limit = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, help_text="Leave empty for the top slab")
+    rate = models.DecimalField(max_digits=5, decimal_places=2, help_text="Tax rate in percent")
+    
+    class Meta:
+        ordering = ['regime', 'lower_limit']
+    
+    def clean(self):
+        if self.upper_limit is not None and self.upper_limit <= self.lower_limit:
+            raise ValidationError("Upper limit must be greater than lower limit.")
+        if self.rate < 0 or self.rate > 100:
+            raise ValidationError("Rate must be between 0 and 100.")
+    
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+        # Bump the regime's version so compiled tables are rebuilt
+        TaxRegime.objects.filter(pk=self.regime_id).update(updated_at=timezone.now())
+    
+    def __str__(self):
+        upper = f"₹{self.upper_limit}" if self.upper_limit is not None else "and above"
+        return f"₹{self.lower_limit} - {upper}: {self.rate}%"
+
+
+class Arrear(models.Model):
+    """
+    Back pay owed to an employee after a back-dated revision (see payroll.arrears).
+    Paid as a single allowance line in the next payroll run, which is then recorded here.
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='arrears')
+    allowance_type = models.ForeignKey(AllowanceType, on_delete=models.PROTECT)
+    effective_from = models.DateField(help_text="Date the revision took effect")
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    breakdown = models.JSONField(default=dict, blank=True, help_text="Per-period, per-component differences")
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    payroll = models.ForeignKey(
+        Payroll,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='arrears',
+        help_text="Payroll run the arrears were paid in (empty while pending)"
+    )
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['employee', 'payroll'], name='arrear_employee_payroll_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Arrears - {self.employee_id} from {self.effective_from}: ₹{self.amount}"
+
+
+
+class PayrollVoid(models.Model):
+    """Audit record of a voided payroll run; the run itself and its payslips are gone"""
+    payroll_id = models.IntegerField(help_text="Id of the deleted payroll")
+    pay_group = models.ForeignKey(PayGroup, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    month = models.IntegerField()
+    year = models.IntegerField()
+    status = models.CharField(max_length=20, choices=Payroll.STATUS_CHOICES)
+    employee_count = models.IntegerField(default=0)
+    total_gross_salary = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_net_salary = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    payslips_deleted = models.IntegerField(default=0)
+    line_items_deleted = models.IntegerField(default=0)
+    reason = models.TextField(blank=True)
+    voided_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    voided_at = models.DateTimeField(auto_now_add=True)
+    rerun_payroll = models.ForeignKey(
+        Payroll,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='voided_runs',
+        help_text="Run that replaced the voided one, if it was re-run"
+    )
+    
+    class Meta:
+        ordering = ['-voided_at']
+    
+    def __str__(self):
+        return f"Voided payroll - {self.month}/{self.year} ({self.payslips_deleted} payslips)"
+
+
+
+class PayrollRunProfile(models.Model):
+    """cProfile and tracemalloc capture of a profiled payroll run"""
+    payroll = models.ForeignKey(Payroll, on_delete=models.CASCADE, related_name='profiles')
+    created_at = models.DateTimeField(auto_now_add=True)
+    stats = models.BinaryField(help_text="Marshalled cProfile stats, as written by Profile.dump_stats()")
+    profile_summary = models.TextField(blank=True)
+    memory_summary = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Profile - {self.payroll.month}/{self.payroll.year} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+
+class PayslipDelivery(models.Model):
+    """
+    Email delivery of one payslip (see payroll.distribution). Queued when the run is
+    approved and worked off by `manage.py send_payslip_emails`.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+        ('SKIPPED', 'Skipped'),
+    ]
+    
+    payslip = models.OneToOneField(Payslip, on_delete=models.CASCADE, related_name='delivery')
+    payroll = models.ForeignKey(Payroll, on_delete=models.CASCADE, related_name='deliveries')
+    email = models.EmailField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True, help_text="Worker batch currently sending this message")
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['payroll', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='delivery_due_idx'),
+        ]
+        verbose_name_plural = "Payslip deliveries"
+    
+    def __str__(self):
+        return f"Delivery - payslip {self.payslip_id} to {self.email or '(no email)'} ({self.status})"
@@ -0,0 +1,60 @@
+"""
+Day-weighted proration for partial pay periods.
+
+A ``PeriodCalendar`` is built once per run. It holds a cumulative count of
+payable days for the month, so the weight of any date range inside the
+period (a mid-month joiner, a config that starts on the 10th) is two list
+lookups, whatever the size of the workforce.
+"""
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal
+
+CALENDAR_DAYS = 'CALENDAR'
+WORKING_DAYS = 'WORKING'
+
+CENTS = Decimal('0.01')
+
+
+class PeriodCalendar:
+    """Precomputed day table for one monthly pay period"""
+
+    def __init__(self, year, month, basis=CALENDAR_DAYS):
+        self.year = year
+        self.month = month
+        self.basis = basis
+        self.start = date(year, month, 1)
+        self.end = date(year, month, calendar.monthrange(year, month)[1])
+
+        # cumulative[n] = payable days among the first n days of the month
+        self.cumulative = [0]
+        day = self.start
+        while day <= self.end:
+            payable = basis == CALENDAR_DAYS or day.weekday() < 5
+            self.cumulative.append(self.cumulative[-1] + (1 if payable else 0))
+            day += timedelta(days=1)
+        self.total_days = self.cumulative[-1]
+
+    def days_between(self, start=None, end=None):
+        """Payable days in [start, end] clipped to the period (None means open-ended)"""
+        start = max(start or self.start, self.start)
+        end = min(end or self.end, self.end)
+        if start > end:
+            return 0
+        return self.cumulative[end.day] - self.cumulative[start.day - 1]
+
+    def weight(self, start=None, end=None):
+        """Fraction of the period covered by [start, end], as a Decimal between 0 and 1"""
+        if not self.total_days:
+            return Decimal('0')
+        days = self.days_between(start, end)
+        if days == self.total_days:
+            return Decimal('1')
+        return Decimal(days) / Decimal(self.total_days)
+
+    def is_partial(self, start=None, end=None):
+        return self.days_between(start, end) != self.total_days
+
+    def prorate(self, amount, start=None, end=None):
+        """amount scaled to the covered part of the period, rounded to paise"""
+        return (amount * self.weight(start, end)).quantize(CENTS)
@@ -0,0 +1,224 @@
+"""
+Salary distribution sketches.
+
+``QuantileSketch`` is a relative-error quantile sketch (the DDSketch
+scheme). Each value is counted in a logarithmic bucket, so any quantile
+it reports is within ``relative_accuracy`` of the true value. Two
+sketches merge by adding bucket counts, which makes the result exactly
+the sketch of the combined data. Counts per salary band
+(PAYROLL_SALARY_BANDS) are kept exactly alongside the buckets.
+
+Approving a payroll records one ``SalarySketch`` per job role and metric
+(base and gross salary) in a single streamed pass over its payslips;
+reopening it discards them. ``distribution()`` merges the stored sketches
+for any set of runs, grouped by department, job role or period. It
+returns percentiles and band histograms without reading a payslip
+(``manage.py build_salary_sketches`` backfills older runs).
+"""
+import math
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Payroll, Payslip, SalarySketch
+from .ytd import COUNTED_STATUSES
+
+# Quantiles are within 1% of the true value
+DEFAULT_ACCURACY = 0.01
+
+DEFAULT_BANDS = [0, 25000, 50000, 100000, 200000]
+
+GROUPINGS = ('department', 'job_role', 'period', None)
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch over non-negative amounts; see the module docstring"""
+
+    def __init__(self, relative_accuracy=DEFAULT_ACCURACY, edges=None):
+        self.relative_accuracy = relative_accuracy
+        # Band edges counted exactly (bucket values can land just under an edge)
+        self.edges = list(edges) if edges else []
+        self.band_counts = [0] * len(self.edges)
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = defaultdict(int)
+        # Zero (and negative) amounts have no logarithm
+        self.zero_count = 0
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value, count=1):
+        value = float(value)
+        if value > 0:
+            self.buckets[math.ceil(math.log(value) / self._log_gamma)] += count
+        else:
+            self.zero_count += count
+        if self.edges:
+            self.band_counts[max(bisect_right(self.edges, value) - 1, 0)] += count
+        self.count += count
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged.")
+        for key, count in other.buckets.items():
+            self.buckets[key] += count
+        if self.edges == other.edges:
+            self.band_counts = [mine + theirs for mine, theirs in zip(self.band_counts, other.band_counts)]
+        else:
+            self.edges, self.band_counts = [], []
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for bound in (other.minimum, other.maximum):
+            if bound is not None:
+                self.minimum = bound if self.minimum is None else min(self.minimum, bound)
+                self.maximum = bound if self.maximum is None else max(self.maximum, bound)
+        return self
+
+    def _value(self, key):
+        # The point within the bucket (gamma^(key-1), gamma^key] with equal relative error to both ends
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def _items(self):
+        """(value, count) in ascending order"""
+        if self.zero_count:
+            yield 0.0, self.zero_count
+        for key in sorted(self.buckets):
+            yield self._value(key), self.buckets[key]
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self._items():
+            seen += count
+            if seen > rank:
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def histogram(self, edges):
+        """
+        Counts per band [edges[i], edges[i + 1]), the last band open-ended:
+        exact for the edges the sketch was built with, else from the buckets
+        """
+        edges = list(edges)
+        if edges == self.edges:
+            return list(self.band_counts)
+        counts = [0] * len(edges)
+        for value, count in self._items():
+            counts[max(bisect_right(edges, value) - 1, 0)] += count
+        return counts
+
+    def to_dict(self):
+        return {
+            'accuracy': self.relative_accuracy,
+            'buckets': {str(key): count for key, count in self.buckets.items()},
+            'zero': self.zero_count,
+            'count': self.count,
+            'min': self.minimum,
+            'max': self.maximum,
+            'edges': self.edges,
+            'bands': self.band_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['accuracy'], data.get('edges'))
+        sketch.band_counts = data.get('bands', sketch.band_counts)
+        for key, count in data['buckets'].items():
+            sketch.buckets[int(key)] = count
+        sketch.zero_count = data['zero']
+        sketch.count = data['count']
+        sketch.minimum = data['min']
+        sketch.maximum = data['max']
+        return sketch
+
+
+def accuracy():
+    return getattr(settings, 'PAYROLL_SKETCH_ACCURACY', DEFAULT_ACCURACY)
+
+
+def record_payroll(payroll):
+    """Builds and stores the run's sketches from one streamed pass over its payslips"""
+    sketches = {}
+    totals = defaultdict(Decimal)
+    for base, gross, job_role_id, department_id in Payslip.objects.filter(payroll=payroll).values_list(
+        'base_salary', 'gross_salary', 'employee__job_role_id', 'employee__job_role__department_id'
+    ).order_by().iterator(chunk_size=2000):
+        for metric, amount in ((SalarySketch.BASE, base), (SalarySketch.GROSS, gross)):
+            key = (metric, job_role_id, department_id)
+            if key not in sketches:
+                sketches[key] = QuantileSketch(accuracy(), bands())
+            sketches[key].add(amount)
+            totals[key] += amount
+
+    with transaction.atomic():
+        discard_payroll(payroll)
+        SalarySketch.objects.bulk_create([
+            SalarySketch(
+                payroll=payroll, metric=metric, job_role_id=job_role_id, department_id=department_id,
+                count=sketch.count, total=totals[metric, job_role_id, department_id], sketch=sketch.to_dict(),
+            )
+            for (metric, job_role_id, department_id), sketch in sketches.items()
+        ])
+    return len(sketches)
+
+
+def discard_payroll(payroll):
+    SalarySketch.objects.filter(payroll=payroll).delete()
+
+
+def bands():
+    return getattr(settings, 'PAYROLL_SALARY_BANDS', DEFAULT_BANDS)
+
+
+def distribution(payrolls, metric=SalarySketch.GROSS, by='department', quantiles=(0.1, 0.5, 0.9)):
+    """
+    Merges the stored sketches of a set of payrolls into one per group.
+    by is 'department', 'job_role', 'period' or None (a single group). Returns
+    a list of dicts with the group key, count, mean, {q: value} and band counts.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping {by!r}.")
+    merged = {}
+    totals = defaultdict(Decimal)
+    rows = SalarySketch.objects.filter(payroll__in=payrolls, metric=metric).values_list(
+        'department_id', 'job_role_id', 'payroll__year', 'payroll__month', 'total', 'sketch'
+    ).order_by()
+    for department_id, job_role_id, year, month, total, data in rows.iterator():
+        key = {'department': department_id, 'job_role': job_role_id, 'period': (year, month)}.get(by)
+        sketch = QuantileSketch.from_dict(data)
+        if key in merged:
+            merged[key].merge(sketch)
+        else:
+            merged[key] = sketch
+        totals[key] += total
+
+    edges = bands()
+    return [
+        {
+            'key': key,
+            'count': sketch.count,
+            'mean': totals[key] / sketch.count if sketch.count else None,
+            'quantiles': {q: sketch.quantile(q) for q in quantiles},
+            'bands': sketch.histogram(edges),
+        }
+        for key, sketch in merged.items()
+    ]
+
+
+def rebuild(payrolls=None):
+    """Re-records sketches for approved and paid runs; returns the number of runs"""
+    if payrolls is None:
+        payrolls = Payroll.objects.all()
+    count = 0
+    for payroll in payrolls.filter(status__in=COUNTED_STATUSES).order_by('year', 'month', 'id').iterator():
+        record_payroll(payroll)
+        count += 1
+    return count
@@ -0,0 +1,288 @@
+"""
+Monthly statutory return files (PF and ESI) for an approved payroll run.
+
+Contributions are computed from the run itself: the employee share is the
+PF/ESI deduction line on each payslip, and the employer share and capped
+wages follow the rates and ceilings in settings. Payslips are read in
+keyset chunks, one grouped query per chunk with the scheme's deduction
+summed alongside the wages, so a 100k-employee run streams in flat memory.
+
+File formats are pluggable: ``PAYROLL_STATUTORY_WRITERS`` maps a format
+name to a ``ReturnWriter`` subclass. ``StatutoryReturn.lines()`` streams a
+file and fills in ``totals`` (members, wages and contributions) as it goes,
+for the control totals filed with the challan
+(``manage.py statutory_return``). ESI totals also count the payslips left
+out above the wage ceiling and what was deducted from them, which the
+engine should have dropped (payroll.engine.apply_esi_ceiling).
+"""
+import csv
+import io
+from calendar import monthrange
+from decimal import ROUND_CEILING, ROUND_HALF_UP, Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Q, Sum
+from django.utils.module_loading import import_string
+
+from .models import DeductionType, Payslip
+from .ytd import COUNTED_STATUSES
+
+# Payslips read per query
+CHUNK_SIZE = 2000
+
+PF = 'PF'
+ESI = 'ESI'
+
+DEFAULT_WRITERS = {
+    'pf-ecr': 'payroll.statutory.ECRWriter',
+    'esi-csv': 'payroll.statutory.ESICSVWriter',
+}
+
+
+def _rupees(amount, rounding=ROUND_HALF_UP):
+    """Contributions are remitted in whole rupees"""
+    return int(Decimal(amount).quantize(Decimal('1'), rounding=rounding))
+
+
+def _percent(amount, rate):
+    return Decimal(amount) * Decimal(rate) / 100
+
+
+class PFContribution(NamedTuple):
+    uan: str
+    name: str
+    gross_wages: int
+    epf_wages: int
+    eps_wages: int
+    edli_wages: int
+    employee_share: int
+    eps_share: int
+    employer_share: int
+    ncp_days: int
+    refund_of_advances: int
+
+
+class ESIContribution(NamedTuple):
+    ip_number: str
+    name: str
+    days: int
+    wages: int
+    employee_share: int
+    employer_share: int
+
+
+class ExcludedMember(NamedTuple):
+    """A payslip carrying the scheme's deduction that is left out of the return"""
+    identifier: str
+    name: str
+    wages: int
+    deducted: Decimal
+
+
+def _deduction_type(scheme):
+    name = getattr(settings, f'PAYROLL_{scheme}_DEDUCTION_TYPE', scheme)
+    deduction_type = DeductionType.objects.filter(name=name).first()
+    if deduction_type is None:
+        raise ValidationError(f"No deduction type named '{name}' (PAYROLL_{scheme}_DEDUCTION_TYPE).")
+    return deduction_type
+
+
+def _member_rows(payroll, deduction_type, identifier, chunk_size):
+    """
+    Yields (payslip values, deducted amount) for payslips carrying the scheme's
+    deduction, in payslip id order, one grouped query per chunk
+    """
+    last_id = 0
+    while True:
+        rows = list(
+            Payslip.objects.filter(payroll=payroll, id__gt=last_id).values(
+                'id', 'base_salary', 'gross_salary', 'employee__user__first_name',
+                'employee__user__last_name', 'employee__user__username', f'employee__{identifier}',
+            ).annotate(
+                deducted=Sum('deductions__amount', filter=Q(deductions__deduction_type=deduction_type))
+            ).order_by('id')[:chunk_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        for row in rows:
+            if row['deducted'] is not None:
+                yield row, row['deducted']
+
+
+def _member_name(row):
+    full_name = f"{row['employee__user__first_name']} {row['employee__user__last_name']}".strip()
+    return full_name or row['employee__user__username']
+
+
+def pf_contributions(payroll, deduction_type, chunk_size=CHUNK_SIZE):
+    """EPF, EPS and EDLI figures for every payslip with a PF deduction"""
+    ceiling = Decimal(getattr(settings, 'PAYROLL_PF_WAGE_CEILING', '15000'))
+    employee_rate = getattr(settings, 'PAYROLL_PF_EMPLOYEE_RATE', '12')
+    employer_rate = getattr(settings, 'PAYROLL_PF_EMPLOYER_RATE', '12')
+    eps_rate = getattr(settings, 'PAYROLL_PF_EPS_RATE', '8.33')
+    for row, deducted in _member_rows(payroll, deduction_type, 'uan', chunk_size):
+        # Contributions are on basic wages, restricted to the statutory ceiling
+        # unless the employee contributes on more; EPS and EDLI stay capped
+        capped = min(row['base_salary'], ceiling)
+        employee_share = _rupees(deducted)
+        epf_wages = row['base_salary'] if employee_share > _rupees(_percent(capped, employee_rate)) else capped
+        eps_share = _rupees(_percent(capped, eps_rate))
+        yield PFContribution(
+            uan=row['employee__uan'],
+            name=_member_name(row),
+            gross_wages=_rupees(row['gross_salary']),
+            epf_wages=_rupees(epf_wages),
+            eps_wages=_rupees(capped),
+            edli_wages=_rupees(capped),
+            employee_share=employee_share,
+            eps_share=eps_share,
+            employer_share=_rupees(_percent(epf_wages, employer_rate)) - eps_share,
+            ncp_days=0,
+            # PF advances are not repaid through payroll
+            refund_of_advances=0,
+        )
+
+
+def esi_contributions(payroll, deduction_type, chunk_size=CHUNK_SIZE):
+    """
+    ESI wages and shares for every payslip with an ESI deduction. Payslips above
+    the wage ceiling are not covered; they are yielded as ExcludedMember so the
+    amount deducted anyway shows up in the totals.
+    """
+    ceiling = Decimal(getattr(settings, 'PAYROLL_ESI_WAGE_CEILING', '21000'))
+    employer_rate = getattr(settings, 'PAYROLL_ESI_EMPLOYER_RATE', '3.25')
+    days = monthrange(payroll.year, payroll.month)[1]
+    for row, deducted in _member_rows(payroll, deduction_type, 'esi_number', chunk_size):
+        if row['gross_salary'] > ceiling:
+            yield ExcludedMember(
+                identifier=row['employee__esi_number'],
+                name=_member_name(row),
+                wages=_rupees(row['gross_salary']),
+                deducted=deducted,
+            )
+            continue
+        yield ESIContribution(
+            ip_number=row['employee__esi_number'],
+            name=_member_name(row),
+            days=days,
+            wages=_rupees(row['gross_salary']),
+            employee_share=_rupees(deducted, ROUND_CEILING),
+            # ESIC rounds contributions up to the next rupee
+            employer_share=_rupees(_percent(row['gross_salary'], employer_rate), ROUND_CEILING),
+        )
+
+
+CONTRIBUTIONS = {PF: pf_contributions, ESI: esi_contributions}
+
+
+class ReturnWriter:
+    """
+    A statutory return file format. Subclasses set ``scheme`` (PF or ESI),
+    ``extension`` and ``content_type`` and format one contribution per line.
+    """
+    scheme = None
+    extension = 'txt'
+    content_type = 'text/plain'
+
+    def header(self):
+        return []
+
+    def format(self, contribution):
+        raise NotImplementedError
+
+    def trailer(self, totals):
+        return []
+
+
+class ECRWriter(ReturnWriter):
+    """EPFO Electronic Challan cum Return (ECR 2.0) text file: one member per line, its 11 fields #~# separated"""
+    scheme = PF
+    separator = '#~#'
+
+    def format(self, contribution):
+        return self.separator.join(str(value) for value in contribution) + '\n'
+
+
+class ESICSVWriter(ReturnWriter):
+    """ESIC monthly contribution upload as CSV"""
+    scheme = ESI
+    extension = 'csv'
+    content_type = 'text/csv'
+    columns = [
+        'IP Number', 'IP Name', 'No of Days for which wages paid/payable during the month',
+        'Total Monthly Wages', 'Reason Code for Zero workings days', 'Last Working Day',
+    ]
+
+    def _row(self, values):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue()
+
+    def header(self):
+        return [self._row(self.columns)]
+
+    def format(self, contribution):
+        # Shares are computed by the ESIC portal from the wages; they're in the control totals
+        return self._row([contribution.ip_number, contribution.name, contribution.days, contribution.wages, '', ''])
+
+
+def get_writer(name):
+    writers = getattr(settings, 'PAYROLL_STATUTORY_WRITERS', DEFAULT_WRITERS)
+    if name not in writers:
+        raise ValidationError(f"Unknown return format '{name}'. Choose from: {', '.join(writers)}.")
+    writer = import_string(writers[name])()
+    if writer.scheme not in CONTRIBUTIONS:
+        raise ImproperlyConfigured(f"{writers[name]}.scheme must be one of {', '.join(CONTRIBUTIONS)}.")
+    return writer
+
+
+def writer_names():
+    return list(getattr(settings, 'PAYROLL_STATUTORY_WRITERS', DEFAULT_WRITERS))
+
+
+class StatutoryReturn:
+    """One return file for one approved or paid payroll run"""
+
+    def __init__(self, payroll, writer, chunk_size=CHUNK_SIZE):
+        if payroll.status not in COUNTED_STATUSES:
+            raise ValidationError(
+                f"Payroll {payroll.month}/{payroll.year} is {payroll.get_status_display()}; "
+                "returns are filed for approved or paid runs."
+            )
+        self.payroll = payroll
+        self.writer = writer
+        self.deduction_type = _deduction_type(writer.scheme)
+        self.chunk_size = chunk_size
+        self.totals = {}
+
+    @property
+    def filename(self):
+        group = f"{self.payroll.pay_group.code}_" if self.payroll.pay_group_id else ''
+        return f"{self.writer.scheme.lower()}_{group}{self.payroll.year}_{self.payroll.month:02d}.{self.writer.extension}"
+
+    def lines(self):
+        """Yields the file line by line; ``totals`` is complete once it's exhausted"""
+        contributions = CONTRIBUTIONS[self.writer.scheme](self.payroll, self.deduction_type, self.chunk_size)
+        totals = {'members': 0, 'missing_ids': 0}
+        if self.writer.scheme == ESI:
+            # Payslips above the ceiling, so the return reconciles with the deductions taken
+            totals.update(excluded_members=0, excluded_wages=0, excluded_deducted=Decimal('0.00'))
+        self.totals = totals
+        yield from self.writer.header()
+        for contribution in contributions:
+            if isinstance(contribution, ExcludedMember):
+                totals['excluded_members'] += 1
+                totals['excluded_wages'] += contribution.wages
+                totals['excluded_deducted'] += contribution.deducted
+                continue
+            totals['members'] += 1
+            if not contribution[0]:
+                totals['missing_ids'] += 1
+            for field, value in contribution._asdict().items():
+                if isinstance(value, int) and field not in ('days', 'ncp_days'):
+                    totals[field] = totals.get(field, 0) + value
+            yield self.writer.format(contribution)
+        yield from self.writer.trailer(totals)
@@ -0,0 +1,167 @@
+"""
+Annualized TDS (income tax deducted at source).
+
+Each financial year's regimes and slabs are compiled once into an
+in-memory lookup (cumulative tax at every slab boundary, so tax on any
+income is a bisect plus one multiplication). The payroll run projects
+each employee's annual taxable income as YTD (from the ledger), plus this
+month's taxable pay, plus the recurring full-month taxable pay for each
+month left after it. One-off amounts (arrears, a joiner's prorated first
+month) are therefore counted once, not projected. It deducts this month's
+share of the tax still due. A whole chunk of employees costs one YTD query.
+
+Employees with their own TDS deduction config keep it; the computed TDS
+applies to everyone else.
+"""
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import DeductionType, TaxRegime, YTDBalance
+from .ytd import financial_year_for
+
+CENTS = Decimal('0.01')
+
+# {financial_year: (version, {regime code: CompiledRegime})}
+_compiled_cache = {}
+
+
+class CompiledRegime:
+    """Slab table flattened for O(log n) tax lookups"""
+
+    def __init__(self, regime, slabs):
+        self.code = regime.code
+        self.standard_deduction = regime.standard_deduction
+        self.rebate_income_limit = regime.rebate_income_limit
+        self.rebate_max = regime.rebate_max
+        self.cess_rate = regime.cess_percentage / Decimal('100')
+
+        # lower bounds, rates, and tax accumulated below each lower bound
+        self.bounds = []
+        self.rates = []
+        self.base_tax = []
+        accumulated = Decimal('0.00')
+        for slab in sorted(slabs, key=lambda s: s.lower_limit):
+            if self.bounds:
+                accumulated += (slab.lower_limit - self.bounds[-1]) * self.rates[-1]
+            self.bounds.append(slab.lower_limit)
+            self.rates.append(slab.rate / Decimal('100'))
+            self.base_tax.append(accumulated)
+
+    def annual_tax(self, annual_income):
+        """Tax including cess and the 87A rebate on an annual income"""
+        taxable = annual_income - self.standard_deduction
+        if not self.bounds or taxable <= self.bounds[0]:
+            return Decimal('0.00')
+        i = bisect_right(self.bounds, taxable) - 1
+        tax = self.base_tax[i] + (taxable - self.bounds[i]) * self.rates[i]
+        if taxable <= self.rebate_income_limit:
+            tax = max(Decimal('0.00'), tax - self.rebate_max)
+        return (tax * (1 + self.cess_rate)).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def compiled_regimes(financial_year):
+    """
+    Returns {regime code: CompiledRegime} for a financial year.
+    Costs one version-check query; tables are recompiled only when regimes or slabs change.
+    """
+    version = TaxRegime.objects.filter(financial_year=financial_year).aggregate(
+        updated=Max('updated_at'), slabs=Count('slabs')
+    )
+    version = (version['updated'], version['slabs'])
+    cached = _compiled_cache.get(financial_year)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    regimes = {
+        regime.code: CompiledRegime(regime, regime.slabs.all())
+        for regime in TaxRegime.objects.filter(financial_year=financial_year).prefetch_related('slabs')
+    }
+    _compiled_cache[financial_year] = (version, regimes)
+    return regimes
+
+
+def months_remaining(month):
+    """Pay periods left in the financial year, counting this one"""
+    start_month = getattr(settings, 'PAYROLL_FINANCIAL_YEAR_START_MONTH', 4)
+    return 12 - (month - start_month) % 12
+
+
+class TDSCalculator:
+    """Adds a computed TDS line to payslip drafts, one batched YTD read per chunk"""
+
+    def __init__(self, deduction_type, regimes, month, year):
+        self.deduction_type = deduction_type
+        self.regimes = regimes
+        self.financial_year = financial_year_for(month, year)
+        self.months_remaining = months_remaining(month)
+        self.tds_component = YTDBalance.deduction_component(deduction_type.id)
+
+    @classmethod
+    def for_period(cls, month, year):
+        """Returns a calculator, or None if there is no active TDS type or no regimes for the year"""
+        name = getattr(settings, 'PAYROLL_TDS_DEDUCTION_TYPE', 'TDS')
+        deduction_type = DeductionType.objects.filter(name=name, is_active=True).first()
+        if deduction_type is None:
+            return None
+        regimes = compiled_regimes(financial_year_for(month, year))
+        if not regimes:
+            return None
+        return cls(deduction_type, regimes, month, year)
+
+    def _load_ytd(self, employee_ids):
+        ytd = {}
+        for employee_id, component, amount in YTDBalance.objects.filter(
+            employee_id__in=employee_ids,
+            financial_year=self.financial_year,
+            component__in=[YTDBalance.TAXABLE, self.tds_component],
+        ).values_list('employee_id', 'component', 'amount'):
+            ytd.setdefault(employee_id, {})[component] = amount
+        return ytd
+
+    def monthly_tds(self, regime, taxable_this_month, recurring_taxable, ytd_taxable, ytd_tds):
+        """This month's share of the tax still due on the projected annual income"""
+        projected = ytd_taxable + taxable_this_month + recurring_taxable * (self.months_remaining - 1)
+        remaining_tax = regime.annual_tax(projected) - ytd_tds
+        if remaining_tax <= 0:
+            return Decimal('0.00'), projected
+        return (remaining_tax / self.months_remaining).quantize(CENTS, rounding=ROUND_HALF_UP), projected
+
+    def apply(self, drafts):
+        """Adds the TDS line to every draft that doesn't already carry a TDS deduction"""
+        pending = [
+            draft for draft in drafts
+            if not any(d['deduction_type'].id == self.deduction_type.id for d in draft['deductions'])
+        ]
+        if not pending:
+            return
+        ytd = self._load_ytd([draft['employee'].id for draft in pending])
+
+        for draft in pending:
+            employee = draft['employee']
+            regime = self.regimes.get(employee.tax_regime)
+            if regime is None:
+                continue
+            taxable_this_month = draft['gross_salary'] - sum(
+                (a['amount'] for a in draft['allowances'] if not a['allowance_type'].is_taxable),
+                Decimal('0.00')
+            )
+            balances = ytd.get(employee.id, {})
+            amount, projected = self.monthly_tds(
+                regime,
+                taxable_this_month,
+                draft.get('recurring_taxable', taxable_this_month),
+                balances.get(YTDBalance.TAXABLE, Decimal('0.00')),
+                balances.get(self.tds_component, Decimal('0.00')),
+            )
+            if not amount:
+                continue
+            draft['deductions'].append({
+                'deduction_type': self.deduction_type,
+                'amount': amount,
+                'description': f"{self.deduction_type.name} (projected annual taxable ₹{projected:,.2f})",
+            })
+            draft['total_deductions'] += amount
+            draft['net_salary'] -= amount
@@ -0,0 +1,218 @@
+"""
+Per-phase telemetry for payroll runs.
+
+A ``RunTelemetry`` is active for the duration of a run (held in a
+contextvar, like the replica routing in core.routers). Engine steps mark
+their phase with ``phase('load')``, ``phase('write')`` and so on; outside a
+run these are no-ops, so dry runs and arrears replays pay nothing. Each
+phase records wall time and query count. The run as a whole also records
+rows written and its RSS growth: the highest resident set size sampled at
+phase boundaries, less the RSS when the run started. (The process's own
+peak RSS is a lifetime high-water mark, so in a long-lived worker it says
+nothing about any one run.) With ``profile=True`` the run is captured under
+cProfile and tracemalloc as well, adding the exact traced peak, and the
+results are stored as a ``PayrollRunProfile``.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection
+
+PHASES = ('load', 'resolve', 'compute', 'write', 'totals')
+
+# Lines kept in the stored profile and memory summaries
+PROFILE_SUMMARY_LINES = 40
+MEMORY_SUMMARY_LINES = 25
+
+# A metric this many times the median of the preceding runs is flagged
+REGRESSION_FACTOR = 1.5
+REGRESSION_WINDOW = 6
+
+_current = ContextVar('payroll_run_telemetry', default=None)
+
+
+def current_rss_kb():
+    """Resident set size of this process right now in KiB, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class RunTelemetry:
+    """Collects phase timings and counters for one run; use as a context manager"""
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.phases = {name: {'seconds': 0.0, 'queries': 0} for name in PHASES}
+        self.rows_written = {}
+        self.queries = 0
+        self.seconds = 0.0
+        self._stack = []
+        self._profiler = None
+        self.profile_data = None
+        self.profile_summary = ''
+        self.memory_summary = ''
+        self.traced_peak_kb = None
+        self._rss_start = None
+        self._rss_peak = None
+
+    def sample_rss(self):
+        rss = current_rss_kb()
+        if rss is not None and (self._rss_peak is None or rss > self._rss_peak):
+            self._rss_peak = rss
+
+    @property
+    def rss_growth_kb(self):
+        if self._rss_start is None or self._rss_peak is None:
+            return None
+        return self._rss_peak - self._rss_start
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        if self._stack:
+            self.phases[self._stack[-1]]['queries'] += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self._query_counter = connection.execute_wrapper(self._count_query)
+        self._query_counter.__enter__()
+        self._rss_start = self._rss_peak = current_rss_kb()
+        if self.profile:
+            tracemalloc.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._started
+        self.sample_rss()
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._capture_profile()
+        self._query_counter.__exit__(*exc_info)
+        _current.reset(self._token)
+        return False
+
+    def _capture_profile(self):
+        snapshot = tracemalloc.take_snapshot()
+        self.traced_peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+        self.memory_summary = '\n'.join(
+            str(stat) for stat in snapshot.statistics('lineno')[:MEMORY_SUMMARY_LINES]
+        )
+
+        self._profiler.create_stats()
+        # Same format as Profile.dump_stats(), so pstats/snakeviz can open it
+        self.profile_data = marshal.dumps(self._profiler.stats)
+        stream = io.StringIO()
+        pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LINES)
+        self.profile_summary = stream.getvalue()
+
+    def as_dict(self, **extra):
+        data = {
+            'seconds': round(self.seconds, 4),
+            'queries': self.queries,
+            'phases': {
+                name: {'seconds': round(values['seconds'], 4), 'queries': values['queries']}
+                for name, values in self.phases.items()
+            },
+            'rows_written': self.rows_written,
+            'rss_growth_kb': self.rss_growth_kb,
+            'profiled': self.profile,
+        }
+        if self.traced_peak_kb is not None:
+            data['traced_peak_kb'] = self.traced_peak_kb
+        data.update(extra)
+        return data
+
+    def save(self, payroll, **extra):
+        """Stores the telemetry on the payroll (and the profile, if captured)"""
+        from .models import Payroll, PayrollRunProfile
+
+        data = self.as_dict(**extra)
+        Payroll.objects.filter(pk=payroll.pk).update(telemetry=data)
+        payroll.telemetry = data
+        if self.profile_data is not None:
+            PayrollRunProfile.objects.create(
+                payroll=payroll,
+                stats=self.profile_data,
+                profile_summary=self.profile_summary,
+                memory_summary=self.memory_summary,
+            )
+
+
+@contextmanager
+def phase(name):
+    """Attributes time and queries inside the block to a phase of the active run, if any"""
+    telemetry = _current.get()
+    if telemetry is None:
+        yield
+        return
+    telemetry._stack.append(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        telemetry.phases[name]['seconds'] += time.perf_counter() - started
+        telemetry._stack.pop()
+        telemetry.sample_rss()
+
+
+def count_rows(table, count):
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.rows_written[table] = telemetry.rows_written.get(table, 0) + count
+
+
+def _metrics(telemetry):
+    employees = telemetry.get('employees') or 0
+    seconds = telemetry.get('seconds') or 0
+    metrics = {
+        'seconds': seconds,
+        'ms_per_employee': round(seconds * 1000 / employees, 3) if employees else None,
+        'queries': telemetry.get('queries'),
+        'rss_growth_kb': telemetry.get('rss_growth_kb'),
+    }
+    for name in PHASES:
+        metrics[f'{name}_seconds'] = telemetry.get('phases', {}).get(name, {}).get('seconds')
+    return metrics
+
+
+def compare_runs(payrolls):
+    """
+    Rows for the run comparison view, oldest first. Each metric is flagged when it
+    exceeds REGRESSION_FACTOR times the median of the previous REGRESSION_WINDOW runs.
+    """
+    rows = []
+    history = []
+    for payroll in payrolls:
+        metrics = _metrics(payroll.telemetry)
+        cells = []
+        for key, value in metrics.items():
+            previous = sorted(m[key] for m in history[-REGRESSION_WINDOW:] if m[key] is not None)
+            median = previous[len(previous) // 2] if previous else None
+            regressed = bool(value is not None and median and value > median * REGRESSION_FACTOR)
+            cells.append({'key': key, 'value': value, 'median': median, 'regressed': regressed})
+        rows.append({
+            'payroll': payroll,
+            'telemetry': payroll.telemetry,
+            'cells': cells,
+            'regressed': any(cell['regressed'] for cell in cells),
+        })
+        history.append(metrics)
+    return rows
+
+
+def metric_labels():
+    return ['Seconds', 'ms / employee', 'Queries', 'RSS growth (KiB)'] + [f'{name.title()} (s)' for name in PHASES]
@@ -1,3 +1,505 @@
-from django.test import TestCase
+import smtplib
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from employees.models import BankDetails, Employee, JobRole, Department, SalaryRevision
+from users.models import CustomUser
+from .arrears import compute_arrears
+from .distribution import CLAIM_LEASE, RateLimiter, claim_batch, process_queue, send_batch
+from .engine import compute_chunk, period_calendar, resume_payroll, run_payroll, write_chunk
+from .integrity import verify
+from .journal import ZERO, Journal
+from .models import (
+    AllowanceType, DeductionType, EmployeeAllowanceConfig, EmployeeDeductionConfig, GLAccount, GLMapping,
+    Payroll, Payslip, PayslipDeduction, YTDBalance
+)
+from .statutory import StatutoryReturn, get_writer
+from .void import void_payroll
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+    """Changelists must cost a fixed number of queries however many rows a page shows"""
+
+    # Session, user, count, rows and the list filters' own lookups
+    QUERY_BUDGET = 12
+
+    CHANGELISTS = [
+        'admin:payroll_payslip_changelist',
+        'admin:payroll_payroll_changelist',
+        'admin:payroll_employeeallowanceconfig_changelist',
+        'admin:payroll_employeedeductionconfig_changelist',
+        'admin:payroll_ytdbalance_changelist',
+        'admin:payroll_payslipdelivery_changelist',
+        'admin:employees_employee_changelist',
+        'admin:employees_salaryrevision_changelist',
+        'admin:employees_jobrole_changelist',
+        'admin:users_customuser_changelist',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.allowance_type = AllowanceType.objects.create(name='HRA')
+        cls.deduction_type = DeductionType.objects.create(name='PF')
+        cls.department = Department.objects.create(name='Engineering')
+        cls.job_role = JobRole.objects.create(title='Developer', department=cls.department)
+
+    def _add_employees(self, start, count):
+        for n in range(start, start + count):
+            user = CustomUser.objects.create_user(f'employee{n}', f'employee{n}@example.com', 'password')
+            employee = Employee.objects.create(
+                user=user,
+                job_role=self.job_role,
+                bank_details=BankDetails.objects.create(account_number=str(n), bank_name='Bank'),
+                date_of_joining=date(2024, 1, 1),
+                salary_base=Decimal('50000.00'),
+            )
+            EmployeeAllowanceConfig.objects.create(
+                employee=employee, allowance_type=self.allowance_type, percentage=Decimal('10')
+            )
+            EmployeeDeductionConfig.objects.create(
+                employee=employee, deduction_type=self.deduction_type, percentage=Decimal('12')
+            )
+
+    def _query_counts(self):
+        counts = {}
+        for name in self.CHANGELISTS:
+            # Measure every page cold, session and user lookups included
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(self.admin)
+
+        self._add_employees(0, 3)
+        run_payroll(4, 2025, processed_by=self.admin)
+        run_payroll(5, 2025, processed_by=self.admin).transition_to('APPROVED')
+        small = self._query_counts()
+
+        self._add_employees(3, 20)
+        run_payroll(6, 2025, processed_by=self.admin).transition_to('APPROVED')
+        large = self._query_counts()
+
+        for name in self.CHANGELISTS:
+            self.assertEqual(small[name], large[name], f"{name} issues queries per row")
+            self.assertLessEqual(large[name], self.QUERY_BUDGET, name)
+
+
+class PayrollLockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def test_payslips_cannot_be_bulk_deleted(self):
+        request = RequestFactory().get('/')
+        request.user = self.admin
+        self.assertNotIn('delete_selected', admin.site._registry[Payslip].get_actions(request))
+
+    def test_no_transitions_while_a_run_is_in_progress(self):
+        payroll = Payroll.objects.create(month=4, year=2025, status='DRAFT', checkpoint_employee_id=0)
+        self.assertEqual(payroll.allowed_transitions(), [])
+        payroll.checkpoint_employee_id = None
+        self.assertEqual([status for status, _ in payroll.allowed_transitions()], ['PROCESSED'])
+
+
+def _add_employee(username, salary_base, date_of_joining=date(2024, 1, 1), **fields):
+    return Employee.objects.create(
+        user=CustomUser.objects.create_user(username, f'{username}@example.com', 'password'),
+        bank_details=BankDetails.objects.create(account_number=username, bank_name='Bank'),
+        date_of_joining=date_of_joining,
+        salary_base=Decimal(salary_base),
+        **fields,
+    )
+
+
+class PayrollRunTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.hra = AllowanceType.objects.create(name='HRA')
+        cls.pf = DeductionType.objects.create(name='PF')
+
+    def _add_configured_employee(self, username, salary_base, date_of_joining=date(2024, 1, 1)):
+        employee = _add_employee(username, salary_base, date_of_joining)
+        EmployeeAllowanceConfig.objects.create(employee=employee, allowance_type=self.hra, percentage=Decimal('10'))
+        EmployeeDeductionConfig.objects.create(employee=employee, deduction_type=self.pf, amount=Decimal('1800.00'))
+        return employee
+
+    def test_joiner_is_paid_the_salary_they_joined_on(self):
+        employee = _add_employee('joiner', '60000.00', date(2025, 4, 16))
+        SalaryRevision.objects.create(
+            employee=employee, effective_from=date(2025, 6, 1), salary_base=Decimal('70000.00')
+        )
+        payslip = run_payroll(4, 2025, processed_by=self.admin).payslips.get()
+        self.assertEqual(payslip.base_salary, Decimal('30000.00'))
+
+    def test_joiner_month_is_prorated_by_day(self):
+        # Joined on the 21st: 10 of April's 30 days
+        self._add_configured_employee('joiner', '30000.00', date(2025, 4, 21))
+        payslip = run_payroll(4, 2025, processed_by=self.admin).payslips.get()
+        self.assertEqual(payslip.base_salary, Decimal('10000.00'))
+        self.assertEqual(
+            sorted(payslip.allowances.values_list('amount', 'description')),
+            [(Decimal('1000.00'), 'HRA (10/30 days)')],
+        )
+        self.assertEqual(payslip.deductions.get().amount, Decimal('600.00'))
+        self.assertEqual(payslip.net_salary, Decimal('10400.00'))
+
+    def test_resuming_twice_does_not_double_count(self):
+        employees = [self._add_configured_employee(f'employee{n}', '20000.00') for n in range(3)]
+        payroll = Payroll.objects.create(month=4, year=2025, status='DRAFT', checkpoint_employee_id=0)
+        # A chunk committed before the run died, without its checkpoint
+        calendar = period_calendar(4, 2025)
+        write_chunk(payroll, compute_chunk(employees[:1], calendar))
+        stale = Payroll.objects.get(pk=payroll.pk)
+
+        payroll = resume_payroll(payroll)
+        with self.assertRaises(ValidationError):
+            resume_payroll(stale)
+
+        payroll.refresh_from_db()
+        self.assertEqual(payroll.status, 'PROCESSED')
+        self.assertEqual(payroll.payslips.count(), 3)
+        self.assertEqual(payroll.employee_count, 3)
+        self.assertEqual(payroll.total_gross_salary, Decimal('66000.00'))
+        self.assertEqual(payroll.total_net_salary, Decimal('60600.00'))
+        self.assertEqual(list(verify(Payroll.objects.filter(pk=payroll.pk), ytd=False)), [])
+
+    def test_void_counts_the_rows_it_deletes(self):
+        for n in range(2):
+            self._add_configured_employee(f'employee{n}', '20000.00')
+        payroll = run_payroll(4, 2025, processed_by=self.admin)
+        record = void_payroll(payroll, voided_by=self.admin, reason='Wrong rates')
+        self.assertEqual((record.payslips_deleted, record.line_items_deleted), (2, 4))
+        self.assertEqual((record.employee_count, record.total_gross_salary), (2, Decimal('44000.00')))
+        self.assertFalse(Payroll.objects.filter(pk=payroll.pk).exists())
+        self.assertFalse(Payslip.objects.exists())
+
+        payroll = run_payroll(4, 2025, processed_by=self.admin)
+        payroll.transition_to('APPROVED')
+        with self.assertRaises(ValidationError):
+            void_payroll(payroll)
+
+    def test_integrity_checks_find_tampered_totals(self):
+        for n in range(2):
+            self._add_configured_employee(f'employee{n}', '20000.00')
+        payroll = run_payroll(4, 2025, processed_by=self.admin)
+        payroll.transition_to('APPROVED')
+        self.assertEqual(list(verify()), [])
+
+        payslip = payroll.payslips.order_by('id').first()
+        Payslip.objects.filter(pk=payslip.pk).update(net_salary=F('net_salary') + 1)
+        YTDBalance.objects.filter(employee=payslip.employee, component=YTDBalance.GROSS).update(amount=0)
+        found = {(discrepancy.check, discrepancy.field) for discrepancy in verify()}
+        self.assertEqual(found, {
+            ('payroll_totals', 'total_net_salary'),
+            ('payslip_net', 'net_salary'),
+            # The ledger was built from the payslip before it was changed
+            ('ytd_ledger', YTDBalance.NET),
+            ('ytd_ledger', YTDBalance.GROSS),
+        })
+
+
+@override_settings(
+    PAYROLL_PF_WAGE_CEILING='15000', PAYROLL_ESI_WAGE_CEILING='21000',
+    PAYROLL_PF_EMPLOYER_RATE='12', PAYROLL_PF_EPS_RATE='8.33', PAYROLL_ESI_EMPLOYER_RATE='3.25',
+)
+class StatutoryReturnTests(TestCase):
+    """PF and ESI returns for members either side of the wage ceilings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        pf = DeductionType.objects.create(name='PF')
+        esi = DeductionType.objects.create(name='ESI')
+        for username, salary_base, uan, pf_amount in (
+            ('at_ceiling', '15000.00', '100000000001', '1800.00'),
+            ('above_ceiling', '20000.00', '100000000002', '1800.00'),
+        ):
+            employee = _add_employee(username, salary_base, uan=uan)
+            EmployeeDeductionConfig.objects.create(employee=employee, deduction_type=pf, amount=Decimal(pf_amount))
+        for username, salary_base, ip_number in (
+            ('esi_covered', '21000.00', '1000000001'),
+            ('esi_excluded', '21001.00', '1000000002'),
+        ):
+            employee = _add_employee(username, salary_base, esi_number=ip_number)
+            EmployeeDeductionConfig.objects.create(employee=employee, deduction_type=esi, percentage=Decimal('0.75'))
+        cls.payroll = run_payroll(4, 2025, processed_by=admin)
+        # A payslip stored before the engine dropped ESI above the ceiling
+        PayslipDeduction.objects.create(
+            payslip=cls.payroll.payslips.get(employee__esi_number='1000000002'),
+            deduction_type=esi, amount=Decimal('157.51'),
+        )
+        cls.payroll.transition_to('APPROVED')
+
+    def _file(self, name):
+        statutory_return = StatutoryReturn(self.payroll, get_writer(name))
+        return list(statutory_return.lines()), statutory_return.totals
+
+    def test_pf_wages_are_capped_at_the_ceiling(self):
+        lines, totals = self._file('pf-ecr')
+        self.assertEqual(lines, [
+            '100000000001#~#at_ceiling#~#15000#~#15000#~#15000#~#15000#~#1800#~#1250#~#550#~#0#~#0\n',
+            '100000000002#~#above_ceiling#~#20000#~#15000#~#15000#~#15000#~#1800#~#1250#~#550#~#0#~#0\n',
+        ])
+        self.assertEqual(totals['members'], 2)
+        self.assertEqual(totals['epf_wages'], 30000)
+        self.assertEqual(totals['employee_share'], 3600)
+
+    def test_esi_leaves_out_payslips_above_the_ceiling(self):
+        lines, totals = self._file('esi-csv')
+        self.assertEqual(lines[1:], ['1000000001,esi_covered,30,21000,,\r\n'])
+        self.assertEqual(totals['members'], 1)
+        self.assertEqual((totals['wages'], totals['employee_share'], totals['employer_share']), (21000, 158, 683))
+        self.assertEqual(totals['excluded_members'], 1)
+        self.assertEqual(totals['excluded_wages'], 21001)
+        self.assertEqual(totals['excluded_deducted'], Decimal('157.51'))
+
+
+class JournalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        hra = AllowanceType.objects.create(name='HRA')
+        cls.pf = DeductionType.objects.create(name='PF')
+        for code, name, fields in (
+            ('5000', 'Salaries', {'component': GLMapping.BASIC}),
+            ('5100', 'Allowances', {'component': GLMapping.ALLOWANCE, 'allowance_type': hra}),
+            ('2100', 'PF payable', {'component': GLMapping.DEDUCTION, 'deduction_type': cls.pf}),
+            ('2200', 'Salaries payable', {'component': GLMapping.NET_PAY}),
+        ):
+            GLMapping.objects.create(account=GLAccount.objects.create(code=code, name=name), **fields)
+        for n, department in enumerate(['Engineering', 'Sales', 'Engineering']):
+            role, _ = JobRole.objects.get_or_create(
+                title='Staff', department=Department.objects.get_or_create(name=department)[0]
+            )
+            employee = _add_employee(f'employee{n}', '20000.00', job_role=role)
+            EmployeeAllowanceConfig.objects.create(employee=employee, allowance_type=hra, percentage=Decimal('10'))
+            EmployeeDeductionConfig.objects.create(employee=employee, deduction_type=cls.pf, amount=Decimal('1800.00'))
+        cls.payroll = run_payroll(4, 2025, processed_by=admin)
+        cls.payroll.transition_to('APPROVED')
+
+    def test_journal_balances_per_cost_center(self):
+        journal = Journal(self.payroll)
+        self.assertEqual(journal.total_debit, journal.total_credit)
+        self.assertEqual(journal.total_debit, self.payroll.total_gross_salary)
+        self.assertEqual(
+            [(line.cost_center, line.component, line.debit, line.credit) for line in journal.lines],
+            [
+                ('Engineering', 'Basic salary', Decimal('40000.00'), ZERO),
+                ('Sales', 'Basic salary', Decimal('20000.00'), ZERO),
+                ('Engineering', 'HRA', Decimal('4000.00'), ZERO),
+                ('Sales', 'HRA', Decimal('2000.00'), ZERO),
+                ('Engineering', 'PF', ZERO, Decimal('3600.00')),
+                ('Sales', 'PF', ZERO, Decimal('1800.00')),
+                ('Engineering', 'Net pay', ZERO, Decimal('40400.00')),
+                ('Sales', 'Net pay', ZERO, Decimal('20200.00')),
+            ],
+        )
+
+    def test_unmapped_components_are_refused(self):
+        GLMapping.objects.filter(deduction_type=self.pf).delete()
+        with self.assertRaisesMessage(ValidationError, 'No GL account mapped for: PF'):
+            Journal(self.payroll)
+
+
+class ArrearsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.employee = _add_employee('employee', '30000.00')
+
+    def test_each_revision_is_weighted_by_its_own_days(self):
+        run_payroll(4, 2025, processed_by=self.admin).transition_to('APPROVED')
+        # April: 10 days at 30000, 10 at 40000 and 10 at 50000 average 40000
+        SalaryRevision.objects.create(
+            employee=self.employee, effective_from=date(2025, 4, 11), salary_base=Decimal('40000.00')
+        )
+        SalaryRevision.objects.create(
+            employee=self.employee, effective_from=date(2025, 4, 21), salary_base=Decimal('50000.00')
+        )
+        [result] = compute_arrears(date(2025, 4, 11))
+        self.assertEqual(result['amount'], Decimal('10000.00'))
+        self.assertEqual(result['breakdown'], {'4/2025': {'Earning: Base Salary': '10000.00'}})
+
+
+class TransientFailureBackend(locmem.EmailBackend):
+    """Drops the connection on every send"""
+
+    def send_messages(self, messages):
+        raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+
+class RefusingBackend(locmem.EmailBackend):
+    """Refuses every recipient"""
+
+    def send_messages(self, messages):
+        raise smtplib.SMTPRecipientsRefused({messages[0].to[0]: (550, b'No such user')})
+
+
+@override_settings(
+    PAYROLL_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    PAYROLL_EMAIL_MAX_ATTEMPTS=3,
+    PAYROLL_EMAIL_RETRY_BACKOFF=60,
+)
+class PayslipDistributionTests(TestCase):
+    """Payslip emails against the locmem backend (see payroll.distribution)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        for n in range(3):
+            user = CustomUser.objects.create_user(f'employee{n}', f'employee{n}@example.com', 'password')
+            Employee.objects.create(
+                user=user,
+                bank_details=BankDetails.objects.create(account_number=str(n), bank_name='Bank'),
+                date_of_joining=date(2024, 1, 1),
+                salary_base=Decimal('50000.00'),
+            )
+
+    def setUp(self):
+        self.payroll = run_payroll(4, 2025, processed_by=self.admin)
+
+    def _statuses(self):
+        return sorted(self.payroll.deliveries.values_list('status', flat=True))
+
+    def _recipients(self):
+        return sorted(address for message in mail.outbox for address in message.to)
+
+    def test_approve_queues_and_reopen_cancels_unsent(self):
+        self.assertEqual(self._statuses(), [])
+        self.payroll.transition_to('APPROVED')
+        self.assertEqual(self._statuses(), ['PENDING'] * 3)
+
+        process_queue(size=1, per_minute=0, max_batches=1)
+        self.payroll.transition_to('PROCESSED')
+        # The one already sent stays as a record
+        self.assertEqual(self._statuses(), ['SENT'])
+
+        # Re-approving sends the corrected payslip to everyone, once
+        self.payroll.transition_to('APPROVED')
+        self.assertEqual(self._statuses(), ['PENDING'] * 3)
+        process_queue(per_minute=0)
+        self.assertEqual(self._statuses(), ['SENT'] * 3)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_claims_are_exclusive_until_the_lease_expires(self):
+        self.payroll.transition_to('APPROVED')
+        first_token, first = claim_batch(2)
+        second_token, second = claim_batch(10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({d.id for d in first} & {d.id for d in second})
+        self.assertEqual(claim_batch(10)[1], [])
+
+        # A sender that died leaves its claim; once the lease runs out another takes it over
+        taken_over = claim_batch(10, now=timezone.now() + CLAIM_LEASE + timedelta(seconds=1))[1]
+        self.assertEqual({d.id for d in taken_over}, {d.id for d in first} | {d.id for d in second})
+
+    def test_claim_is_compare_and_set(self):
+        self.payroll.transition_to('APPROVED')
+        rival = []
+
+        def rival_claims_first(execute, sql, params, many, context):
+            # Another sender claims the rows between this one's SELECT and its UPDATE
+            if sql.startswith('UPDATE') and 'claimed_by' in sql and not rival:
+                rival.append(None)
+                rival.append(claim_batch(10))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(rival_claims_first):
+            _, claimed = claim_batch(10)
+        self.assertEqual(claimed, [])
+        self.assertEqual(len(rival[1][1]), 3)
+
+    def test_two_senders_never_send_a_payslip_twice(self):
+        self.payroll.transition_to('APPROVED')
+        limiter = RateLimiter(0)
+        _, first = claim_batch(2)
+        _, second = claim_batch(2)
+        send_batch(second, get_connection('django.core.mail.backends.locmem.EmailBackend'), limiter)
+        send_batch(first, get_connection('django.core.mail.backends.locmem.EmailBackend'), limiter)
+        self.assertEqual(process_queue(per_minute=0)['sent'], 0)
+        self.assertEqual(self._recipients(), [f'employee{n}@example.com' for n in range(3)])
+        self.assertEqual(self._statuses(), ['SENT'] * 3)
+
+    def test_transient_failures_retry_with_backoff_then_fail(self):
+        self.payroll.transition_to('APPROVED')
+        limiter = RateLimiter(0)
+        now = timezone.now()
+        for attempt, delay in ((1, 60), (2, 120)):
+            _, deliveries = claim_batch(10, now=now)
+            counts = send_batch(deliveries, TransientFailureBackend(), limiter, now=now)
+            self.assertEqual(counts['retrying'], 3)
+            for delivery in self.payroll.deliveries.all():
+                self.assertEqual(delivery.status, 'PENDING')
+                self.assertEqual(delivery.attempts, attempt)
+                self.assertEqual(delivery.next_attempt_at, now + timedelta(seconds=delay))
+                self.assertIn('SMTPServerDisconnected', delivery.last_error)
+            # Not due again until the backoff has passed
+            self.assertEqual(claim_batch(10, now=now + timedelta(seconds=delay - 1))[1], [])
+            now += timedelta(seconds=delay)
+
+        _, deliveries = claim_batch(10, now=now)
+        self.assertEqual(send_batch(deliveries, TransientFailureBackend(), limiter, now=now)['failed'], 3)
+        self.assertEqual(self._statuses(), ['FAILED'] * 3)
+        self.assertEqual(claim_batch(10, now=now + timedelta(days=1))[1], [])
+
+    def test_refused_recipients_fail_without_retry(self):
+        self.payroll.transition_to('APPROVED')
+        _, deliveries = claim_batch(10)
+        self.assertEqual(send_batch(deliveries, RefusingBackend(), RateLimiter(0))['failed'], 3)
+        self.assertEqual(set(self.payroll.deliveries.values_list('attempts', flat=True)), {1})
+        self.assertEqual(mail.outbox, [])
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def _clock(self):
+        return self.now
+
+    def _sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_allows_a_burst_then_paces_sends(self):
+        limiter = RateLimiter(120, clock=self._clock, sleep=self._sleep)
+        limiter.wait()
+        limiter.wait()
+        self.assertEqual(self.sleeps, [])
+        limiter.wait()
+        limiter.wait()
+        self.assertEqual(self.sleeps, [0.5, 0.5])
+
+    def test_refills_while_idle(self):
+        limiter = RateLimiter(60, clock=self._clock, sleep=self._sleep)
+        limiter.wait()
+        self.now += 1
+        limiter.wait()
+        self.assertEqual(self.sleeps, [])
+
+    def test_zero_is_unlimited(self):
+        limiter = RateLimiter(0, clock=self._clock, sleep=self._sleep)
+        for _ in range(100):
+            limiter.wait()
+        self.assertEqual(self.sleeps, [])
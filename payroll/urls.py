@@ -4,6 +4,12 @@ from payroll import views
 urlpatterns = [
     path('', views.list_payrolls, name='list_payrolls'),
     path('process/', views.process_payroll, name='process_payroll'),
+    path('process/dry-run.csv', views.dry_run_report, name='dry_run_report'),
     path('<int:payroll_id>/', views.payroll_detail, name='payroll_detail'),
+    path('<int:payroll_id>/diff/', views.payroll_diff_api, name='payroll_diff_api'),
+    path('<int:payroll_id>/transition/', views.transition_payroll, name='transition_payroll'),
+    path('<int:payroll_id>/void/', views.void_payroll_run, name='void_payroll_run'),
+    path('<int:payroll_id>/journal.<slug:export_format>', views.journal_export, name='journal_export'),
+    path('<int:payroll_id>/returns/<slug:return_format>/', views.statutory_return_file, name='statutory_return_file'),
 ]
 
@@ -1,17 +1,49 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.db.models import Count
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import date
-from decimal import Decimal
+import csv
 
-from employees.models import Employee
-from .models import (
-    Payroll, Payslip, PayslipAllowance, PayslipDeduction,
-    EmployeeAllowanceConfig, EmployeeDeductionConfig
-)
+from employees.models import PayGroup
+from .models import Payroll, Payslip
 from .forms import ProcessPayrollForm
+from .diff import diff_page
+from .engine import run_payroll_checkpointed, validate_payroll
+from .journal import EXPORTS as JOURNAL_EXPORTS, Journal
+from .statutory import StatutoryReturn, get_writer, writer_names
+from .void import void_and_rerun, void_payroll
+from .ytd import COUNTED_STATUSES
+
+
+DIFF_PAGE_SIZE = 50
+
+# Issues shown inline on the process page; the CSV report has all of them
+DRY_RUN_DISPLAY_LIMIT = 200
+
+
+class _Echo:
+    """File-like object whose write() just returns the value, for streaming CSV"""
+    def write(self, value):
+        return value
+
+
+def _get_compare_payroll(request, payroll):
+    """Payroll to diff against: ?compare_to=<id>, defaulting to the previous period"""
+    compare_to = _parse_int(request.GET.get('compare_to'), None)
+    if compare_to is not None:
+        return Payroll.objects.filter(id=compare_to).exclude(id=payroll.id).first()
+    return payroll.previous()
+
+
+def _parse_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
 
 
 @login_required
@@ -25,13 +57,20 @@ def list_payrolls(request):
         return redirect('dashboard')
     
     # Get all payrolls ordered by date
-    payrolls = Payroll.objects.select_related('processed_by').order_by('-year', '-month')
+    payrolls = Payroll.objects.select_related('processed_by', 'pay_group').order_by('-year', '-month', 'pay_group__code')
+    
+    # Optional entity/pay group filter
+    pay_groups = PayGroup.objects.all()
+    pay_group_id = request.GET.get('pay_group', '')
+    if pay_group_id == 'default':
+        payrolls = payrolls.filter(pay_group__isnull=True)
+    elif pay_group_id.isdigit():
+        payrolls = payrolls.filter(pay_group_id=pay_group_id)
     
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'payrolls': payrolls,
-        'is_hr_or_admin': True,
+        'pay_groups': pay_groups,
+        'selected_pay_group': pay_group_id,
         'active_nav': 'payroll',
     }
     
@@ -53,160 +92,53 @@ def process_payroll(request):
         if form.is_valid():
             month = form.cleaned_data['month']
             year = form.cleaned_data['year']
+            pay_group = form.cleaned_data.get('pay_group')
             notes = form.cleaned_data.get('notes', '')
             
-            # Check if payroll already exists
-            if Payroll.objects.filter(month=month, year=year).exists():
+            # Dry run: compute everything, write nothing, report problems
+            if 'dry_run' in request.POST:
+                issues = []
+                issue_counts = {'ERROR': 0, 'WARNING': 0}
+                for issue in validate_payroll(month, year, pay_group):
+                    issue_counts[issue['severity']] += 1
+                    if len(issues) < DRY_RUN_DISPLAY_LIMIT:
+                        issues.append(issue)
+                return render(request, 'payroll/process_payroll.html', {
+                    'form': form,
+                    'dry_run': True,
+                    'dry_run_issues': issues,
+                    'dry_run_counts': issue_counts,
+                    'dry_run_truncated': sum(issue_counts.values()) > len(issues),
+                    'month': month,
+                    'year': year,
+                    'pay_group': pay_group,
+                    'active_nav': 'payroll',
+                })
+            
+            # Check if payroll already exists (an interrupted run is resumed instead)
+            if Payroll.for_group(pay_group).filter(
+                month=month, year=year, checkpoint_employee_id__isnull=True
+            ).exists():
                 messages.error(request, f'Payroll for {month}/{year} already exists.')
                 return render(request, 'payroll/process_payroll.html', {
-                    'user': user,
-                    'name': user.first_name or user.username,
                     'form': form,
-                    'is_hr_or_admin': True,
                 })
             
             try:
-                with transaction.atomic():
-                    # Create payroll record
-                    payroll = Payroll.objects.create(
-                        month=month,
-                        year=year,
-                        status='PROCESSED',
-                        processed_by=user,
-                        notes=notes
-                    )
-                    
-                    # Get all active employees
-                    employees = Employee.objects.select_related('user', 'job_role').all()
-                    
-                    total_gross = Decimal('0.00')
-                    total_deductions = Decimal('0.00')
-                    total_net = Decimal('0.00')
-                    employee_count = 0
-                    
-                    # Process each employee
-                    for employee in employees:
-                        base_salary = employee.salary_base
-                        
-                        # Calculate allowances
-                        allowance_configs = EmployeeAllowanceConfig.objects.filter(
-                            employee=employee,
-                            is_active=True
-                        ).select_related('allowance_type')
-                        
-                        # Check date validity for allowances
-                        current_date = date(year, month, 1)
-                        valid_allowances = []
-                        for config in allowance_configs:
-                            if config.effective_from and config.effective_from > current_date:
-                                continue
-                            if config.effective_to and config.effective_to < current_date:
-                                continue
-                            valid_allowances.append(config)
-                        
-                        total_allowances = Decimal('0.00')
-                        payslip_allowances = []
-                        
-                        for config in valid_allowances:
-                            if config.is_percentage_type():
-                                amount = base_salary * (config.percentage / Decimal('100'))
-                            else:
-                                amount = config.amount
-                            
-                            total_allowances += amount
-                            payslip_allowances.append({
-                                'allowance_type': config.allowance_type,
-                                'amount': amount,
-                                'description': f"{config.allowance_type.name}"
-                            })
-                        
-                        # Calculate deductions
-                        deduction_configs = EmployeeDeductionConfig.objects.filter(
-                            employee=employee,
-                            is_active=True
-                        ).select_related('deduction_type')
-                        
-                        # Check date validity for deductions
-                        valid_deductions = []
-                        for config in deduction_configs:
-                            if config.effective_from and config.effective_from > current_date:
-                                continue
-                            if config.effective_to and config.effective_to < current_date:
-                                continue
-                            valid_deductions.append(config)
-                        
-                        total_deductions_amount = Decimal('0.00')
-                        payslip_deductions = []
-                        
-                        for config in valid_deductions:
-                            if config.is_percentage_type():
-                                # For deductions, percentage can be of base or gross
-                                # Using base salary for now (can be changed to gross if needed)
-                                amount = base_salary * (config.percentage / Decimal('100'))
-                            else:
-                                amount = config.amount
-                            
-                            total_deductions_amount += amount
-                            payslip_deductions.append({
-                                'deduction_type': config.deduction_type,
-                                'amount': amount,
-                                'description': f"{config.deduction_type.name}"
-                            })
-                        
-                        # Calculate totals
-                        gross_salary = base_salary + total_allowances
-                        net_salary = gross_salary - total_deductions_amount
-                        
-                        # Create payslip
-                        payslip = Payslip.objects.create(
-                            payroll=payroll,
-                            employee=employee,
-                            base_salary=base_salary,
-                            gross_salary=gross_salary,
-                            total_deductions=total_deductions_amount,
-                            net_salary=net_salary
-                        )
-                        
-                        # Create payslip allowances
-                        for allowance_data in payslip_allowances:
-                            PayslipAllowance.objects.create(
-                                payslip=payslip,
-                                allowance_type=allowance_data['allowance_type'],
-                                amount=allowance_data['amount'],
-                                description=allowance_data['description']
-                            )
-                        
-                        # Create payslip deductions
-                        for deduction_data in payslip_deductions:
-                            PayslipDeduction.objects.create(
-                                payslip=payslip,
-                                deduction_type=deduction_data['deduction_type'],
-                                amount=deduction_data['amount'],
-                                description=deduction_data['description']
-                            )
-                        
-                        # Update totals
-                        total_gross += gross_salary
-                        total_deductions += total_deductions_amount
-                        total_net += net_salary
-                        employee_count += 1
-                    
-                    # Update payroll totals
-                    payroll.total_gross_salary = total_gross
-                    payroll.total_deductions = total_deductions
-                    payroll.total_net_salary = total_net
-                    payroll.employee_count = employee_count
-                    payroll.save()
-                    
-                    messages.success(
-                        request,
-                        f'Payroll for {month}/{year} processed successfully! '
-                        f'{employee_count} employees processed.'
-                    )
-                    return redirect('payroll_detail', payroll_id=payroll.id)
-                    
-            except Exception as e:
-                messages.error(request, f'Error processing payroll: {str(e)}')
+                payroll = run_payroll_checkpointed(
+                    month, year, processed_by=user, notes=notes, pay_group=pay_group
+                )
+                messages.success(
+                    request,
+                    f'Payroll for {month}/{year} processed successfully! '
+                    f'{payroll.employee_count} employees processed.'
+                )
+                return redirect('payroll_detail', payroll_id=payroll.id)
+            except ValidationError as e:
+                messages.error(request, f'Error processing payroll: {e.messages[0]}')
+            except IntegrityError:
+                # Another request created the same run in the meantime
+                messages.error(request, f'Payroll for {month}/{year} already exists.')
     else:
         # Pre-fill with current month/year
         today = timezone.now().date()
@@ -216,10 +148,7 @@ def process_payroll(request):
         })
     
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'form': form,
-        'is_hr_or_admin': True,
         'active_nav': 'payroll',
     }
     
@@ -237,7 +166,7 @@ def payroll_detail(request, payroll_id):
         return redirect('dashboard')
     
     payroll = get_object_or_404(
-        Payroll.objects.select_related('processed_by'),
+        Payroll.objects.select_related('processed_by', 'pay_group'),
         id=payroll_id
     )
     
@@ -245,13 +174,208 @@ def payroll_detail(request, payroll_id):
         'employee__user', 'employee__job_role'
     ).order_by('employee__user__first_name', 'employee__user__last_name')
     
+    # Changes against another run (previous period by default), paged by employee_id
+    compare_payroll = _get_compare_payroll(request, payroll)
+    diff_after = _parse_int(request.GET.get('diff_after'), 0)
+    diff_records, diff_next_after = [], None
+    if compare_payroll:
+        diff_records, diff_next_after = diff_page(
+            compare_payroll, payroll, after=diff_after, page_size=DIFF_PAGE_SIZE
+        )
+    
+    # Payslip email progress, one GROUP BY
+    delivery_counts = dict(
+        payroll.deliveries.values_list('status').annotate(count=Count('id')).order_by()
+    )
+    
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
         'payroll': payroll,
         'payslips': payslips,
-        'is_hr_or_admin': True,
+        'compare_payroll': compare_payroll,
+        'other_payrolls': Payroll.for_group(payroll.pay_group).exclude(id=payroll.id).only(
+            'id', 'month', 'year', 'status'
+        ),
+        'diff_records': diff_records,
+        'diff_after': diff_after,
+        'diff_next_after': diff_next_after,
+        'delivery_counts': delivery_counts,
+        'return_formats': writer_names() if payroll.status in COUNTED_STATUSES else [],
+        'journal_formats': list(JOURNAL_EXPORTS) if payroll.status in COUNTED_STATUSES else [],
         'active_nav': 'payroll',
     }
     
     return render(request, 'payroll/payroll_detail.html', context)
+
+
+@login_required
+def payroll_diff_api(request, payroll_id):
+    """
+    JSON diff of a payroll against another run (?compare_to=<id>, default previous period).
+    Paged by employee_id: pass ?after=<next_after> from the previous response.
+    """
+    user = request.user
+    
+    if not (user.is_hr() or user.is_admin()):
+        return JsonResponse({'error': 'You do not have permission to access this page.'}, status=403)
+    
+    payroll = get_object_or_404(Payroll, id=payroll_id)
+    compare_payroll = _get_compare_payroll(request, payroll)
+    if compare_payroll is None:
+        return JsonResponse({'error': 'No payroll to compare against.'}, status=404)
+    
+    limit = min(max(_parse_int(request.GET.get('limit'), DIFF_PAGE_SIZE), 1), 1000)
+    records, next_after = diff_page(
+        compare_payroll, payroll, after=_parse_int(request.GET.get('after'), 0), page_size=limit
+    )
+    
+    return JsonResponse({
+        'payroll': payroll.id,
+        'compare_to': compare_payroll.id,
+        'results': records,
+        'next_after': next_after,
+    })
+
+
+@login_required
+def transition_payroll(request, payroll_id):
+    """Move a payroll to its next status (approve, mark paid, reopen) - only HR and Admin can access"""
+    user = request.user
+    
+    # Check if user is HR or Admin
+    if not (user.is_hr() or user.is_admin()):
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('dashboard')
+    
+    payroll = get_object_or_404(Payroll, id=payroll_id)
+    
+    if request.method == 'POST':
+        try:
+            payroll.transition_to(request.POST.get('status'))
+            messages.success(
+                request,
+                f'Payroll for {payroll.month}/{payroll.year} marked as {payroll.get_status_display()}.'
+            )
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+    
+    return redirect('payroll_detail', payroll_id=payroll.id)
+
+
+@login_required
+def void_payroll_run(request, payroll_id):
+    """Void a draft/processed payroll, optionally re-running the period - only HR and Admin can access"""
+    user = request.user
+    
+    # Check if user is HR or Admin
+    if not (user.is_hr() or user.is_admin()):
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('dashboard')
+    
+    payroll = get_object_or_404(Payroll, id=payroll_id)
+    
+    if request.method != 'POST':
+        return redirect('payroll_detail', payroll_id=payroll.id)
+    
+    reason = request.POST.get('reason', '').strip()
+    try:
+        if request.POST.get('rerun'):
+            record, new_payroll = void_and_rerun(payroll, voided_by=user, reason=reason)
+            messages.success(
+                request,
+                f'Payroll for {payroll.month}/{payroll.year} voided ({record.payslips_deleted} payslips) '
+                f'and re-run for {new_payroll.employee_count} employees.'
+            )
+            return redirect('payroll_detail', payroll_id=new_payroll.id)
+        record = void_payroll(payroll, voided_by=user, reason=reason)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+        return redirect('payroll_detail', payroll_id=payroll.id)
+    
+    messages.success(
+        request, f'Payroll for {payroll.month}/{payroll.year} voided ({record.payslips_deleted} payslips deleted).'
+    )
+    return redirect('list_payrolls')
+
+
+@login_required
+def dry_run_report(request):
+    """Stream the full dry-run validation report for ?month=&year= as CSV - only HR and Admin can access"""
+    user = request.user
+    
+    # Check if user is HR or Admin
+    if not (user.is_hr() or user.is_admin()):
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('dashboard')
+    
+    form = ProcessPayrollForm(request.GET)
+    if not form.is_valid():
+        messages.error(request, 'Please provide a valid month and year.')
+        return redirect('process_payroll')
+    
+    month = form.cleaned_data['month']
+    year = form.cleaned_data['year']
+    pay_group = form.cleaned_data.get('pay_group')
+    writer = csv.writer(_Echo())
+    
+    def rows():
+        yield writer.writerow(['severity', 'code', 'employee_id', 'employee_name', 'message'])
+        for issue in validate_payroll(month, year, pay_group):
+            yield writer.writerow([
+                issue['severity'], issue['code'], issue['employee_id'] or '',
+                issue['employee_name'], issue['message'],
+            ])
+    
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="payroll_dry_run_{year}_{month:02d}.csv"'
+    return response
+
+
+@login_required
+def statutory_return_file(request, payroll_id, return_format):
+    """Stream a PF/ESI return file for an approved or paid payroll - only HR and Admin can access"""
+    user = request.user
+    
+    # Check if user is HR or Admin
+    if not (user.is_hr() or user.is_admin()):
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('dashboard')
+    
+    payroll = get_object_or_404(Payroll.objects.select_related('pay_group'), id=payroll_id)
+    
+    try:
+        statutory_return = StatutoryReturn(payroll, get_writer(return_format))
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+        return redirect('payroll_detail', payroll_id=payroll.id)
+    
+    response = StreamingHttpResponse(statutory_return.lines(), content_type=statutory_return.writer.content_type)
+    response['Content-Disposition'] = f'attachment; filename="{statutory_return.filename}"'
+    return response
+
+
+@login_required
+def journal_export(request, payroll_id, export_format):
+    """Stream the payroll's GL journal as CSV or JSON - only HR and Admin can access"""
+    user = request.user
+    
+    # Check if user is HR or Admin
+    if not (user.is_hr() or user.is_admin()):
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('dashboard')
+    
+    payroll = get_object_or_404(Payroll.objects.select_related('pay_group'), id=payroll_id)
+    if export_format not in JOURNAL_EXPORTS:
+        messages.error(request, f'Unknown journal format "{export_format}".')
+        return redirect('payroll_detail', payroll_id=payroll.id)
+    
+    # Built and balance-checked up front, so a failed check never starts a download
+    try:
+        journal = Journal(payroll)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+        return redirect('payroll_detail', payroll_id=payroll.id)
+    
+    content_type, export = JOURNAL_EXPORTS[export_format]
+    response = StreamingHttpResponse(export(journal), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{journal.reference.lower()}.{export_format}"'
+    return response
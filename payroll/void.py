@@ -0,0 +1,95 @@
+"""
+Voiding (and re-running) a payroll period.
+
+Deleting a ``Payroll`` through the ORM goes through Django's deletion
+collector, which loads every payslip and line item into memory. Voiding
+deletes them with set-based DELETEs instead, in dependency order and in
+keyset chunks of payslip ids, so memory stays flat however large the run.
+Only DRAFT and PROCESSED runs can be voided: approved runs are already in
+the YTD ledger and must be reopened first.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .engine import run_payroll
+from .models import (
+    Arrear, Payroll, PayrollVoid, Payslip, PayslipAllowance, PayslipDeduction, PayslipDelivery
+)
+
+# Payslips (with their line items) deleted per batch
+CHUNK_SIZE = 5000
+
+
+def _delete_payslips(payroll):
+    """Deletes a run's line items and payslips chunk by chunk. Returns (payslips, line items) deleted."""
+    payslips_deleted = 0
+    lines_deleted = 0
+    last_id = 0
+    while True:
+        ids = list(Payslip.objects.filter(
+            payroll=payroll, id__gt=last_id
+        ).order_by('id').values_list('id', flat=True)[:CHUNK_SIZE])
+        if not ids:
+            return payslips_deleted, lines_deleted
+        last_id = ids[-1]
+
+        # Line items have no dependents, so these are single fast-path DELETEs
+        lines_deleted += PayslipAllowance.objects.filter(payslip_id__in=ids).delete()[0]
+        lines_deleted += PayslipDeduction.objects.filter(payslip_id__in=ids).delete()[0]
+        # Email delivery records go with the payslips they were for
+        PayslipDelivery.objects.filter(payslip_id__in=ids).delete()
+        # With the children gone, the collector only finds this chunk's payslips to delete
+        payslips_deleted += Payslip.objects.filter(id__in=ids).delete()[1].get(Payslip._meta.label, 0)
+
+
+def void_payroll(payroll, voided_by=None, reason=''):
+    """
+    Deletes a DRAFT or PROCESSED payroll with its payslips and keeps a PayrollVoid
+    record. Arrears it paid become pending again. Returns the PayrollVoid.
+    """
+    with transaction.atomic():
+        # Lock the row so a concurrent approval can't slip in while we delete
+        locked = Payroll.objects.select_for_update().filter(
+            pk=payroll.pk, status__in=Payroll.VOIDABLE_STATUSES
+        ).first()
+        if locked is None:
+            raise ValidationError(
+                f"Only draft or processed payrolls can be voided; reopen payroll "
+                f"{payroll.month}/{payroll.year} first."
+            )
+
+        payslips_deleted, lines_deleted = _delete_payslips(locked)
+        Arrear.objects.filter(payroll=locked).update(payroll=None)
+
+        record = PayrollVoid.objects.create(
+            payroll_id=locked.pk,
+            pay_group_id=locked.pay_group_id,
+            month=locked.month,
+            year=locked.year,
+            status=locked.status,
+            employee_count=locked.employee_count,
+            total_gross_salary=locked.total_gross_salary,
+            total_net_salary=locked.total_net_salary,
+            payslips_deleted=payslips_deleted,
+            line_items_deleted=lines_deleted,
+            reason=reason,
+            voided_by=voided_by,
+        )
+        Payroll.objects.filter(pk=locked.pk).delete()
+    return record
+
+
+def void_and_rerun(payroll, voided_by=None, reason=''):
+    """Voids a payroll and runs the same period again. Returns (PayrollVoid, new Payroll)."""
+    with transaction.atomic():
+        record = void_payroll(payroll, voided_by, reason)
+        new_payroll = run_payroll(
+            payroll.month,
+            payroll.year,
+            pay_group=payroll.pay_group,
+            processed_by=voided_by,
+            notes=f"Re-run of voided payroll #{record.payroll_id}" + (f": {reason}" if reason else ''),
+        )
+        record.rerun_payroll = new_payroll
+        record.save(update_fields=['rerun_payroll'])
+    return record, new_payroll
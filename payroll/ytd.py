@@ -0,0 +1,177 @@
+"""
+Year-to-date ledger maintenance.
+
+Approving a payroll adds its per-employee totals to ``YTDBalance`` and
+reopening it subtracts them again, so YTD figures never need the
+employee's full payslip history to be re-summed. ``rebuild_financial_year``
+recomputes a year from scratch for repairs (``manage.py rebuild_ytd``).
+
+The ledger holds the year's running totals. A payslip shows YTD as of its
+own period instead, so ``get_ytd_as_of`` sums the employee's payslips up
+to that period (at most twelve).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import Payroll, Payslip, PayslipAllowance, PayslipDeduction, YTDBalance
+
+# Employees whose balances are read and written per batch
+CHUNK_SIZE = 1000
+
+# Statuses whose payslips count towards YTD
+COUNTED_STATUSES = ('APPROVED', 'PAID')
+
+
+def financial_year_for(month, year):
+    """Starting year of the financial year a pay period falls in (April-March by default)"""
+    start_month = getattr(settings, 'PAYROLL_FINANCIAL_YEAR_START_MONTH', 4)
+    return year if month >= start_month else year - 1
+
+
+def current_financial_year():
+    today = timezone.localdate()
+    return financial_year_for(today.month, today.year)
+
+
+def _payroll_deltas(payroll):
+    """
+    Per-employee component amounts for one payroll, from three grouped queries:
+    {employee_id: {component: amount}}
+    """
+    deltas = {}
+    for employee_id, gross, deductions, net in Payslip.objects.filter(
+        payroll=payroll
+    ).values_list('employee_id', 'gross_salary', 'total_deductions', 'net_salary').order_by():
+        deltas[employee_id] = {
+            YTDBalance.GROSS: gross,
+            YTDBalance.TAXABLE: gross,
+            YTDBalance.TOTAL_DEDUCTIONS: deductions,
+            YTDBalance.NET: net,
+        }
+
+    # Taxable income is gross less non-taxable allowances
+    for row in PayslipAllowance.objects.filter(
+        payslip__payroll=payroll, allowance_type__is_taxable=False
+    ).values('payslip__employee_id').annotate(total=Sum('amount')).order_by():
+        deltas[row['payslip__employee_id']][YTDBalance.TAXABLE] -= row['total']
+
+    for row in PayslipDeduction.objects.filter(
+        payslip__payroll=payroll
+    ).values('payslip__employee_id', 'deduction_type_id').annotate(total=Sum('amount')).order_by():
+        component = YTDBalance.deduction_component(row['deduction_type_id'])
+        deltas[row['payslip__employee_id']][component] = row['total']
+
+    return deltas
+
+
+def _apply_deltas(financial_year, deltas, sign):
+    """Adds sign * deltas to the ledger, one read and two bulk writes per chunk of employees"""
+    employee_ids = list(deltas)
+    now = timezone.now()
+    for i in range(0, len(employee_ids), CHUNK_SIZE):
+        chunk = employee_ids[i:i + CHUNK_SIZE]
+        existing = {
+            (balance.employee_id, balance.component): balance
+            for balance in YTDBalance.objects.select_for_update().filter(
+                financial_year=financial_year, employee_id__in=chunk
+            )
+        }
+        to_update = []
+        to_create = []
+        for employee_id in chunk:
+            for component, amount in deltas[employee_id].items():
+                balance = existing.get((employee_id, component))
+                if balance is None:
+                    to_create.append(YTDBalance(
+                        employee_id=employee_id,
+                        financial_year=financial_year,
+                        component=component,
+                        amount=sign * amount,
+                    ))
+                else:
+                    balance.amount += sign * amount
+                    balance.updated_at = now
+                    to_update.append(balance)
+        YTDBalance.objects.bulk_update(to_update, ['amount', 'updated_at'])
+        YTDBalance.objects.bulk_create(to_create)
+
+
+def apply_payroll(payroll, sign=1):
+    """Adds a payroll's totals to the YTD ledger (sign=-1 takes them back out)"""
+    with transaction.atomic():
+        _apply_deltas(financial_year_for(payroll.month, payroll.year), _payroll_deltas(payroll), sign)
+
+
+def _payslips_through(payslip):
+    """The employee's counted payslips in payslip's financial year, up to and including its period"""
+    payroll = payslip.payroll
+    start_month = getattr(settings, 'PAYROLL_FINANCIAL_YEAR_START_MONTH', 4)
+    financial_year = financial_year_for(payroll.month, payroll.year)
+    in_year = (
+        Q(payroll__year=financial_year, payroll__month__gte=start_month)
+        | Q(payroll__year=financial_year + 1, payroll__month__lt=start_month)
+    )
+    through = Q(payroll__year__lt=payroll.year) | Q(payroll__year=payroll.year, payroll__month__lte=payroll.month)
+    return Payslip.objects.filter(
+        in_year, through, employee_id=payslip.employee_id, payroll__status__in=COUNTED_STATUSES
+    ).order_by()
+
+
+def _non_taxable_allowances(payslips):
+    return PayslipAllowance.objects.filter(payslip__in=payslips, allowance_type__is_taxable=False)
+
+
+PAYSLIP_TOTALS = {
+    'gross': Sum('gross_salary'),
+    'deductions': Sum('total_deductions'),
+    'net': Sum('net_salary'),
+}
+
+
+def _balances(totals, non_taxable):
+    gross = totals['gross'] or 0
+    return {
+        YTDBalance.GROSS: gross,
+        YTDBalance.TAXABLE: gross - (non_taxable or 0),
+        YTDBalance.TOTAL_DEDUCTIONS: totals['deductions'] or 0,
+        YTDBalance.NET: totals['net'] or 0,
+    }
+
+
+def get_ytd_as_of(payslip):
+    """
+    {component: amount} for the payslip's financial year up to and including
+    its period, as printed on that payslip. Two aggregates over at most a
+    year of the employee's payslips; per-deduction components are left out.
+    """
+    payslips = _payslips_through(payslip)
+    return _balances(
+        payslips.aggregate(**PAYSLIP_TOTALS),
+        _non_taxable_allowances(payslips).aggregate(total=Sum('amount'))['total'],
+    )
+
+
+async def aget_ytd_as_of(payslip):
+    """Async get_ytd_as_of(), for the async self-service views"""
+    payslips = _payslips_through(payslip)
+    return _balances(
+        await payslips.aaggregate(**PAYSLIP_TOTALS),
+        (await _non_taxable_allowances(payslips).aaggregate(total=Sum('amount')))['total'],
+    )
+
+
+def rebuild_financial_year(financial_year):
+    """Recomputes a financial year's ledger from its approved and paid payrolls"""
+    payrolls = [
+        payroll for payroll in Payroll.objects.filter(
+            year__in=[financial_year, financial_year + 1], status__in=COUNTED_STATUSES
+        )
+        if financial_year_for(payroll.month, payroll.year) == financial_year
+    ]
+    with transaction.atomic():
+        YTDBalance.objects.filter(financial_year=financial_year).delete()
+        for payroll in payrolls:
+            apply_payroll(payroll)
+    return payrolls
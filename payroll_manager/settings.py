@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.PrimaryPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -59,14 +61,21 @@ ROOT_URLCONF = 'payroll_manager.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [BASE_DIR / 'templates']
-        ,
-        'APP_DIRS': True,
+        'DIRS': [BASE_DIR / 'templates'],
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.current_user',
+            ],
+            # Templates are parsed once per process. Under runserver the autoreloader
+            # resets this cache (and core's nav fragments) whenever a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -85,6 +94,23 @@ DATABASES = {
     }
 }
 
+# Optional read replica for reports and employee self-service pages.
+# Set PAYROLL_REPLICA_DB to a second SQLite file (or swap in your replica's
+# connection settings); without it every query stays on 'default'.
+REPLICA_DATABASE_ALIAS = 'replica'
+
+if os.environ.get('PAYROLL_REPLICA_DB'):
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['PAYROLL_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Seconds a user stays on the primary after a write (read-your-writes)
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -126,6 +152,18 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# collectstatic fingerprints every file and writes gzip (and brotli, if installed) copies (core.storage)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.storage.PrecompressedManifestStaticFilesStorage'},
+}
+
+# Serve STATIC_ROOT from Django with precompressed variants and far-future caching (core.static).
+# Turn off when a web server in front serves STATIC_ROOT itself.
+SERVE_STATIC_FILES = True
+
 
 
 # Default primary key field type
@@ -134,3 +172,93 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.CustomUser'
+
+# Route the employee dashboard and payslip pages to their async views (employees.async_views).
+# Worth it when served by an ASGI server such as uvicorn; under WSGI each async view gets its own event loop.
+SELF_SERVICE_ASYNC_VIEWS = os.environ.get('PAYROLL_ASYNC_VIEWS', '') == '1'
+
+# Sessions are read from the cache and written through to the database, and the
+# logged-in user is cached for USER_CACHE_SECONDS (see users.backends), so an
+# authenticated request costs no queries before the view's own. LocMemCache is
+# per process; point the default cache at Redis or Memcached when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered layout fragments (the sidebar nav, per role and active page). They only
+    # change with the templates, so they stay in process memory and go with a deploy.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+    },
+}
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+USER_CACHE_SECONDS = 60
+
+# The stock backend stays listed so sessions created before the cached one keep working
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Payroll
+
+# Day basis for prorating joiners and mid-month config changes:
+# 'CALENDAR' (all days in the month) or 'WORKING' (Monday to Friday)
+PAYROLL_PRORATION_BASIS = 'CALENDAR'
+
+# First month of the financial year used for YTD figures (4 = April)
+PAYROLL_FINANCIAL_YEAR_START_MONTH = 4
+
+# DeductionType name the tax engine posts computed TDS under
+PAYROLL_TDS_DEDUCTION_TYPE = 'TDS'
+
+# AllowanceType name used for back pay from retroactive revisions
+PAYROLL_ARREARS_ALLOWANCE_TYPE = 'Arrears'
+
+# Statutory returns (see payroll.statutory): the DeductionType names holding each
+# employee's PF and ESI share, the rates (percent) and the wage ceilings. A PF deduction
+# above the employee rate on capped wages is reported on the full basic as EPF wages;
+# ESI covers only employees whose gross is at most PAYROLL_ESI_WAGE_CEILING.
+PAYROLL_PF_DEDUCTION_TYPE = 'PF'
+PAYROLL_ESI_DEDUCTION_TYPE = 'ESI'
+PAYROLL_PF_WAGE_CEILING = 15000
+PAYROLL_PF_EMPLOYEE_RATE = '12'
+PAYROLL_PF_EMPLOYER_RATE = '12'
+PAYROLL_PF_EPS_RATE = '8.33'
+PAYROLL_ESI_EMPLOYER_RATE = '3.25'
+PAYROLL_ESI_WAGE_CEILING = 21000
+
+# Return file formats by name: dotted paths to payroll.statutory.ReturnWriter subclasses
+PAYROLL_STATUTORY_WRITERS = {
+    'pf-ecr': 'payroll.statutory.ECRWriter',
+    'esi-csv': 'payroll.statutory.ESICSVWriter',
+}
+
+# Seconds the what-if simulator (reports.simulation) reuses a loaded workforce
+PAYROLL_SIMULATION_CACHE_SECONDS = 300
+
+# Salary distribution sketches (payroll.sketches): relative accuracy of reported
+# percentiles (rebuild with `manage.py build_salary_sketches` after changing it)
+# and the lower edges of the salary bands in the histograms
+PAYROLL_SKETCH_ACCURACY = 0.01
+PAYROLL_SALARY_BANDS = [0, 25000, 50000, 100000, 200000]
+
+# Capture cProfile/tracemalloc for every run (slow; `manage.py run_payroll --profile` does it for one run)
+PAYROLL_PROFILE_RUNS = False
+
+# Payslip emails (see payroll.distribution); the backend overrides EMAIL_BACKEND
+# for payslips only, e.g. 'django.core.mail.backends.locmem.EmailBackend' for testing.
+# The sender defaults to DEFAULT_FROM_EMAIL.
+PAYROLL_EMAIL_BACKEND = None
+PAYROLL_EMAIL_FROM = None
+
+# Messages per worker batch, all sent over one connection
+PAYROLL_EMAIL_BATCH_SIZE = 200
+
+# Sends per minute per worker (0 for unlimited)
+PAYROLL_EMAIL_RATE_PER_MINUTE = 3000
+
+# Attempts before a delivery is marked failed, and seconds before the first retry (doubled each time)
+PAYROLL_EMAIL_MAX_ATTEMPTS = 5
+PAYROLL_EMAIL_RETRY_BACKOFF = 60
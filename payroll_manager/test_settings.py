@@ -0,0 +1,18 @@
+"""
+Settings for the test suite (``manage.py test`` selects them).
+
+Adds a second database, 'test_replica', for core.tests.ReplicaRoutingTests.
+It is a separate database rather than a mirror of 'default', so each holds
+different rows and a read shows which one served it. The test runner
+creates and migrates it alongside the primary.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    **DATABASES,
+    'test_replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+    },
+}
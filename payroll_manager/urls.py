@@ -14,8 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from core.static import serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,3 +29,8 @@ urlpatterns = [
     path('payroll/', include('payroll.urls')),
     path('reports/', include('reports.urls')),
 ]
+
+if settings.SERVE_STATIC_FILES:
+    urlpatterns += [
+        re_path(rf'^{re.escape(settings.STATIC_URL.lstrip("/"))}(?P<path>.+)$', serve_static),
+    ]
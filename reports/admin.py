@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Scenario
+
+
+@admin.register(Scenario)
+class ScenarioAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created_by', 'updated_at')
+    search_fields = ('name', 'description')
+    readonly_fields = ('created_by', 'created_at', 'updated_at')
@@ -0,0 +1,111 @@
+from django import forms
+
+from employees.models import Department, JobRole
+from payroll.models import AllowanceType
+from .models import Scenario
+from .simulation import ALLOWANCE_CHANGE, ALLOWANCE_RATE, KIND_CHOICES, SALARY
+
+
+class ScenarioForm(forms.ModelForm):
+    """Name and description of a what-if scenario; its adjustments come from AdjustmentFormSet"""
+
+    class Meta:
+        model = Scenario
+        fields = ['name', 'description']
+        widgets = {
+            'name': forms.TextInput(attrs={
+                'class': 'input input-bordered w-full',
+                'placeholder': 'e.g., Engineering +8%, HRA 45%'
+            }),
+            'description': forms.Textarea(attrs={
+                'class': 'textarea textarea-bordered w-full',
+                'rows': 2,
+                'placeholder': 'Optional notes'
+            }),
+        }
+
+
+class AdjustmentForm(forms.Form):
+    """One scenario adjustment; department, role and salary band narrow who it applies to"""
+    # Blank by default so untouched extra rows are skipped
+    kind = forms.ChoiceField(
+        choices=[('', 'Adjustment'), *KIND_CHOICES],
+        widget=forms.Select(attrs={'class': 'select select-bordered select-sm w-full'})
+    )
+    value = forms.DecimalField(
+        max_digits=7,
+        decimal_places=2,
+        min_value=-100,
+        widget=forms.NumberInput(attrs={'class': 'input input-bordered input-sm w-full', 'placeholder': '%', 'step': '0.01'})
+    )
+    allowance_type = forms.ModelChoiceField(
+        queryset=AllowanceType.objects.filter(is_active=True),
+        required=False,
+        empty_label='Allowance',
+        widget=forms.Select(attrs={'class': 'select select-bordered select-sm w-full'})
+    )
+    department = forms.ModelChoiceField(
+        queryset=Department.objects.all(),
+        required=False,
+        empty_label='All departments',
+        widget=forms.Select(attrs={'class': 'select select-bordered select-sm w-full'})
+    )
+    job_role = forms.ModelChoiceField(
+        queryset=JobRole.objects.all(),
+        required=False,
+        empty_label='All roles',
+        widget=forms.Select(attrs={'class': 'select select-bordered select-sm w-full'})
+    )
+    min_salary = forms.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        min_value=0,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'input input-bordered input-sm w-full', 'placeholder': 'Min salary'})
+    )
+    max_salary = forms.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        min_value=0,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'input input-bordered input-sm w-full', 'placeholder': 'Max salary'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('kind') in (ALLOWANCE_RATE, ALLOWANCE_CHANGE) and not cleaned_data.get('allowance_type'):
+            raise forms.ValidationError('Choose the allowance this adjustment changes.')
+        low, high = cleaned_data.get('min_salary'), cleaned_data.get('max_salary')
+        if low is not None and high is not None and low > high:
+            raise forms.ValidationError('The minimum salary is above the maximum.')
+        return cleaned_data
+
+    def adjustment(self):
+        """The cleaned adjustment in the JSON form stored on Scenario.adjustments"""
+        data = self.cleaned_data
+        adjustment = {'kind': data['kind'], 'value': str(data['value'])}
+        if data['kind'] != SALARY:
+            adjustment['allowance_type'] = data['allowance_type'].id
+        for field in ('department', 'job_role'):
+            if data.get(field):
+                adjustment[field] = data[field].id
+        for field in ('min_salary', 'max_salary'):
+            if data.get(field) is not None:
+                adjustment[field] = str(data[field])
+        return adjustment
+
+    @classmethod
+    def initial_for(cls, adjustment):
+        """Form initial data for a stored adjustment"""
+        return {
+            'kind': adjustment['kind'],
+            'value': adjustment['value'],
+            'allowance_type': adjustment.get('allowance_type'),
+            'department': adjustment.get('department'),
+            'job_role': adjustment.get('job_role'),
+            'min_salary': adjustment.get('min_salary'),
+            'max_salary': adjustment.get('max_salary'),
+        }
+
+
+AdjustmentFormSet = forms.formset_factory(AdjustmentForm, extra=3)
@@ -0,0 +1,240 @@
+"""
+What-if payroll cost simulation.
+
+``Workforce.load()`` reads the current workforce once, three queries in
+all: employees with today's salaries (from the salary history), their
+allowance configs, and who pays PF or ESI. It keeps
+them as flat columns indexed by position, with the positions grouped by
+department and job role. ``simulate()`` applies a scenario's adjustments
+to copies of those columns and totals cost per department, so trying or
+comparing scenarios costs milliseconds and never touches payroll tables.
+``Workforce.current()`` keeps a loaded workforce in the cache for
+PAYROLL_SIMULATION_CACHE_SECONDS.
+
+Monthly cost is what the employer pays for a full month. That is base
+salary plus allowances, plus the employer's PF and ESI contributions for
+employees with those deductions, at the rates and wage ceilings in
+payroll.statutory (a raise past the ESI ceiling ends its cost). Annual
+cost is twelve such months; proration, arrears and dated config changes
+are left out.
+
+An adjustment is a dict saved on ``Scenario.adjustments``. ``kind`` and
+``value`` say what changes:
+
+* ``salary``: raise base salaries by ``value`` percent.
+* ``allowance_rate``: pay ``allowance_type`` at ``value`` percent of base
+  to the employees who have it.
+* ``allowance_change``: raise ``allowance_type`` by ``value`` percent.
+
+Any of ``department``, ``job_role``, ``min_salary`` and ``max_salary``
+narrow who it applies to. Salary bands are matched against current
+salaries. Adjustments apply in order.
+"""
+from array import array
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from employees.models import Department, Employee, JobRole
+from payroll.models import AllowanceType, EmployeeAllowanceConfig, EmployeeDeductionConfig
+
+SALARY = 'salary'
+ALLOWANCE_RATE = 'allowance_rate'
+ALLOWANCE_CHANGE = 'allowance_change'
+
+KIND_CHOICES = [
+    (SALARY, 'Raise salaries by %'),
+    (ALLOWANCE_RATE, 'Set allowance to % of base'),
+    (ALLOWANCE_CHANGE, 'Raise allowance by %'),
+]
+
+NO_DEPARTMENT = 'No Department'
+
+CACHE_KEY = 'reports:simulation:workforce'
+
+
+class CostLine(NamedTuple):
+    department_id: Optional[int]
+    department: str
+    employees: int
+    base: float
+    allowances: float
+    employer_contributions: float
+    monthly: float
+    annual: float
+
+
+class Workforce:
+    """Current employees as flat columns; see the module docstring"""
+
+    def __init__(self):
+        self.base = array('d')
+        self.by_department = {}
+        self.by_job_role = {}
+        # {allowance_type_id: (positions, fixed amounts, percentages of base)}
+        self.allowances = {}
+        self.pf = array('l')
+        self.esi = array('l')
+        # Labels for results and descriptions, loaded alongside
+        self.department_names = {}
+        self.allowance_names = {}
+        self.job_role_names = {}
+
+    def __len__(self):
+        return len(self.base)
+
+    @classmethod
+    def load(cls):
+        today = timezone.localdate()
+        workforce = cls()
+        positions = {}
+        for employee_id, salary, job_role_id, department_id in Employee.objects.with_current_salary().filter(
+            date_of_joining__lte=today
+        ).values_list('id', 'current_salary', 'job_role_id', 'job_role__department_id').order_by('id').iterator():
+            position = len(workforce.base)
+            positions[employee_id] = position
+            workforce.base.append(float(salary))
+            workforce.by_department.setdefault(department_id, []).append(position)
+            workforce.by_job_role.setdefault(job_role_id, []).append(position)
+
+        effective = (
+            (Q(effective_from__isnull=True) | Q(effective_from__lte=today))
+            & (Q(effective_to__isnull=True) | Q(effective_to__gte=today))
+        )
+        for employee_id, allowance_type_id, amount, percentage in EmployeeAllowanceConfig.objects.filter(
+            effective, is_active=True
+        ).values_list('employee_id', 'allowance_type_id', 'amount', 'percentage').order_by().iterator():
+            if employee_id not in positions:
+                continue
+            column = workforce.allowances.setdefault(allowance_type_id, (array('l'), array('d'), array('d')))
+            column[0].append(positions[employee_id])
+            # The engine uses the percentage whenever one is set
+            column[1].append(0.0 if percentage else float(amount or 0))
+            column[2].append(float(percentage or 0))
+
+        scheme_columns = {
+            getattr(settings, 'PAYROLL_PF_DEDUCTION_TYPE', 'PF'): workforce.pf,
+            getattr(settings, 'PAYROLL_ESI_DEDUCTION_TYPE', 'ESI'): workforce.esi,
+        }
+        for employee_id, type_name in EmployeeDeductionConfig.objects.filter(
+            effective, is_active=True, deduction_type__name__in=list(scheme_columns)
+        ).values_list('employee_id', 'deduction_type__name').order_by().iterator():
+            if employee_id in positions:
+                scheme_columns[type_name].append(positions[employee_id])
+
+        workforce.department_names = dict(Department.objects.values_list('id', 'name'))
+        workforce.allowance_names = dict(AllowanceType.objects.values_list('id', 'name'))
+        workforce.job_role_names = dict(JobRole.objects.values_list('id', 'title'))
+        return workforce
+
+    @classmethod
+    def current(cls):
+        """The cached workforce, loaded when missing or expired"""
+        workforce = cache.get(CACHE_KEY)
+        if workforce is None:
+            workforce = cls.load()
+            cache.set(CACHE_KEY, workforce, getattr(settings, 'PAYROLL_SIMULATION_CACHE_SECONDS', 300))
+        return workforce
+
+    def matching(self, adjustment):
+        """Positions of the employees an adjustment applies to"""
+        if adjustment.get('department'):
+            positions = self.by_department.get(adjustment['department'], [])
+        else:
+            positions = range(len(self))
+        if adjustment.get('job_role'):
+            in_role = set(self.by_job_role.get(adjustment['job_role'], []))
+            positions = [position for position in positions if position in in_role]
+        low, high = adjustment.get('min_salary'), adjustment.get('max_salary')
+        if low or high:
+            low = float(low) if low else float('-inf')
+            high = float(high) if high else float('inf')
+            positions = [position for position in positions if low <= self.base[position] <= high]
+        return positions
+
+
+def simulate(workforce, adjustments=()):
+    """Returns ([CostLine per department], total CostLine) with the adjustments applied"""
+    base = array('d', workforce.base)
+    allowance_rules = {}
+    for adjustment in adjustments:
+        if adjustment['kind'] == SALARY:
+            factor = 1 + float(adjustment['value']) / 100
+            for position in workforce.matching(adjustment):
+                base[position] *= factor
+        else:
+            allowance_rules.setdefault(adjustment['allowance_type'], []).append(
+                (adjustment['kind'], float(adjustment['value']), set(workforce.matching(adjustment)))
+            )
+
+    allowances = array('d', [0.0]) * len(base)
+    for allowance_type_id, (positions, amounts, percentages) in workforce.allowances.items():
+        rules = allowance_rules.get(allowance_type_id)
+        if not rules:
+            for position, amount, percentage in zip(positions, amounts, percentages):
+                allowances[position] += base[position] * percentage / 100 if percentage else amount
+            continue
+        for position, amount, percentage in zip(positions, amounts, percentages):
+            value = base[position] * percentage / 100 if percentage else amount
+            for kind, rule_value, scope in rules:
+                if position in scope:
+                    value = base[position] * rule_value / 100 if kind == ALLOWANCE_RATE else value * (1 + rule_value / 100)
+            allowances[position] += value
+
+    employer = array('d', [0.0]) * len(base)
+    ceiling = float(getattr(settings, 'PAYROLL_PF_WAGE_CEILING', 15000))
+    pf_rate = float(getattr(settings, 'PAYROLL_PF_EMPLOYER_RATE', '12')) / 100
+    esi_rate = float(getattr(settings, 'PAYROLL_ESI_EMPLOYER_RATE', '3.25')) / 100
+    esi_ceiling = float(getattr(settings, 'PAYROLL_ESI_WAGE_CEILING', 21000))
+    for position in workforce.pf:
+        employer[position] += min(base[position], ceiling) * pf_rate
+    for position in workforce.esi:
+        # Above the ceiling the employee leaves ESI, as in payroll.statutory
+        gross = base[position] + allowances[position]
+        if gross <= esi_ceiling:
+            employer[position] += gross * esi_rate
+
+    lines = []
+    for department_id, positions in workforce.by_department.items():
+        department_base = sum(base[position] for position in positions)
+        department_allowances = sum(allowances[position] for position in positions)
+        department_employer = sum(employer[position] for position in positions)
+        lines.append(_cost_line(
+            department_id, workforce.department_names.get(department_id, NO_DEPARTMENT),
+            len(positions), department_base, department_allowances, department_employer,
+        ))
+    lines.sort(key=lambda line: line.department)
+    total = _cost_line(
+        None, 'Total', len(base), sum(line.base for line in lines),
+        sum(line.allowances for line in lines), sum(line.employer_contributions for line in lines),
+    )
+    return lines, total
+
+
+def _cost_line(department_id, name, employees, base, allowances, employer):
+    monthly = base + allowances + employer
+    return CostLine(
+        department_id, name, employees, round(base, 2), round(allowances, 2), round(employer, 2),
+        round(monthly, 2), round(monthly * 12, 2),
+    )
+
+
+def describe(adjustment, workforce):
+    """One-line summary of an adjustment, for listing a scenario"""
+    value = adjustment['value']
+    if adjustment['kind'] == SALARY:
+        text = f"Salaries +{value}%"
+    else:
+        name = workforce.allowance_names.get(adjustment['allowance_type'], 'allowance')
+        text = f"{name} at {value}% of base" if adjustment['kind'] == ALLOWANCE_RATE else f"{name} +{value}%"
+    scope = []
+    if adjustment.get('department'):
+        scope.append(workforce.department_names.get(adjustment['department'], NO_DEPARTMENT))
+    if adjustment.get('job_role'):
+        scope.append(workforce.job_role_names.get(adjustment['job_role'], 'No Role'))
+    if adjustment.get('min_salary') or adjustment.get('max_salary'):
+        scope.append(f"salary {adjustment.get('min_salary') or 0}-{adjustment.get('max_salary') or 'any'}")
+    return f"{text} ({', '.join(scope)})" if scope else text
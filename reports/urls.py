@@ -3,5 +3,7 @@ from reports import views
 
 urlpatterns = [
     path('', views.reports_dashboard, name='reports_dashboard'),
+    path('simulator/', views.simulator, name='simulator'),
+    path('simulator/<int:scenario_id>/delete/', views.delete_scenario, name='delete_scenario'),
 ]
 
@@ -1,15 +1,25 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Avg
-from employees.models import Employee
-from payroll.models import Payslip, Payroll, PayslipAllowance, PayslipDeduction
+from django.db.models import Sum, Count, Avg, Q
+from django.urls import reverse
+from django.utils import timezone
+from core.routers import use_replica
+from employees.models import Department, Employee, JobRole, PayGroup, salary_as_of
+from payroll.models import Payslip, Payroll, PayslipAllowance, PayslipDeduction, SalarySketch, YTDBalance
+from payroll.sketches import accuracy, bands, distribution
+from payroll.ytd import current_financial_year
+from .forms import AdjustmentForm, AdjustmentFormSet, ScenarioForm
+from .models import Scenario
+from .simulation import Workforce, describe, simulate
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
+import time
 
 
 @login_required
+@use_replica
 def reports_dashboard(request):
     """Reports dashboard with charts and visualizations - only HR and Admin can access"""
     user = request.user
@@ -23,44 +33,87 @@ def reports_dashboard(request):
     end_date = datetime.now()
     start_date = end_date - timedelta(days=365)
     
-    # 1. Payroll Trends Over Time (Monthly)
-    payrolls = Payroll.objects.filter(
+    # Entity/pay group scope: ?pay_group=<id> or 'default'; without it figures
+    # are aggregated across all groups
+    pay_groups = PayGroup.objects.all()
+    pay_group_id = request.GET.get('pay_group', '')
+    employees = Employee.objects.all()
+    all_payrolls = Payroll.objects.all()
+    if pay_group_id == 'default':
+        employees = employees.filter(pay_group__isnull=True)
+        all_payrolls = all_payrolls.filter(pay_group__isnull=True)
+    elif pay_group_id.isdigit():
+        employees = employees.filter(pay_group_id=pay_group_id)
+        all_payrolls = all_payrolls.filter(pay_group_id=pay_group_id)
+    
+    # 1. Payroll Trends Over Time (Monthly), summed over the groups in scope
+    payrolls = all_payrolls.filter(
         processed_date__gte=start_date
+    ).values('year', 'month').annotate(
+        gross=Sum('total_gross_salary'),
+        deductions=Sum('total_deductions'),
+        net=Sum('total_net_salary'),
+        employees=Sum('employee_count'),
     ).order_by('year', 'month')
     
     monthly_payroll_data = []
     monthly_labels = []
     for payroll in payrolls:
-        month_name = datetime(payroll.year, payroll.month, 1).strftime('%b %Y')
+        month_name = datetime(payroll['year'], payroll['month'], 1).strftime('%b %Y')
         monthly_labels.append(month_name)
         monthly_payroll_data.append({
-            'gross_salary': float(payroll.total_gross_salary),
-            'deductions': float(payroll.total_deductions),
-            'net_salary': float(payroll.total_net_salary),
-            'employee_count': payroll.employee_count,
+            'gross_salary': float(payroll['gross']),
+            'deductions': float(payroll['deductions']),
+            'net_salary': float(payroll['net']),
+            'employee_count': payroll['employees'],
         })
     
+    # Per-group totals for the same window, always across every group
+    entity_totals = Payroll.objects.filter(
+        processed_date__gte=start_date
+    ).values('pay_group__code', 'pay_group__name').annotate(
+        runs=Count('id'),
+        gross=Sum('total_gross_salary'),
+        net=Sum('total_net_salary'),
+    ).order_by('pay_group__code')
+    
+    # Department rollups group by the integer key; names come from one lookup
+    department_names = dict(Department.objects.values_list('id', 'name'))
+    
     # 2. Department-wise Employee Distribution
-    dept_data = Employee.objects.values('job_role__department').annotate(
+    dept_data = employees.values('job_role__department_id').annotate(
         count=Count('id')
     ).order_by('-count')
     
-    dept_labels = [item['job_role__department'] or 'No Department' for item in dept_data]
+    dept_labels = [department_names.get(item['job_role__department_id'], 'No Department') for item in dept_data]
     dept_counts = [item['count'] for item in dept_data]
     
+    # Salaries come from the salary history: today's, or as of ?salary_as_of=YYYY-MM-DD
+    salary_date = None
+    salaried = employees.annotate(salary=salary_as_of(timezone.localdate()))
+    if request.GET.get('salary_as_of'):
+        try:
+            salary_date = datetime.strptime(request.GET['salary_as_of'], '%Y-%m-%d').date()
+        except ValueError:
+            messages.error(request, 'Invalid salary date; showing current salaries.')
+        else:
+            salaried = employees.filter(date_of_joining__lte=salary_date).annotate(
+                salary=salary_as_of(salary_date)
+            )
+    
     # 3. Salary Distribution by Department
-    salary_by_dept = Employee.objects.values('job_role__department').annotate(
-        avg_salary=Avg('salary_base'),
+    salary_by_dept = salaried.values('job_role__department_id').annotate(
+        avg_salary=Avg('salary'),
         total_employees=Count('id')
     ).order_by('-avg_salary')
     
-    salary_dept_labels = [item['job_role__department'] or 'No Department' for item in salary_by_dept]
+    salary_dept_labels = [department_names.get(item['job_role__department_id'], 'No Department') for item in salary_by_dept]
     salary_dept_avg = [float(item['avg_salary']) for item in salary_by_dept]
     
     # 4. Top Allowance Types (from recent payslips)
     recent_payslips = Payslip.objects.filter(
-        payroll__processed_date__gte=start_date
-    ).select_related('payroll')
+        payroll__in=all_payrolls.filter(processed_date__gte=start_date)
+    )
     
     allowance_totals = PayslipAllowance.objects.filter(
         payslip__in=recent_payslips
@@ -82,7 +135,7 @@ def reports_dashboard(request):
     deduction_amounts = [float(item['total_amount']) for item in deduction_totals]
     
     # 6. Job Role Distribution
-    job_role_data = Employee.objects.values('job_role__title').annotate(
+    job_role_data = employees.values('job_role__title').annotate(
         count=Count('id')
     ).order_by('-count')[:10]
     
@@ -90,43 +143,99 @@ def reports_dashboard(request):
     job_role_counts = [item['count'] for item in job_role_data]
     
     # 7. Overall Statistics
-    total_employees = Employee.objects.count()
-    total_payrolls = Payroll.objects.count()
-    total_payslips = Payslip.objects.count()
+    total_employees = employees.count()
+    total_payslips = Payslip.objects.filter(payroll__in=all_payrolls).count()
     
     # Calculate total payroll amounts
-    total_gross = Payroll.objects.aggregate(Sum('total_gross_salary'))['total_gross_salary__sum'] or Decimal('0.00')
-    total_deductions = Payroll.objects.aggregate(Sum('total_deductions'))['total_deductions__sum'] or Decimal('0.00')
-    total_net = Payroll.objects.aggregate(Sum('total_net_salary'))['total_net_salary__sum'] or Decimal('0.00')
+    payroll_totals = all_payrolls.aggregate(
+        count=Count('id'),
+        gross=Sum('total_gross_salary'),
+        deductions=Sum('total_deductions'),
+        net=Sum('total_net_salary'),
+    )
+    total_payrolls = payroll_totals['count']
+    total_gross = payroll_totals['gross'] or Decimal('0.00')
+    total_deductions = payroll_totals['deductions'] or Decimal('0.00')
+    total_net = payroll_totals['net'] or Decimal('0.00')
     
     # Average salary
-    avg_salary = Employee.objects.aggregate(Avg('salary_base'))['salary_base__avg'] or Decimal('0.00')
+    avg_salary = salaried.aggregate(avg=Avg('salary'))['avg'] or Decimal('0.00')
+    
+    # Year-to-date totals for the current financial year, straight from the YTD ledger
+    financial_year = current_financial_year()
+    ytd_totals = dict(YTDBalance.objects.filter(
+        employee__in=employees,
+        financial_year=financial_year,
+        component__in=[YTDBalance.GROSS, YTDBalance.TAXABLE, YTDBalance.TOTAL_DEDUCTIONS, YTDBalance.NET]
+    ).values('component').annotate(total=Sum('amount')).values_list('component', 'total'))
     
     # 8. Recent Payroll Activity (Last 6 months)
     recent_months = []
     recent_gross = []
     recent_net = []
     
-    for i in range(6, 0, -1):
-        month_date = end_date - timedelta(days=30 * i)
-        month_payrolls = Payroll.objects.filter(
-            year=month_date.year,
-            month=month_date.month
+    month_dates = [end_date - timedelta(days=30 * i) for i in range(6, 0, -1)]
+    recent_totals = {
+        (row['year'], row['month']): row
+        for row in all_payrolls.filter(
+            year__in={d.year for d in month_dates}
+        ).values('year', 'month').annotate(
+            gross=Sum('total_gross_salary'),
+            net=Sum('total_net_salary'),
         )
-        if month_payrolls.exists():
-            payroll = month_payrolls.first()
+    }
+    
+    for month_date in month_dates:
+        totals = recent_totals.get((month_date.year, month_date.month))
+        if totals:
             recent_months.append(month_date.strftime('%b %Y'))
-            recent_gross.append(float(payroll.total_gross_salary))
-            recent_net.append(float(payroll.total_net_salary))
+            recent_gross.append(float(totals['gross']))
+            recent_net.append(float(totals['net']))
         else:
             recent_months.append(month_date.strftime('%b %Y'))
             recent_gross.append(0)
             recent_net.append(0)
     
+    # 9. Salary distribution: percentiles and bands merged from the stored
+    # per-run sketches, never from payslip rows
+    dist_by = request.GET.get('dist_by', 'department')
+    if dist_by not in ('department', 'job_role', 'period'):
+        dist_by = 'department'
+    dist_metric = request.GET.get('dist_metric', SalarySketch.GROSS)
+    if dist_metric not in dict(SalarySketch.METRIC_CHOICES):
+        dist_metric = SalarySketch.GROSS
+    dist_range = request.GET.get('dist_range', '12m')
+    if dist_range == 'all':
+        dist_payrolls = all_payrolls
+    else:
+        # The last 12 pay periods, this month included, whenever each run was processed
+        today = timezone.localdate()
+        first_year, first_month = divmod(today.year * 12 + today.month - 12, 12)
+        first_month += 1
+        dist_payrolls = all_payrolls.filter(
+            Q(year__gt=first_year) | Q(year=first_year, month__gte=first_month)
+        )
+    
+    job_role_titles = dict(JobRole.objects.values_list('id', 'title')) if dist_by == 'job_role' else {}
+    
+    def dist_label(key):
+        if dist_by == 'period':
+            return datetime(key[0], key[1], 1).strftime('%b %Y')
+        if dist_by == 'job_role':
+            return job_role_titles.get(key, 'No Role')
+        return department_names.get(key, 'No Department')
+    
+    salary_distribution = sorted(
+        ({**group, 'label': dist_label(group['key'])} for group in distribution(dist_payrolls, dist_metric, dist_by)),
+        key=lambda group: group['key'] if dist_by == 'period' else group['label']
+    )
+    band_edges = bands()
+    band_labels = [
+        f"{low:,}+" if index == len(band_edges) - 1 else f"{low:,}-{band_edges[index + 1]:,}"
+        for index, low in enumerate(band_edges)
+    ]
+    
     context = {
-        'user': user,
-        'name': user.first_name or user.username,
-        'is_hr_or_admin': True,
         'active_nav': 'reports',
         
         # Statistics
@@ -137,6 +246,15 @@ def reports_dashboard(request):
         'total_deductions': total_deductions,
         'total_net': total_net,
         'avg_salary': avg_salary,
+        'salary_as_of': salary_date,
+        'pay_groups': pay_groups,
+        'selected_pay_group': pay_group_id,
+        'entity_totals': entity_totals,
+        'ytd_financial_year': f"{financial_year}-{str(financial_year + 1)[-2:]}",
+        'ytd_gross': ytd_totals.get(YTDBalance.GROSS, 0),
+        'ytd_taxable': ytd_totals.get(YTDBalance.TAXABLE, 0),
+        'ytd_deductions': ytd_totals.get(YTDBalance.TOTAL_DEDUCTIONS, 0),
+        'ytd_net': ytd_totals.get(YTDBalance.NET, 0),
         
         # Chart Data (as JSON for JavaScript)
         'monthly_labels': json.dumps(monthly_labels),
@@ -157,9 +275,125 @@ def reports_dashboard(request):
         'job_role_labels': json.dumps(job_role_labels),
         'job_role_counts': json.dumps(job_role_counts),
         
+        'salary_distribution': salary_distribution,
+        'band_labels': band_labels,
+        'dist_by': dist_by,
+        'dist_metric': dist_metric,
+        'dist_range': dist_range,
+        'dist_accuracy': accuracy() * 100,
+        'dist_labels': json.dumps([group['label'] for group in salary_distribution]),
+        'dist_quantiles': json.dumps({
+            name: [round(group['quantiles'][q]) for group in salary_distribution]
+            for name, q in (('p10', 0.1), ('p50', 0.5), ('p90', 0.9))
+        }),
+        
         'recent_months': json.dumps(recent_months),
         'recent_gross': json.dumps(recent_gross),
         'recent_net': json.dumps(recent_net),
     }
     
     return render(request, 'reports/dashboard.html', context)
+
+
+def _comparison(workforce, columns):
+    """
+    Per-department rows for a side-by-side table: each column is (label,
+    adjustments), the first is the baseline and later ones carry their
+    difference from it
+    """
+    started = time.perf_counter()
+    results = [simulate(workforce, adjustments) for _, adjustments in columns]
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    baseline_lines, baseline_total = results[0]
+    rows = []
+    for index, baseline in enumerate(baseline_lines):
+        cells = [(lines[index], lines[index].monthly - baseline.monthly) for lines, _ in results]
+        rows.append({'department': baseline.department, 'employees': baseline.employees, 'cells': cells})
+    totals = [(total, total.monthly - baseline_total.monthly, total.annual - baseline_total.annual) for _, total in results]
+    return {
+        'labels': [label for label, _ in columns],
+        'rows': rows,
+        'totals': totals,
+        'elapsed_ms': elapsed_ms,
+    }
+
+
+@login_required
+def simulator(request):
+    """What-if cost simulator: build, save and compare scenarios - only HR and Admin can access"""
+    user = request.user
+    
+    # Check if user is HR or Admin
+    if not (user.is_hr() or user.is_admin()):
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('dashboard')
+    
+    scenarios = list(Scenario.objects.all())
+    compare_ids = {int(value) for value in request.GET.getlist('compare') if value.isdigit()}
+    editing = None
+    if request.GET.get('edit', '').isdigit():
+        editing = next((scenario for scenario in scenarios if scenario.id == int(request.GET['edit'])), None)
+    
+    workforce = Workforce.current()
+    preview = None
+    if request.method == 'POST':
+        if request.POST.get('scenario_id', '').isdigit():
+            editing = next((scenario for scenario in scenarios if scenario.id == int(request.POST['scenario_id'])), None)
+        form = ScenarioForm(request.POST, instance=editing)
+        formset = AdjustmentFormSet(request.POST)
+        if formset.is_valid():
+            adjustments = [adjustment_form.adjustment() for adjustment_form in formset if adjustment_form.has_changed()]
+            if request.POST.get('action') == 'save' and form.is_valid():
+                scenario = form.save(commit=False)
+                scenario.adjustments = adjustments
+                if scenario.created_by_id is None:
+                    scenario.created_by = user
+                scenario.save()
+                messages.success(request, f'Scenario "{scenario.name}" saved.')
+                return redirect(f"{reverse('simulator')}?compare={scenario.id}")
+            if request.POST.get('action') != 'save':
+                preview = (form.data.get('name') or 'Unsaved scenario', adjustments)
+    else:
+        form = ScenarioForm(instance=editing)
+        formset = AdjustmentFormSet(initial=[
+            AdjustmentForm.initial_for(adjustment) for adjustment in editing.adjustments
+        ] if editing else None)
+    
+    columns = [('Current', [])]
+    columns += [(scenario.name, scenario.adjustments) for scenario in scenarios if scenario.id in compare_ids]
+    if preview:
+        columns.append(preview)
+    
+    context = {
+        'active_nav': 'reports',
+        'form': form,
+        'formset': formset,
+        'editing': editing,
+        'scenarios': [
+            (scenario, [describe(adjustment, workforce) for adjustment in scenario.adjustments])
+            for scenario in scenarios
+        ],
+        'compare_ids': compare_ids,
+        'comparison': _comparison(workforce, columns),
+        'workforce_size': len(workforce),
+    }
+    
+    return render(request, 'reports/simulator.html', context)
+
+
+@login_required
+def delete_scenario(request, scenario_id):
+    """Delete a saved scenario - only HR and Admin can access"""
+    user = request.user
+    
+    # Check if user is HR or Admin
+    if not (user.is_hr() or user.is_admin()):
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('dashboard')
+    
+    scenario = get_object_or_404(Scenario, id=scenario_id)
+    if request.method == 'POST':
+        scenario.delete()
+        messages.success(request, f'Scenario "{scenario.name}" deleted.')
+    return redirect('simulator')
@@ -0,0 +1,13 @@
+// Build with `python manage.py build_tailwind`; the output, static/css/tailwind.css, is committed.
+/** @type {import('tailwindcss').Config} */
+module.exports = {
+  content: [
+    './templates/**/*.html',
+    // Widget classes set in forms and views
+    './*/*.py',
+  ],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
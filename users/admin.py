@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from core.paginator import EstimatedCountPaginator
 from users.models import CustomUser
 
 
@@ -13,6 +14,9 @@ class CustomUserAdmin(UserAdmin):
     """
     model = CustomUser
     list_display = ("username", "email", "role", "is_staff", "is_active")
+    list_filter = UserAdmin.list_filter + ("role",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = UserAdmin.fieldsets + (
         (None, {"fields" : ("role", "phone_number")}),
     )
@@ -0,0 +1,51 @@
+"""
+Authentication backend that caches the logged-in user.
+
+Django loads ``request.user`` with a query on every authenticated request.
+``CachedModelBackend`` keeps the user in the cache for ``USER_CACHE_SECONDS``
+instead, so with ``cached_db`` sessions a page view costs no queries before
+the view's own. ``CustomUser.save()`` and ``delete()`` drop the cached copy,
+which covers profile updates, password changes and role changes; the short
+TTL bounds anything that bypasses them (such as ``QuerySet.update()``).
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+USER_CACHE_PREFIX = 'auth_user:'
+
+
+def user_cache_key(user_id):
+    return f"{USER_CACHE_PREFIX}{user_id}"
+
+
+def forget_user(user_id):
+    """Drops a cached user now and again on commit, so a concurrent request can't re-cache the old row"""
+    key = user_cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() and aget_user() are served from the cache for a short TTL"""
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, getattr(settings, 'USER_CACHE_SECONDS', 60))
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is None:
+                return None
+            await cache.aset(key, user, getattr(settings, 'USER_CACHE_SECONDS', 60))
+        return user if self.user_can_authenticate(user) else None
@@ -24,6 +24,17 @@ class CustomUser(AbstractUser):
 
     objects = UserManager()
 
+    def save(self, *args, **kwargs):
+        from users.backends import forget_user
+        super().save(*args, **kwargs)
+        # Profile, password and role changes must not be served from the login cache
+        forget_user(self.pk)
+
+    def delete(self, *args, **kwargs):
+        from users.backends import forget_user
+        forget_user(self.pk)
+        return super().delete(*args, **kwargs)
+
     def is_admin(self):
         return self.role == Role.ADMIN
     def is_hr(self):